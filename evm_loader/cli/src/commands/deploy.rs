@@ -15,7 +15,9 @@ use solana_sdk::{
     commitment_config::{CommitmentConfig},
     instruction::{AccountMeta, Instruction},
     message::Message,
+    packet::PACKET_DATA_SIZE,
     pubkey::Pubkey,
+    signature::Signature,
     transaction::Transaction,
     signers::Signers,
     system_program,
@@ -61,8 +63,19 @@ use crate::{
     NeonCliResult,
 };
 
-
-const DATA_CHUNK_SIZE: usize = 229; // Keep program chunks under PACKET_DATA_SIZE
+/// Largest chunk for which a message built by `create_msg` still fits into `PACKET_DATA_SIZE`
+fn calculate_max_chunk_size<F>(create_msg: &F) -> usize
+where
+    F: Fn(u32, &[u8]) -> Message,
+{
+    let baseline_msg = create_msg(0, &[]);
+    let tx_size = bincode::serialized_size(&Transaction {
+        signatures: vec![Signature::default(); baseline_msg.header.num_required_signatures as usize],
+        message: baseline_msg,
+    }).unwrap();
+    // add 1 byte buffer to account for shortvec encoding of the instruction data length
+    PACKET_DATA_SIZE.saturating_sub(usize::try_from(tx_size).unwrap()).saturating_sub(1)
+}
 
 fn get_ethereum_contract_account_credentials(
     config: &Config,
@@ -147,10 +160,7 @@ fn fill_holder_account(
 
     // Write code to holder account
     debug!("Write code");
-    let mut write_messages = vec![];
-    for (chunk, i) in msg.chunks(DATA_CHUNK_SIZE).zip(0..) {
-        let offset = u32::try_from(i*DATA_CHUNK_SIZE).unwrap();
-
+    let create_msg = |offset: u32, chunk: &[u8]| {
         let write_holder_instruction = Instruction::new_with_bincode(
             config.evm_loader,
             /* &EvmInstruction::WriteHolder {holder_id, offset, bytes: chunk}, */
@@ -165,8 +175,15 @@ fn fill_holder_account(
             write_holder_instruction
         ];
 
-        let message = Message::new(&instructions, Some(&creator.pubkey()));
-        write_messages.push(message);
+        Message::new(&instructions, Some(&creator.pubkey()))
+    };
+    let chunk_size = calculate_max_chunk_size(&create_msg);
+    debug!("Write chunk size {}", chunk_size);
+
+    let mut write_messages = vec![];
+    for (chunk, i) in msg.chunks(chunk_size).zip(0..) {
+        let offset = u32::try_from(i*chunk_size).unwrap();
+        write_messages.push(create_msg(offset, chunk));
     }
     debug!("Send write message");
 
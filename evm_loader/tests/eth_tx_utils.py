@@ -1,159 +1,336 @@
 from sha3 import keccak_256
 import json
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, repeat
 from web3.auto import w3
 from eth_keys import keys
 import struct
 
+# Set CHECK_SIGNER=YES to verify the signer derived from a private key against public key recovery
+CHECK_SIGNER = os.environ.get("CHECK_SIGNER", "NO") == "YES"
 
-def unpack(data):
-    ch = data[0]
+
+def decode_prefix(data, pos=0):
+    """Returns (is_list, payload_offset, payload_length) of the RLP item at pos."""
+    ch = data[pos]
     if (ch <= 0x7F):
-        return (ch, data[1:])
-    elif (ch == 0x80):
-        return (None, data[1:])
+        return (False, pos, 1)
     elif (ch <= 0xB7):
-        l = ch - 0x80
-        return (data[1:1 + l].tobytes(), data[1 + l:])
+        return (False, pos + 1, ch - 0x80)
     elif (ch <= 0xBF):
         lLen = ch - 0xB7
-        l = int.from_bytes(data[1:1 + lLen], byteorder='big')
-        return (data[1 + lLen:1 + lLen + l].tobytes(), data[1 + lLen + l:])
-    elif (ch == 0xC0):
-        return ((), data[1:])
+        l = int.from_bytes(data[pos + 1:pos + 1 + lLen], byteorder='big')
+        return (False, pos + 1 + lLen, l)
     elif (ch <= 0xF7):
-        l = ch - 0xC0
-        lst = list()
-        sub = data[1:1 + l]
-        while len(sub):
-            (item, sub) = unpack(sub)
-            lst.append(item)
-        return (lst, data[1 + l:])
+        return (True, pos + 1, ch - 0xC0)
     else:
         lLen = ch - 0xF7
-        l = int.from_bytes(data[1:1 + lLen], byteorder='big')
-        lst = list()
-        sub = data[1 + lLen:1 + lLen + l]
-        while len(sub):
-            (item, sub) = unpack(sub)
-            lst.append(item)
-        return (lst, data[1 + lLen + l:])
+        l = int.from_bytes(data[pos + 1:pos + 1 + lLen], byteorder='big')
+        return (True, pos + 1 + lLen, l)
+
+
+def decode(data, pos=0):
+    """
+    Decodes the RLP item at pos without copying string payloads.
+    Strings are returned as memoryview slices of data, single bytes below 0x80 as int,
+    empty strings as None and empty lists as ().
+    Returns (item, end) where end is the offset right after the item.
+    """
+    (is_list, offset, length) = decode_prefix(data, pos)
+    end = offset + length
+    if end > len(data):
+        raise Exception("RLP item at {} exceeds data length {}".format(pos, len(data)))
+    if not is_list:
+        if offset == pos:
+            return (data[pos], end)
+        if length == 0:
+            return (None, end)
+        return (data[offset:end], end)
+    if length == 0:
+        return ((), end)
+    lst = list()
+    while offset < end:
+        (item, offset) = decode(data, offset)
+        lst.append(item)
+    if offset != end:
+        raise Exception("RLP list at {} is malformed".format(pos))
+    return (lst, end)
+
+
+def materialize(item):
+    if isinstance(item, memoryview):
+        return item.tobytes()
+    if isinstance(item, list):
+        return [materialize(i) for i in item]
+    return item
 
 
-def pack(data):
-    if data == None:
-        return (0x80).to_bytes(1, 'big')
+def unpack(data):
+    (item, end) = decode(data)
+    return (materialize(item), data[end:])
+
+
+def _header(l, short_base, long_base):
+    if l <= 55:
+        return bytes((short_base + l,))
+    lLen = (l.bit_length() + 7) // 8
+    return bytes((long_base + lLen,)) + l.to_bytes(lLen, 'big')
+
+
+def _encode(data, parts):
+    """
+    Appends the encoding of data to parts and returns its length.
+    Payloads are appended as is (never copied), list headers are reserved
+    up front and filled in once the payload length is known.
+    """
+    if data is None:
+        parts.append(b'\x80')
+        return 1
     if isinstance(data, str):
-        return pack(data.encode('utf8'))
-    elif isinstance(data, bytes):
-        if len(data) <= 55:
-            return (len(data) + 0x80).to_bytes(1, 'big') + data
-        else:
-            l = len(data)
-            lLen = (l.bit_length() + 7) // 8
-            return (0xB7 + lLen).to_bytes(1, 'big') + l.to_bytes(lLen, 'big') + data
+        return _encode(data.encode('utf8'), parts)
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        header = _header(len(data), 0x80, 0xB7)
+        parts.append(header)
+        parts.append(data)
+        return len(header) + len(data)
     elif isinstance(data, int):
         if data < 0x80:
-            return data.to_bytes(1, 'big')
-        else:
-            l = (data.bit_length() + 7) // 8
-            return (l + 0x80).to_bytes(1, 'big') + data.to_bytes(l, 'big')
-        pass
-    elif isinstance(data, list) or isinstance(data, tuple):
-        if len(data) == 0:
-            return (0xC0).to_bytes(1, 'big')
-        else:
-            res = bytearray()
-            for d in data:
-                res += pack(d)
-            l = len(res)
-            if l <= 55:
-                return (l + 0xC0).to_bytes(1, 'big') + res
-            else:
-                lLen = (l.bit_length() + 7) // 8
-                return (lLen + 0xF7).to_bytes(1, 'big') + l.to_bytes(lLen, 'big') + res
+            parts.append(bytes((data,)))
+            return 1
+        l = (data.bit_length() + 7) // 8
+        parts.append(bytes((0x80 + l,)) + data.to_bytes(l, 'big'))
+        return 1 + l
+    elif isinstance(data, (list, tuple)):
+        index = len(parts)
+        parts.append(None)
+        l = 0
+        for d in data:
+            l += _encode(d, parts)
+        parts[index] = _header(l, 0xC0, 0xF7)
+        return len(parts[index]) + l
     else:
         raise Exception("Unknown type {} of data".format(str(type(data))))
 
 
+def pack(data):
+    """
+    RLP-encodes data in a single pass over the items.
+    The total size is known once all headers are computed, so the result is
+    allocated and filled exactly once and nested payloads are never re-copied.
+    """
+    parts = list()
+    _encode(data, parts)
+    return b''.join(parts)
+
+
 def getInt(a):
     if isinstance(a, int): return a
-    if isinstance(a, bytes): return int.from_bytes(a, 'big')
+    if isinstance(a, (bytes, memoryview)): return int.from_bytes(a, 'big')
     if a == None: return a
     raise Exception("Invalid convertion from {} to int".format(a))
 
 
+def getBytes(a):
+    if isinstance(a, memoryview): return a.tobytes()
+    return a
+
+
+LEGACY_TRX_TYPE = 0
+ACCESS_LIST_TRX_TYPE = 1
+
+
+def decode_access_list(access_list):
+    """Converts a decoded RLP access list to [(address, [storage_key, ...]), ...]."""
+    result = list()
+    for item in access_list or ():
+        if not isinstance(item, list) or len(item) != 2:
+            raise Exception("Invalid access list item {}".format(item))
+        (address, storage_keys) = item
+        result.append((getBytes(address), [getBytes(key) for key in storage_keys or ()]))
+    return result
+
+
 class Trx:
-    def __init__(self):
-        self.nonce = None
-        self.gasPrice = None
-        self.gasLimit = None
-        self.toAddress = None
-        self.value = None
-        self.callData = None
-        self.v = None
-        self.r = None
-        self.s = None
+    """
+    Legacy or EIP-2930 (access list) Ethereum transaction.
+    The unsigned payload, its hash, the signature and the recovered public key are
+    computed on first use and cached; assigning any field drops the cached values.
+    """
+    __slots__ = ('nonce', 'gasPrice', 'gasLimit', 'toAddress', 'value', '_callData', 'v', 'r', 's',
+                 'trxType', 'access_list', '_chainId',
+                 '_msg', '_hash', '_sig', '_pub')
+    _cached = ('_msg', '_hash', '_sig', '_pub')
+
+    def __init__(self, nonce=None, gasPrice=None, gasLimit=None, toAddress=None, value=None, callData=None,
+                 v=None, r=None, s=None, trxType=LEGACY_TRX_TYPE, access_list=None, chainId=None):
+        set_field = object.__setattr__
+        set_field(self, 'trxType', trxType)
+        set_field(self, 'access_list', access_list)
+        set_field(self, '_chainId', chainId)
+        set_field(self, 'nonce', nonce)
+        set_field(self, 'gasPrice', gasPrice)
+        set_field(self, 'gasLimit', gasLimit)
+        set_field(self, 'toAddress', toAddress)
+        set_field(self, 'value', value)
+        set_field(self, '_callData', callData)
+        set_field(self, 'v', v)
+        set_field(self, 'r', r)
+        set_field(self, 's', s)
+        for name in Trx._cached:
+            set_field(self, name, None)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name not in Trx._cached:
+            for cached in Trx._cached:
+                object.__setattr__(self, cached, None)
+
+    @property
+    def callData(self):
+        # fromString keeps callData as a view into the source buffer until it is requested
+        if isinstance(self._callData, memoryview):
+            object.__setattr__(self, '_callData', self._callData.tobytes())
+        return self._callData
+
+    @callData.setter
+    def callData(self, value):
+        self._callData = value
+
+    @staticmethod
+    def _decode_fields(data, pos, count):
+        (is_list, offset, length) = decode_prefix(data, pos)
+        if not is_list:
+            raise Exception("Transaction is not an RLP list")
+
+        fields = list()
+        end = offset + length
+        while offset < end and len(fields) < count:
+            (item, offset) = decode(data, offset)
+            fields.append(item)
+        if len(fields) != count or offset != end:
+            raise Exception("Transaction must have {} fields".format(count))
+        return fields
 
     @classmethod
     def fromString(cls, s):
-        t = Trx()
-        (unpacked, data) = unpack(memoryview(s))
-        (nonce, gasPrice, gasLimit, toAddress, value, callData, v, r, s) = unpacked
-        t.nonce = getInt(nonce)
-        t.gasPrice = getInt(gasPrice)
-        t.gasLimit = getInt(gasLimit)
-        t.toAddress = toAddress
-        t.value = getInt(value)
-        t.callData = callData
-        t.v = getInt(v)
-        t.r = getInt(r)
-        t.s = getInt(s)
-        return t
+        data = s if isinstance(s, memoryview) else memoryview(s)
+        if data[0] <= 0x7F:
+            # EIP-2718 typed transaction envelope: type byte followed by the RLP payload
+            if data[0] != ACCESS_LIST_TRX_TYPE:
+                raise Exception("Unsupported transaction type {}".format(data[0]))
+            fields = cls._decode_fields(data, 1, 11)
+            (chainId, nonce, gasPrice, gasLimit, toAddress, value, callData, access_list, v, r, s) = fields
+            return cls(nonce=getInt(nonce),
+                       gasPrice=getInt(gasPrice),
+                       gasLimit=getInt(gasLimit),
+                       toAddress=getBytes(toAddress),
+                       value=getInt(value),
+                       callData=callData,
+                       v=getInt(v) or 0,
+                       r=getInt(r),
+                       s=getInt(s),
+                       trxType=ACCESS_LIST_TRX_TYPE,
+                       access_list=decode_access_list(access_list),
+                       chainId=getInt(chainId))
+
+        fields = cls._decode_fields(data, 0, 9)
+        (nonce, gasPrice, gasLimit, toAddress, value, callData, v, r, s) = fields
+        return cls(nonce=getInt(nonce),
+                   gasPrice=getInt(gasPrice),
+                   gasLimit=getInt(gasLimit),
+                   toAddress=getBytes(toAddress),
+                   value=getInt(value),
+                   callData=callData,
+                   v=getInt(v),
+                   r=getInt(r),
+                   s=getInt(s))
+
+    @classmethod
+    def from_many(cls, buffers):
+        """Decodes a sequence of raw transactions lazily, one Trx per buffer."""
+        for buffer in buffers:
+            if isinstance(buffer, str):
+                buffer = bytes.fromhex(buffer[2:] if buffer[:2] == "0x" else buffer)
+            yield cls.fromString(buffer)
 
     def chainId(self):
+        if self.trxType != LEGACY_TRX_TYPE:
+            return self._chainId
         # chainid*2 + 35  xxxxx0 + 100011   xxxx0 + 100010 +1
         # chainid*2 + 36  xxxxx0 + 100100   xxxx0 + 100011 +1
         return (self.v - 1) // 2 - 17
 
+    def _access_list_fields(self, chainId):
+        return [
+            chainId,
+            self.nonce,
+            self.gasPrice,
+            self.gasLimit,
+            self.toAddress,
+            self.value,
+            self._callData,
+            [[address, list(storage_keys)] for (address, storage_keys) in self.access_list or ()]]
+
     def __str__(self):
+        if self.trxType != LEGACY_TRX_TYPE:
+            fields = self._access_list_fields(self.chainId()) + [self.v or None, self.r, self.s]
+            return (bytes((self.trxType,)) + pack(fields)).hex()
         return pack((
             self.nonce,
             self.gasPrice,
             self.gasLimit,
             self.toAddress,
             self.value,
-            self.callData,
+            self._callData,
             self.v,
             self.r.to_bytes(32, 'big') if self.r else None,
             self.s.to_bytes(32, 'big') if self.s else None)
         ).hex()
 
     def get_msg(self, chainId=None):
-        return pack((
-            self.nonce,
-            self.gasPrice,
-            self.gasLimit,
-            self.toAddress,
-            self.value,
-            self.callData,
-            chainId or self.chainId(), None, None))
+        chainId = chainId or self.chainId()
+        if self._msg is None or self._msg[0] != chainId:
+            if self.trxType != LEGACY_TRX_TYPE:
+                msg = bytes((self.trxType,)) + pack(self._access_list_fields(chainId))
+                object.__setattr__(self, '_msg', (chainId, msg))
+                return msg
+            msg = pack((
+                self.nonce,
+                self.gasPrice,
+                self.gasLimit,
+                self.toAddress,
+                self.value,
+                self._callData,
+                chainId, None, None))
+            object.__setattr__(self, '_msg', (chainId, msg))
+        return self._msg[1]
 
     def hash(self, chainId=None):
-        trx = pack((
-            self.nonce,
-            self.gasPrice,
-            self.gasLimit,
-            self.toAddress,
-            self.value,
-            self.callData,
-            chainId or self.chainId(), None, None))
-        return keccak_256(trx).digest()
+        chainId = chainId or self.chainId()
+        if self._hash is None or self._hash[0] != chainId:
+            object.__setattr__(self, '_hash', (chainId, keccak_256(self.get_msg(chainId)).digest()))
+        return self._hash[1]
+
+    def signature(self):
+        if self._sig is None:
+            if self.trxType != LEGACY_TRX_TYPE:
+                v = self.v
+            else:
+                v = 1 if self.v % 2 == 0 else 0
+            object.__setattr__(self, '_sig', keys.Signature(vrs=[v, self.r, self.s]))
+        return self._sig
+
+    def public_key(self):
+        if self._pub is None:
+            object.__setattr__(self, '_pub', self.signature().recover_public_key_from_msg_hash(self.hash()))
+        return self._pub
 
     def sender(self):
-        msgHash = self.hash()
-        sig = keys.Signature(vrs=[1 if self.v % 2 == 0 else 0, self.r, self.s])
-        pub = sig.recover_public_key_from_msg_hash(msgHash)
-        return pub.to_canonical_address().hex()
+        return self.public_key().to_canonical_address().hex()
 
 
 class JsonEncoder(json.JSONEncoder):
@@ -163,6 +340,28 @@ class JsonEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self.obj)
 
 
+def check_legacy(trx):
+    if trx.trxType != LEGACY_TRX_TYPE:
+        raise Exception("NeonEVM executes legacy transactions only, got type {}".format(trx.trxType))
+
+
+@lru_cache(maxsize=None)
+def _signer_public_key(private_key):
+    return keys.PrivateKey(private_key).public_key
+
+
+def signer_public_key(private_key):
+    """
+    Returns the public key of private_key, given as an eth_keys PrivateKey, key bytes or a hex string;
+    derived once per key and cached.
+    """
+    if isinstance(private_key, keys.PrivateKey):
+        return private_key.public_key
+    if isinstance(private_key, str):
+        private_key = bytes.fromhex(private_key[2:] if private_key[:2].lower() == "0x" else private_key)
+    return _signer_public_key(bytes(private_key))
+
+
 def make_instruction_data_from_tx(instruction, private_key=None):
     if isinstance(instruction, dict):
         if instruction['chainId'] == None:
@@ -173,37 +372,166 @@ def make_instruction_data_from_tx(instruction, private_key=None):
         signed_tx = w3.eth.account.sign_transaction(instruction, private_key)
         # print(signed_tx.rawTransaction.hex())
         _trx = Trx.fromString(signed_tx.rawTransaction)
-        # print(json.dumps(_trx.__dict__, cls=JsonEncoder, indent=3))     
+        check_legacy(_trx)
 
         raw_msg = _trx.get_msg(instruction['chainId'])
-        sig = keys.Signature(vrs=[1 if _trx.v % 2 == 0 else 0, _trx.r, _trx.s])
-        pub = sig.recover_public_key_from_msg_hash(_trx.hash())
+        # The signer is known, so skip recovering it from the signature
+        pub = signer_public_key(private_key)
+        if CHECK_SIGNER and _trx.public_key() != pub:
+            raise Exception("Recovered signer {} doesn't match private key signer {}".format(_trx.public_key(), pub))
+        _trx._pub = pub
 
         # print(pub.to_hex())
 
-        return (pub.to_canonical_address(), sig.to_bytes(), raw_msg)
+        return (pub.to_canonical_address(), _trx.signature().to_bytes(), raw_msg)
     elif isinstance(instruction, str):
         if instruction[:2] == "0x":
             instruction = instruction[2:]
 
-        _trx = Trx.fromString(bytearray.fromhex(instruction))
-        # print(json.dumps(_trx.__dict__, cls=JsonEncoder, indent=3))
-
-        raw_msg = _trx.get_msg()
-        sig = keys.Signature(vrs=[1 if _trx.v % 2 == 0 else 0, _trx.r, _trx.s])
-        pub = sig.recover_public_key_from_msg_hash(_trx.hash())
+        return make_instruction_data_from_trx(Trx.fromString(bytearray.fromhex(instruction)))
+    else:
+        raise Exception("function gets ")
 
-        data = pub.to_canonical_address()
-        data += sig.to_bytes()
-        data += raw_msg
 
-        return (pub.to_canonical_address(), sig.to_bytes(), raw_msg)
+def make_instruction_data_from_trx(trx):
+    check_legacy(trx)
+    raw_msg = trx.get_msg()
+    pub = trx.public_key()
+    return (pub.to_canonical_address(), trx.signature().to_bytes(), raw_msg)
+
+
+def _make_instruction_data_chunk(chunk):
+    return [make_instruction_data_from_tx(instruction, private_key) for (instruction, private_key) in chunk]
+
+
+def make_instruction_data_from_txs(instructions, private_keys=None, workers=None, chunk_size=64):
+    """
+    Bulk version of make_instruction_data_from_tx.
+    private_keys is either a single key used for every transaction or a sequence aligned with instructions.
+    Transactions are signed, encoded and recovered in chunks on a pool of workers processes
+    (one per CPU by default, workers=1 runs in this process); (from_addr, sign, raw_msg) triples
+    are yielded in input order as soon as their chunk is done.
+    """
+    if private_keys is None or isinstance(private_keys, (bytes, bytearray, str)):
+        private_keys = repeat(private_keys)
+    pairs = zip(instructions, private_keys)
+    chunks = iter(lambda: list(islice(pairs, chunk_size)), [])
+
+    yield from _ordered_pool_map(_make_instruction_data_chunk, ((chunk,) for chunk in chunks), workers)
+
+
+def _ordered_pool_map(func, args_list, workers=None):
+    """
+    Runs func(*args) for every args on a process pool and yields the items of the returned lists in input order.
+    The pool has workers processes, one per CPU when workers is None; workers=1 runs the calls in this process.
+    Only a bounded window of calls is kept in flight so huge inputs are not queued all at once.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for args in args_list:
+            yield from func(*args)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for args in args_list:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _parse_replay_line(line, field):
+    line = line.strip()
+    if not line:
+        return None
+    if line[:1] in (b'{', b'"'):
+        item = json.loads(line)
+        line = item[field] if isinstance(item, dict) else item
     else:
-        raise Exception("function gets ")
+        line = line.decode('ascii')
+    return bytes.fromhex(line[2:] if line[:2] == "0x" else line)
+
+
+def _replay_lines(mm, start, end):
+    while start < end:
+        pos = mm.find(b'\n', start, end)
+        if pos < 0:
+            pos = end
+        yield mm[start:pos]
+        start = pos + 1
+
+
+def _replay_ranges(mm, chunk_bytes):
+    """Splits the file into ranges of about chunk_bytes that end on a line boundary."""
+    start = 0
+    while start < len(mm):
+        end = mm.find(b'\n', min(start + chunk_bytes, len(mm)))
+        end = len(mm) if end < 0 else end + 1
+        yield (start, end)
+        start = end
+
+
+class _ReplayFile:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __enter__(self):
+        return self.mm
+
+    def __exit__(self, *args):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+
+
+def read_raw_transactions(path, field='rawTransaction'):
+    """
+    Streams raw transactions from a replay file through a memory map.
+    Every line is a hex string (0x is optional), a JSON string or a JSON object keeping the hex string in field.
+    """
+    with _ReplayFile(path) as mm:
+        for line in _replay_lines(mm, 0, len(mm)):
+            raw = _parse_replay_line(line, field)
+            if raw is not None:
+                yield raw
+
+
+def read_transactions(path, field='rawTransaction'):
+    """Streams decoded Trx objects from a replay file, see read_raw_transactions."""
+    yield from Trx.from_many(read_raw_transactions(path, field))
+
+
+def _read_instruction_data_range(path, start, end, field):
+    with _ReplayFile(path) as mm:
+        return [make_instruction_data_from_trx(Trx.fromString(raw))
+                for raw in (_parse_replay_line(line, field) for line in _replay_lines(mm, start, end))
+                if raw is not None]
+
+
+def read_instruction_data(path, field='rawTransaction', workers=None, chunk_bytes=1024*1024):
+    """
+    Streams the (from_addr, sign, raw_msg) triples of make_instruction_data_from_tx for every transaction of a replay file.
+    The file is split into chunks of about chunk_bytes (on line boundaries) and each of workers processes
+    (one per CPU by default, workers=1 runs in this process) maps and decodes its own chunks;
+    triples are still yielded in file order.
+    """
+    with _ReplayFile(path) as mm:
+        ranges = list(_replay_ranges(mm, chunk_bytes))
+    yield from _ordered_pool_map(_read_instruction_data_range,
+                                 ((path, start, end, field) for (start, end) in ranges), workers)
 
 
 def make_keccak_instruction_data(check_instruction_index, msg_len, data_start):
-    if 255 < check_instruction_index < 0:
+    if not 0 <= check_instruction_index <= 255:
         raise Exception("Invalid index for instruction - {}".format(check_instruction_index))
 
     check_count = 1
@@ -0,0 +1,379 @@
+import asyncio
+import base64
+import itertools
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+import aiohttp
+from solana.blockhash import Blockhash
+from solana.rpc.api import SendTransactionError
+from solana.rpc.commitment import Confirmed
+from solana.rpc.types import TxOpts
+
+from solana_utils import solana_url, ACCOUNT_INFO_LAYOUT, AccountInfo, SIGNATURE_STATUSES_LIMIT, \
+    _is_confirmed, on_return_data
+
+
+class AsyncClient:
+    """
+    Minimal asyncio JSON-RPC client exposing the subset of solana.rpc.api.Client used by solana_utils.
+    Responses have the same shape as the synchronous client ones.
+    """
+    def __init__(self, endpoint=solana_url, session=None):
+        self.endpoint = endpoint
+        self._session = session
+        self._own_session = session is None
+        self._request_counter = itertools.count(1)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def make_request(self, method, *params):
+        request = {"jsonrpc": "2.0", "id": next(self._request_counter), "method": method, "params": params}
+        async with self.session.post(self.endpoint, json=request) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_balance(self, pubkey, commitment=Confirmed):
+        return await self.make_request("getBalance", str(pubkey), {"commitment": commitment})
+
+    async def get_account_info(self, pubkey, commitment=Confirmed, encoding="base64"):
+        return await self.make_request("getAccountInfo", str(pubkey), {"commitment": commitment, "encoding": encoding})
+
+    async def get_recent_blockhash(self, commitment=Confirmed):
+        return await self.make_request("getRecentBlockhash", {"commitment": commitment})
+
+    async def get_signature_statuses(self, signatures):
+        return await self.make_request("getSignatureStatuses", list(signatures), {"searchTransactionHistory": False})
+
+    async def get_confirmed_transaction(self, tx_sig, commitment=Confirmed):
+        return await self.make_request("getConfirmedTransaction", tx_sig, {"encoding": "json", "commitment": commitment})
+
+    async def send_raw_transaction(self, txn, opts=TxOpts()):
+        resp = await self.make_request("sendTransaction", base64.b64encode(txn).decode("utf-8"), {
+            "skipPreflight": opts.skip_preflight,
+            "preflightCommitment": opts.preflight_commitment,
+            "encoding": "base64",
+        })
+        if resp.get("error"):
+            raise SendTransactionError(resp.get("error"))
+        if not resp.get("result"):
+            raise Exception("Failed to send transaction")
+        return resp
+
+    async def send_transaction(self, txn, *signers, opts=TxOpts()):
+        blockhash_resp = await self.get_recent_blockhash()
+        if not blockhash_resp.get("result"):
+            raise RuntimeError("failed to get recent blockhash")
+        txn.recent_blockhash = Blockhash(blockhash_resp["result"]["value"]["blockhash"])
+        txn.sign(*signers)
+        return await self.send_raw_transaction(txn.serialize(), opts=opts)
+
+
+async def confirm_transactions(http_client, signatures, commitment='confirmed', timeout=30, confirmations=0):
+    """Async counterpart of solana_utils.confirm_transactions."""
+    pending = list(dict.fromkeys(signatures))
+    min_sleep, max_sleep = 0.05, 1.0
+    sleep_time = min_sleep
+    deadline = time.monotonic() + timeout
+    while pending:
+        batches = [pending[i:i + SIGNATURE_STATUSES_LIMIT] for i in range(0, len(pending), SIGNATURE_STATUSES_LIMIT)]
+        responses = await asyncio.gather(*(http_client.get_signature_statuses(batch) for batch in batches))
+        still_pending = []
+        for (batch, resp) in zip(batches, responses):
+            statuses = resp['result']['value'] if resp.get('result') else [None] * len(batch)
+            for (sig, status) in zip(batch, statuses):
+                if _is_confirmed(status, commitment, confirmations):
+                    yield sig
+                else:
+                    still_pending.append(sig)
+
+        if len(still_pending) < len(pending):
+            sleep_time = min_sleep
+        else:
+            sleep_time = min(sleep_time * 1.5, max_sleep)
+        pending = still_pending
+        if not pending:
+            return
+        if time.monotonic() + sleep_time > deadline:
+            raise RuntimeError("could not confirm transactions: ", pending)
+        await asyncio.sleep(sleep_time)
+
+
+async def confirm_transaction(http_client, tx_sig, confirmations=0):
+    async for _ in confirm_transactions(http_client, [tx_sig], confirmations=confirmations):
+        return
+
+
+async def send_transaction(client, trx, acc, subscriber=None):
+    """Pass a SignatureSubscriber to be notified of the confirmation instead of polling for it."""
+    result = await client.send_transaction(trx, acc, opts=TxOpts(skip_confirmation=True, preflight_commitment="confirmed"))
+    if subscriber is not None:
+        await subscriber.confirm_transaction(result["result"])
+    else:
+        await confirm_transaction(client, result["result"])
+    return await client.get_confirmed_transaction(result["result"])
+
+
+async def getBalance(client, account):
+    return (await client.get_balance(account, commitment=Confirmed))['result']['value']
+
+
+async def getAccountData(client, account, expected_length):
+    info = (await client.get_account_info(account, commitment=Confirmed))['result']['value']
+    if info is None:
+        raise Exception("Can't get information about {}".format(account))
+
+    data = base64.b64decode(info['data'][0])
+    if len(data) < expected_length:
+        print("len(data)({}) < expected_length({})".format(len(data), expected_length))
+        raise Exception("Wrong data length for account data {}".format(account))
+    return data
+
+
+async def getTransactionCount(client, sol_account):
+    info = await getAccountData(client, sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
+    acc_info = AccountInfo.frombytes(info)
+    return int.from_bytes(acc_info.trx_count, 'little')
+
+
+async def getNeonBalance(client, sol_account):
+    info = await getAccountData(client, sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
+    account = ACCOUNT_INFO_LAYOUT.parse(info)
+    return int.from_bytes(account.balance, byteorder="little")
+
+
+async def createEtherAccount(client, loader, ether):
+    """Async counterpart of EvmLoader.createEtherAccount."""
+    (trx, sol) = loader.createEtherAccountTrx(ether)
+    await send_transaction(client, trx, loader.acc.get_acc())
+    return sol
+
+
+async def call_iterative(client, acc, begin_trx, make_continue_trx, max_continues=1000):
+    """
+    Sends begin_trx, then transactions from make_continue_trx() one after another
+    until one of them returns OnReturn (0x06). Returns the receipt of that transaction.
+    begin_trx may be None for combined begin-or-continue instructions.
+    """
+    if begin_trx is not None:
+        result = await send_transaction(client, begin_trx, acc)
+        if on_return_data(result['result']) is not None:
+            return result
+    for _ in range(max_continues):
+        result = await send_transaction(client, make_continue_trx(), acc)
+        if on_return_data(result['result']) is not None:
+            return result
+    raise RuntimeError("Iterative transaction isn't finished after {} continues".format(max_continues))
+
+
+def default_ws_url(http_url):
+    """Solana validators serve WebSocket RPC on the HTTP RPC port + 1."""
+    url = urlparse(http_url)
+    netloc = url.hostname
+    if url.port:
+        netloc += ':{}'.format(url.port + 1)
+    return urlunparse(('wss' if url.scheme == 'https' else 'ws', netloc, url.path, '', '', ''))
+
+
+SOLANA_WS_URL = os.environ.get("SOLANA_WS_URL", default_ws_url(solana_url))
+
+
+class SignatureSubscriber:
+    """
+    Confirms transactions with signatureSubscribe notifications multiplexed over one shared WebSocket.
+    When the connection can't be established or drops, pending signatures are confirmed by batched
+    polling through http_client instead; the next call tries to reconnect.
+    """
+    def __init__(self, http_client, ws_url=SOLANA_WS_URL, commitment='confirmed', session=None):
+        self.http_client = http_client
+        self.ws_url = ws_url
+        self.commitment = commitment
+        self._session = session
+        self._own_session = session is None
+        self._ws = None
+        self._reader = None
+        self._pollers = set()
+        self._request_counter = itertools.count(1)
+        self._requests = {}        # subscribe request id -> signature
+        self._subscriptions = {}   # subscription id -> signature
+        self._waiters = {}         # signature -> future
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        for task in list(self._pollers) + ([self._reader] if self._reader else []):
+            task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _connect(self):
+        if self._ws is not None and not self._ws.closed:
+            return True
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        try:
+            self._ws = await self._session.ws_connect(self.ws_url)
+        except (aiohttp.ClientError, OSError) as err:
+            print("SignatureSubscriber: can't connect to {}: {}".format(self.ws_url, err))
+            return False
+        self._reader = asyncio.ensure_future(self._read(self._ws))
+        return True
+
+    async def _read(self, ws):
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                self._dispatch(json.loads(msg.data))
+        finally:
+            self._disconnected(ws)
+
+    def _dispatch(self, message):
+        if 'id' in message:
+            sig = self._requests.pop(message['id'], None)
+            if sig is not None and 'result' in message:
+                self._subscriptions[message['result']] = sig
+            elif sig in self._waiters:
+                # The subscription was refused: confirm this signature by polling
+                self._poll([sig])
+        elif message.get('method') == 'signatureNotification':
+            params = message['params']
+            self._resolve(self._subscriptions.pop(params['subscription'], None))
+
+    def _resolve(self, sig):
+        future = self._waiters.pop(sig, None)
+        if future is not None and not future.done():
+            future.set_result(sig)
+
+    def _disconnected(self, ws):
+        if self._ws is ws:
+            self._ws = None
+        self._requests.clear()
+        self._subscriptions.clear()
+        if self._waiters:
+            self._poll(list(self._waiters))
+
+    def _poll(self, signatures, timeout=30):
+        async def poll():
+            try:
+                async for sig in confirm_transactions(self.http_client, signatures, self.commitment, timeout):
+                    self._resolve(sig)
+            except RuntimeError:
+                pass
+        task = asyncio.ensure_future(poll())
+        self._pollers.add(task)
+        task.add_done_callback(self._pollers.discard)
+
+    async def _check_statuses(self, signatures):
+        # Transactions confirmed before their subscription was registered are not notified
+        for i in range(0, len(signatures), SIGNATURE_STATUSES_LIMIT):
+            batch = signatures[i:i + SIGNATURE_STATUSES_LIMIT]
+            resp = await self.http_client.get_signature_statuses(batch)
+            statuses = resp['result']['value'] if resp.get('result') else [None] * len(batch)
+            for (sig, status) in zip(batch, statuses):
+                if _is_confirmed(status, self.commitment, 0):
+                    self._resolve(sig)
+
+    async def confirm_transactions(self, signatures, timeout=30):
+        """Yields every signature as soon as it reaches the subscriber commitment."""
+        loop = asyncio.get_running_loop()
+        signatures = list(dict.fromkeys(signatures))
+        futures = {}
+        for sig in signatures:
+            if sig not in self._waiters:
+                self._waiters[sig] = loop.create_future()
+            futures[self._waiters[sig]] = sig
+
+        if await self._connect():
+            ws = self._ws
+            try:
+                for sig in signatures:
+                    request_id = next(self._request_counter)
+                    self._requests[request_id] = sig
+                    await ws.send_json({"jsonrpc": "2.0", "id": request_id, "method": "signatureSubscribe",
+                                        "params": [sig, {"commitment": self.commitment}]})
+            except (aiohttp.ClientError, ConnectionError, RuntimeError):
+                await ws.close()
+            await self._check_statuses([sig for sig in signatures if sig in self._waiters])
+        else:
+            self._poll(signatures, timeout)
+
+        pending = set(futures)
+        deadline = time.monotonic() + timeout
+        try:
+            while pending:
+                (done, pending) = await asyncio.wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise RuntimeError("could not confirm transactions: ", [futures[f] for f in pending])
+                for future in done:
+                    yield futures[future]
+        finally:
+            for future in pending:
+                self._waiters.pop(futures[future], None)
+
+    async def confirm_transaction(self, tx_sig, timeout=30):
+        async for _ in self.confirm_transactions([tx_sig], timeout):
+            return
+
+
+class BackgroundSignatureSubscriber:
+    """
+    SignatureSubscriber for synchronous callers: runs with its own AsyncClient of endpoint
+    on an event loop of a daemon thread. Used by solana_utils.confirm_transaction in the websocket mode.
+    """
+    def __init__(self, endpoint=solana_url, ws_url=None, commitment='confirmed'):
+        if ws_url is None:
+            ws_url = SOLANA_WS_URL if endpoint == solana_url else default_ws_url(endpoint)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client = AsyncClient(endpoint)
+        self._subscriber = SignatureSubscriber(self._client, ws_url, commitment)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def confirm_transactions(self, signatures, timeout=30):
+        """Returns the signatures in the order they were confirmed; raises RuntimeError on timeout."""
+        async def confirm():
+            return [sig async for sig in self._subscriber.confirm_transactions(signatures, timeout)]
+        return self._run(confirm())
+
+    def confirm_transaction(self, tx_sig, timeout=30):
+        self._run(self._subscriber.confirm_transaction(tx_sig, timeout))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._run(self._subscriber.close())
+        self._run(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
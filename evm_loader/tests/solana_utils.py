@@ -1,26 +1,39 @@
 import base64
+import functools
+import itertools
 import json
 import os
+import re
+import sqlite3
 import subprocess
+import tempfile
+import threading
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from hashlib import sha256
 from typing import NamedTuple, Tuple, Union
 
 import base58
+import requests
 import rlp
 from base58 import b58encode
-from construct import Bytes, Int8ul, Int64ul, Struct as cStruct
+from construct import Bytes, Float64l, Int8ul, Int64ul, Struct as cStruct
 from eth_keys import keys as eth_keys
 from sha3 import keccak_256
 from solana._layouts.system_instructions import SYSTEM_INSTRUCTIONS_LAYOUT, InstructionType as SystemInstructionType
 from solana.account import Account
+from solana.blockhash import Blockhash
 from solana.publickey import PublicKey
 from solana.rpc import types
-from solana.rpc.api import Client
+from solana.rpc.api import Client, SendTransactionError
 from solana.rpc.commitment import Confirmed
+from solana.rpc.providers.http import HTTPProvider
 from solana.rpc.types import TxOpts
 from solana.transaction import AccountMeta, TransactionInstruction, Transaction
+from solana.utils import shortvec_encoding as shortvec
 
 from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
 from spl.token.constants import TOKEN_PROGRAM_ID, ASSOCIATED_TOKEN_PROGRAM_ID, ACCOUNT_LEN
@@ -44,11 +57,102 @@ collateral_pool_base = "4sW3SZDJB7qXUyCYKA7pFL8eCTfm3REr8oSiKkww7MaT"
 COMPUTE_BUDGET_ID: PublicKey = PublicKey("ComputeBudget111111111111111111111111111111")
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
+COLLATERAL_POOL_COUNT = int(os.environ.get("COLLATERAL_POOL_COUNT", "10"))
 EVM_LOADER = os.environ.get("EVM_LOADER")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
 
 EVM_LOADER_SO = os.environ.get("EVM_LOADER_SO", 'target/bpfel-unknown-unknown/release/evm_loader.so')
-client = Client(solana_url)
+RPC_POOL_SIZE = int(os.environ.get("RPC_POOL_SIZE", "16"))
+# Set CONFIRM_MODE=websocket to confirm transactions with signatureSubscribe instead of polling
+CONFIRM_MODE = os.environ.get("CONFIRM_MODE", "poll")
+
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency, failed=False):
+        with self._lock:
+            self.count += 1
+            self.errors += failed
+            self.total += latency
+            self.max = max(self.max, latency)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return "LatencyStats(count={}, errors={}, mean={:.4f}, max={:.4f})".format(self.count, self.errors, self.mean, self.max)
+
+
+_latency_stats = {}
+
+
+def latency_stats():
+    """Returns the request LatencyStats of every endpoint used through get_client."""
+    return dict(_latency_stats)
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """HTTPProvider sending requests over a pool of keep-alive connections and recording their latency."""
+    def __init__(self, endpoint, pool_size=RPC_POOL_SIZE):
+        super().__init__(endpoint)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = _latency_stats.setdefault(self.endpoint_uri, LatencyStats())
+
+    def _post(self, payload):
+        start = time.monotonic()
+        failed = True
+        try:
+            raw_response = self.session.post(self.endpoint_uri, headers={"Content-Type": "application/json"},
+                                             data=self.json_encode(payload))
+            raw_response.raise_for_status()
+            failed = False
+        finally:
+            self.stats.record(time.monotonic() - start, failed)
+        return self.json_decode(raw_response.text)
+
+    def make_request(self, method, *params):
+        request_id = next(self._request_counter) + 1
+        response = self._post({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        # Whatever sends the transaction, the accounts it writes must not be served from the account caches
+        if method == "sendTransaction":
+            invalidate_written_accounts(self.endpoint_uri, Transaction.deserialize(base64.b64decode(params[0])))
+        elif method == "requestAirdrop":
+            invalidate_accounts(self.endpoint_uri, params[0])
+        return response
+
+    def make_batch_request(self, calls):
+        """Sends (method, *params) calls as one JSON-RPC batch; returns the responses in the order of calls."""
+        batch = [{"jsonrpc": "2.0", "id": next(self._request_counter) + 1, "method": method, "params": params}
+                 for (method, *params) in calls]
+        responses = {response["id"]: response for response in self._post(batch)}
+        return [responses[request["id"]] for request in batch]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(endpoint=solana_url, pool_size=RPC_POOL_SIZE) -> Client:
+    """Returns the Client shared by the whole process for endpoint, backed by a PooledHTTPProvider."""
+    with _clients_lock:
+        if endpoint not in _clients:
+            shared = Client(endpoint)
+            shared._provider = PooledHTTPProvider(endpoint, pool_size)
+            _clients[endpoint] = shared
+        return _clients[endpoint]
+
+
+client = get_client(solana_url)
 path_to_solana = 'solana'
 
 ACCOUNT_SEED_VERSION=b'\1'
@@ -59,6 +163,8 @@ EVM_BYTE_COST = 6960  # 1_000_000_000/ 100 * 365 / (1024*1024) * 2
 EVM_STEPS = 500
 # the message size that is used to holder-account filling
 HOLDER_MSG_SIZE = 950
+# maximum size of a serialized transaction: IPv6 MTU - IP header - UDP header
+PACKET_DATA_SIZE = 1280 - 40 - 8
 # Ethereum account allocated data size
 ACCOUNT_MAX_SIZE = 256
 # spl-token account allocated data size
@@ -79,18 +185,24 @@ class SplToken:
     def __init__(self, url):
         self.url = url
 
-    def call(self, arguments):
+    def call(self, arguments, writes=None):
         cmd = 'spl-token --url {} {}'.format(self.url, arguments)
         print('cmd:', cmd)
+        output = ''
         try:
-            return subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            output = subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            return output
         except subprocess.CalledProcessError as err:
             import sys
+            output = err.output or ''
             print("ERR: spl-token error {}".format(err))
             raise
+        finally:
+            invalidate_cli_accounts(arguments, output, writes)
 
     def transfer(self, mint, amount, recipient):
-        self.call("transfer {} {} {}".format(mint, amount, recipient))
+        recipient_token_account = get_associated_token_address(PublicKey(recipient), PublicKey(mint))
+        self.call("transfer {} {} {}".format(mint, amount, recipient), writes=[recipient_token_account])
 
     def balance(self, acc):
         from decimal import Decimal
@@ -99,16 +211,16 @@ class SplToken:
 
     def mint(self, mint_id, recipient, amount, owner=None):
         if owner is None:
-            self.call("mint {} {} {}".format(mint_id, amount, recipient))
+            self.call("mint {} {} {}".format(mint_id, amount, recipient), writes=())
         else:
-            self.call("mint {} {} {} --owner {}".format(mint_id, amount, recipient, owner))
+            self.call("mint {} {} {} --owner {}".format(mint_id, amount, recipient, owner), writes=())
         print("minting {} tokens for {}".format(amount, recipient))
 
     def create_token(self, owner=None):
         if owner is None:
-            res = self.call("create-token")
+            res = self.call("create-token", writes=())
         else:
-            res = self.call("create-token --owner {}".format(owner))
+            res = self.call("create-token --owner {}".format(owner), writes=())
         if not res.startswith("Creating token "):
             raise Exception("create token error")
         else:
@@ -116,38 +228,174 @@ class SplToken:
 
     def create_token_account(self, token, owner=None):
         if owner is None:
-            res = self.call("create-account {}".format(token))
+            res = self.call("create-account {}".format(token), writes=())
         else:
-            res = self.call("create-account {} --owner {}".format(token, owner))
+            res = self.call("create-account {} --owner {}".format(token, owner), writes=())
         if not res.startswith("Creating account "):
             raise Exception("create account error %s" % res)
         else:
             return res.split()[2]
 
 
-def create_collateral_pool_address(collateral_pool_index):
-    COLLATERAL_SEED_PREFIX = "collateral_seed_"
+COLLATERAL_SEED_PREFIX = "collateral_seed_"
+
+
+def create_collateral_pool_address(collateral_pool_index, base=collateral_pool_base):
     seed = COLLATERAL_SEED_PREFIX + str(collateral_pool_index)
-    return accountWithSeed(PublicKey(collateral_pool_base), seed, PublicKey(EVM_LOADER))
-
-
-def confirm_transaction(http_client, tx_sig, confirmations=0):
-    """Confirm a transaction."""
-    TIMEOUT = 30  # 30 seconds pylint: disable=invalid-name
-    elapsed_time = 0
-    while elapsed_time < TIMEOUT:
-        print('confirm_transaction for %s', tx_sig)
-        resp = http_client.get_signature_statuses([tx_sig])
-        print('confirm_transaction: %s', resp)
-        if resp["result"]:
-            status = resp['result']['value'][0]
-            if status and (status['confirmationStatus'] == 'finalized' or status['confirmationStatus'] == 'confirmed'
-                           and status['confirmations'] >= confirmations):
-                return
-        sleep_time = 0.1
+    return accountWithSeed(PublicKey(base), seed, PublicKey(EVM_LOADER))
+
+
+def missing_collateral_pools(client, base=collateral_pool_base, count=COLLATERAL_POOL_COUNT):
+    """Indexes of the collateral pools 0..count-1 that don't exist yet, checked with getMultipleAccounts."""
+    addresses = [create_collateral_pool_address(index, base) for index in range(count)]
+    return [index for (index, info) in enumerate(get_multiple_accounts(client, addresses)) if info is None]
+
+
+def provision_collateral_pools(client, wallet, count=COLLATERAL_POOL_COUNT):
+    """
+    Creates the missing collateral pools 0..count-1 based on the wallet. The create instructions
+    are packed into as few transactions as possible, which are sent at once and confirmed together.
+    Returns the indexes of the created pools.
+    """
+    base = wallet.public_key()
+    missing = missing_collateral_pools(client, base, count)
+    if missing:
+        minimum_balance = get_minimum_balance_for_rent_exemption(client, 0)
+        instructions = [createAccountWithSeed(base, base, COLLATERAL_SEED_PREFIX + str(index), minimum_balance, 0,
+                                              PublicKey(EVM_LOADER))
+                        for index in missing]
+        send_transactions(client, pack_instructions(instructions, base), wallet)
+    return missing
+
+
+class CollateralPool(NamedTuple):
+    index: int
+    index_buf: bytes
+    address: PublicKey
+
+
+class CollateralPoolSelector:
+    """
+    Spreads transactions over the collateral pool accounts, so that they don't all write-lock
+    the same one. The addresses are computed once. acquire() returns the least recently used pool
+    that no in-flight transaction holds; when all of them are held, pools are shared round-robin.
+    """
+    def __init__(self, count=COLLATERAL_POOL_COUNT):
+        self.pools = [CollateralPool(index, index.to_bytes(4, 'little'), create_collateral_pool_address(index))
+                      for index in range(count)]
+        self._idle = OrderedDict((pool.index, pool) for pool in self.pools)
+        self._in_flight = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                (_, pool) = self._idle.popitem(last=False)
+            else:
+                pool = self.pools[self._next % len(self.pools)]
+                self._next += 1
+            self._in_flight[pool.index] = self._in_flight.get(pool.index, 0) + 1
+            return pool
+
+    def release(self, pool):
+        with self._lock:
+            self._in_flight[pool.index] -= 1
+            if self._in_flight[pool.index] == 0:
+                del self._in_flight[pool.index]
+                self._idle[pool.index] = pool
+
+
+_collateral_pool_selector = None
+_collateral_pool_selector_lock = threading.Lock()
+
+
+def collateral_pool_selector():
+    """Returns the CollateralPoolSelector shared by the whole process."""
+    global _collateral_pool_selector
+    with _collateral_pool_selector_lock:
+        if _collateral_pool_selector is None:
+            _collateral_pool_selector = CollateralPoolSelector()
+        return _collateral_pool_selector
+
+
+# getSignatureStatuses accepts up to 256 signatures per request
+SIGNATURE_STATUSES_LIMIT = 256
+
+
+def _is_confirmed(status, commitment, confirmations):
+    if status is None:
+        return False
+    if commitment == 'processed':
+        return True
+    if status['confirmationStatus'] == 'finalized':
+        return True
+    return (commitment != 'finalized' and status['confirmationStatus'] == 'confirmed'
+            and (status['confirmations'] or 0) >= confirmations)
+
+
+def confirm_transactions(http_client, signatures, commitment='confirmed', timeout=30, confirmations=0):
+    """
+    Confirms many transactions at once, yielding every signature as soon as it reaches commitment.
+    Pending signatures are polled in batches of SIGNATURE_STATUSES_LIMIT per request; the poll interval
+    grows while nothing confirms and drops back once something does.
+    """
+    pending = list(dict.fromkeys(signatures))
+    min_sleep, max_sleep = 0.05, 1.0
+    sleep_time = min_sleep
+    deadline = time.monotonic() + timeout
+    while pending:
+        still_pending = []
+        for i in range(0, len(pending), SIGNATURE_STATUSES_LIMIT):
+            batch = pending[i:i + SIGNATURE_STATUSES_LIMIT]
+            resp = http_client.get_signature_statuses(batch)
+            statuses = resp['result']['value'] if resp.get('result') else [None] * len(batch)
+            for (sig, status) in zip(batch, statuses):
+                if _is_confirmed(status, commitment, confirmations):
+                    yield sig
+                else:
+                    still_pending.append(sig)
+
+        if len(still_pending) < len(pending):
+            sleep_time = min_sleep
+        else:
+            sleep_time = min(sleep_time * 1.5, max_sleep)
+        pending = still_pending
+        if not pending:
+            return
+        if time.monotonic() + sleep_time > deadline:
+            raise RuntimeError("could not confirm transactions: ", pending)
         time.sleep(sleep_time)
-        elapsed_time += sleep_time
-    raise RuntimeError("could not confirm transaction: ", tx_sig)
+
+
+def confirm_transaction(http_client, tx_sig, confirmations=0, mode=None):
+    """
+    Confirm a transaction. With mode (CONFIRM_MODE by default) 'websocket' the confirmation is
+    notified through the signature_subscriber() of the endpoint; confirmations > 0 are always polled.
+    """
+    if (mode or CONFIRM_MODE) == "websocket" and confirmations == 0:
+        signature_subscriber(http_client).confirm_transaction(tx_sig)
+        return
+    for _ in confirm_transactions(http_client, [tx_sig], confirmations=confirmations):
+        return
+
+
+_signature_subscribers = {}
+_signature_subscribers_lock = threading.Lock()
+
+
+def signature_subscriber(client, ws_url=None):
+    """
+    Returns the BackgroundSignatureSubscriber shared by all the users of the client endpoint;
+    ws_url is only used when it is created.
+    """
+    # solana_async_utils imports this module
+    from solana_async_utils import BackgroundSignatureSubscriber
+    endpoint = client._provider.endpoint_uri
+    with _signature_subscribers_lock:
+        if endpoint not in _signature_subscribers:
+            _signature_subscribers[endpoint] = BackgroundSignatureSubscriber(endpoint, ws_url)
+        return _signature_subscribers[endpoint]
 
 
 def accountWithSeed(base, seed, program):
@@ -185,32 +433,42 @@ class solana_cli:
     def __init__(self, acc=None):
         self.acc = acc
 
-    def call(self, arguments):
+    def call(self, arguments, writes=None):
         cmd = ""
         if self.acc == None:
             cmd = '{} --url {} {}'.format(path_to_solana, solana_url, arguments)
         else:
             cmd = '{} --keypair {} --url {} {}'.format(path_to_solana, self.acc.get_path(), solana_url, arguments)
+        output = ''
         try:
-            return subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            output = subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            return output
         except subprocess.CalledProcessError as err:
             import sys
+            output = err.output or ''
             print("ERR: solana error {}".format(err))
             raise
+        finally:
+            invalidate_cli_accounts(arguments, output, writes, None if self.acc == None else self.acc.get_acc())
 
 
 class neon_cli:
     def __init__(self, verbose_flags=''):
         self.verbose_flags = verbose_flags
 
-    def call(self, arguments):
+    def call(self, arguments, writes=None):
         cmd = 'neon-cli {} --commitment=processed --url {} {} -vvv'.format(self.verbose_flags, solana_url, arguments)
+        output = ''
         try:
-            return subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            output = subprocess.check_output(cmd, shell=True, universal_newlines=True)
+            return output
         except subprocess.CalledProcessError as err:
             import sys
+            output = err.output or ''
             print("ERR: neon-cli error {}".format(err))
             raise
+        finally:
+            invalidate_cli_accounts(arguments, output, writes)
 
     def emulate(self, loader_id, arguments):
         cmd = 'neon-cli {} --commitment=processed --evm_loader {} --url {} emulate {}'.format(self.verbose_flags,
@@ -296,7 +554,7 @@ class EvmLoader:
     def __init__(self, acc: OperatorAccount, programId=EVM_LOADER):
         if programId == None:
             print("Load EVM loader...")
-            result = json.loads(solana_cli(acc).call('deploy {}'.format(EVM_LOADER_SO)))
+            result = json.loads(solana_cli(acc).call('deploy {}'.format(EVM_LOADER_SO), writes=()))
             programId = result['programId']
         EvmLoader.loader_id = programId
         print("Done\n")
@@ -344,11 +602,14 @@ class EvmLoader:
 
     def deploy(self, contract_path, config=None):
         print('deploy contract')
+        # neon-cli deploys from the ether account of its keypair and increments its nonce
+        caller_ether = eth_keys.PrivateKey(cli_keypair().secret_key()).public_key.to_canonical_address()
+        writes = [ether2program_address(caller_ether, self.loader_id)[0]]
         if config == None:
-            output = neon_cli().call("deploy --evm_loader {} {}".format(self.loader_id, contract_path))
+            output = neon_cli().call("deploy --evm_loader {} {}".format(self.loader_id, contract_path), writes=writes)
         else:
             output = neon_cli().call("deploy --evm_loader {} --config {} {}".format(self.loader_id, config,
-                                                                                       contract_path))
+                                                                                       contract_path), writes=writes)
         print(type(output), output)
         result = json.loads(output.splitlines()[-1])
         return result
@@ -370,13 +631,8 @@ class EvmLoader:
         return (acc, 255)
 
     def ether2program(self, ether):
-        if isinstance(ether, str):
-            if ether.startswith('0x'): ether = ether[2:]
-        else:
-            ether = ether.hex()
-        output = neon_cli().call("create-program-address --evm_loader {} {}".format(self.loader_id, ether))
-        items = output.rstrip().split(' ')
-        return items[0], int(items[1])
+        (sol, nonce) = ether2program_address(ether, self.loader_id)
+        return str(sol), nonce
 
     def checkAccount(self, solana):
         info = client.get_account_info(solana)
@@ -388,7 +644,7 @@ class EvmLoader:
 
         program = self.ether2program(ether)
         code = self.ether2seed(ether)
-        info = client.get_account_info(program[0])
+        info = account_cache(client).get_account_info(program[0])
         if info['result']['value'] is None:
             res = self.deploy(location)
             return res['programId'], bytes.fromhex(res['ethereum'][2:]), res['codeId']
@@ -432,7 +688,7 @@ class EvmLoader:
 
 
 def getBalance(account):
-    return client.get_balance(account, commitment=Confirmed)['result']['value']
+    return account_cache(client).get_balance(account, commitment=Confirmed)['result']['value']
 
 
 ACCOUNT_INFO_LAYOUT = cStruct(
@@ -472,20 +728,313 @@ def getAccountData(client: Client, account: Union[str, PublicKey], expected_leng
 
 
 def getTransactionCount(client: Client, sol_account: Union[str, PublicKey]) -> int:
-    info = getAccountData(client, sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
+    info = getAccountData(account_cache(client), sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
     acc_info = AccountInfo.frombytes(info)
     res = int.from_bytes(acc_info.trx_count, 'little')
     print('getTransactionCount {}: {}'.format(sol_account, res))
     return res
 
 def getNeonBalance(client: Client, sol_account: Union[str, PublicKey]) -> int:
-    info = getAccountData(client, sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
+    info = getAccountData(account_cache(client), sol_account, ACCOUNT_INFO_LAYOUT.sizeof())
     account = ACCOUNT_INFO_LAYOUT.parse(info)
     balance = int.from_bytes(account.balance, byteorder="little")
     print('getNeonBalance {}: {}'.format(sol_account, balance))
     return balance
 
 
+_account_caches = weakref.WeakSet()
+
+
+class AccountCache:
+    """
+    Read-through cache of account infos tagged with the slot they were read at, per account and commitment.
+    An entry is served while the cluster, estimated from the latest seen slot, is no more than
+    max_slot_lag slots ahead of it. Least recently used entries are evicted beyond max_size.
+    Has the get_account_info/get_balance interface of Client, so it can be passed to
+    getAccountData instead of a client. getBalance, getTransactionCount, getNeonBalance and
+    deployChecked read through the cache shared per endpoint (account_cache()).
+    Every transaction sent through the solana_utils helpers or a get_client() client invalidates
+    the accounts it writes in the caches of its endpoint, CLI commands in all of them
+    (invalidate_cli_accounts()).
+    """
+    def __init__(self, client: Client, max_slot_lag=10, max_size=1024):
+        self.client = client
+        self.max_slot_lag = max_slot_lag
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (pubkey, commitment) -> (slot, account info value)
+        self._commitments = set()
+        self._generations = {}  # pubkey -> [readers, invalidations] while it is being read
+        self._slot = 0
+        self._slot_seen_at = time.monotonic()
+        _account_caches.add(self)
+
+    def observe_slot(self, slot):
+        with self._lock:
+            if slot > self._slot:
+                self._slot = slot
+                self._slot_seen_at = time.monotonic()
+
+    def current_slot(self):
+        return self._slot + int((time.monotonic() - self._slot_seen_at) / SLOT_DURATION)
+
+    def invalidate(self, *accounts):
+        with self._lock:
+            accounts = {str(account) for account in accounts}
+            for key in itertools.product(accounts, self._commitments):
+                self._entries.pop(key, None)
+            for account in accounts & self._generations.keys():
+                self._generations[account][1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for generation in self._generations.values():
+                generation[1] += 1
+
+    def invalidate_transaction(self, trx: Transaction):
+        written = [meta.pubkey for instr in trx.instructions for meta in instr.keys if meta.is_writable]
+        written += [pair.pubkey for pair in trx.signatures]
+        self.invalidate(*written)
+
+    def get_account_info(self, account, commitment=Confirmed):
+        key = (str(account), commitment)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.current_slot() - entry[0] <= self.max_slot_lag:
+                self._entries.move_to_end(key)
+                return {'result': {'context': {'slot': entry[0]}, 'value': entry[1]}}
+            # A response read across an invalidation of the account may predate the write
+            self._commitments.add(commitment)
+            generation = self._generations.setdefault(key[0], [0, 0])
+            generation[0] += 1
+            invalidations = generation[1]
+
+        try:
+            response = self.client.get_account_info(account, commitment=commitment)
+        finally:
+            with self._lock:
+                generation[0] -= 1
+                if generation[0] == 0:
+                    del self._generations[key[0]]
+        slot = response['result']['context']['slot']
+        self.observe_slot(slot)
+        with self._lock:
+            if generation[1] == invalidations:
+                self._entries[key] = (slot, response['result']['value'])
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return response
+
+    def get_balance(self, account, commitment=Confirmed):
+        response = self.get_account_info(account, commitment)
+        value = response['result']['value']
+        return {'result': {'context': response['result']['context'], 'value': value['lamports'] if value else 0}}
+
+
+_shared_account_caches = {}
+_shared_account_caches_lock = threading.Lock()
+
+
+def account_cache(client):
+    """Returns the AccountCache shared by all the readers of the client endpoint; an AccountCache is returned as is."""
+    if isinstance(client, AccountCache):
+        return client
+    endpoint = client._provider.endpoint_uri
+    with _shared_account_caches_lock:
+        if endpoint not in _shared_account_caches:
+            _shared_account_caches[endpoint] = AccountCache(client)
+        return _shared_account_caches[endpoint]
+
+
+def _endpoint_account_caches(endpoint):
+    return [cache for cache in list(_account_caches) if cache.client._provider.endpoint_uri == endpoint]
+
+
+def invalidate_accounts(endpoint, *accounts):
+    for cache in _endpoint_account_caches(endpoint):
+        cache.invalidate(*accounts)
+
+
+def invalidate_written_accounts(endpoint, trx, slot=None):
+    """Drops the accounts written by trx from the caches of endpoint; slot is the slot trx was confirmed at."""
+    for cache in _endpoint_account_caches(endpoint):
+        cache.invalidate_transaction(trx)
+        if slot is not None:
+            cache.observe_slot(slot)
+
+
+def invalidate_account_caches():
+    """Empties every AccountCache, after accounts were written outside of this process, e.g. by neon-cli."""
+    for cache in list(_account_caches):
+        cache.clear()
+
+
+# The first argument of the CLI commands that don't write accounts
+READ_ONLY_CLI_COMMANDS = {'account', 'address', 'balance', 'config', 'create-program-address', 'emulate',
+                          'get-ether-account-data', 'get-storage-at'}
+BASE58_PUBKEY_PATTERN = re.compile(r'\b[1-9A-HJ-NP-Za-km-z]{32,44}\b')
+
+
+def invalidate_cli_accounts(arguments, output, writes=None, payer=None):
+    """
+    Drops the accounts written by a CLI command from every AccountCache: its fee payer (cli_keypair()
+    by default), the accounts named in its arguments or output and writes, the other ones it writes.
+    Read-only commands drop nothing; the caches are emptied when writes is None, i.e. the written
+    accounts aren't known.
+    """
+    if arguments.split(maxsplit=1)[0] in READ_ONLY_CLI_COMMANDS:
+        return
+    if writes is None:
+        invalidate_account_caches()
+        return
+    payer = payer or cli_keypair()
+    accounts = [payer.public_key(), *writes]
+    accounts += BASE58_PUBKEY_PATTERN.findall(arguments) + BASE58_PUBKEY_PATTERN.findall(output)
+    for cache in list(_account_caches):
+        cache.invalidate(*accounts)
+
+
+@functools.lru_cache(maxsize=None)
+def cli_keypair():
+    """The Account of the keypair the CLIs sign with when no --keypair is given."""
+    with open(wallet_path()) as f:
+        return Account(json.load(f)[0:32])
+
+
+SYSVAR_RENT_PUBKEY = PublicKey("SysvarRent111111111111111111111111111111111")
+
+RENT_LAYOUT = cStruct(
+    "lamports_per_byte_year" / Int64ul,
+    "exemption_threshold" / Float64l,
+    "burn_percent" / Int8ul,
+)
+
+_rent_exemption = {}
+_rent_sysvar = {}
+_rent_lock = threading.Lock()
+
+
+def get_minimum_balance_for_rent_exemption(client: Client, size: int, local=False) -> int:
+    """
+    Memoized client.get_minimum_balance_for_rent_exemption(size), shared by the whole process.
+    With local=True the balance is computed from the rent sysvar, which is fetched once per endpoint.
+    """
+    endpoint = client._provider.endpoint_uri
+    with _rent_lock:
+        if (endpoint, size) in _rent_exemption:
+            return _rent_exemption[(endpoint, size)]
+        if local:
+            if endpoint not in _rent_sysvar:
+                _rent_sysvar[endpoint] = RENT_LAYOUT.parse(getAccountData(client, SYSVAR_RENT_PUBKEY, RENT_LAYOUT.sizeof()))
+            rent = _rent_sysvar[endpoint]
+            balance = int((ACCOUNT_STORAGE_OVERHEAD + size) * rent.lamports_per_byte_year * rent.exemption_threshold)
+        else:
+            balance = client.get_minimum_balance_for_rent_exemption(size, commitment=Confirmed)["result"]
+        _rent_exemption[(endpoint, size)] = balance
+        return balance
+
+
+def ether2program_address(ether: Union[str, bytes], loader_id=EVM_LOADER) -> Tuple[PublicKey, int]:
+    """Derives the Solana account of an Ethereum address locally, with the seeds neon-cli create-program-address uses."""
+    if isinstance(ether, str):
+        if ether.startswith('0x'): ether = ether[2:]
+        ether = bytes.fromhex(ether)
+    return PublicKey.find_program_address([ACCOUNT_SEED_VERSION, ether], PublicKey(loader_id))
+
+
+# getMultipleAccounts accepts up to 100 keys per request
+MULTIPLE_ACCOUNTS_LIMIT = 100
+
+
+def _get_multiple_accounts(client: Client, accounts, commitment):
+    opts = {"encoding": "base64", "commitment": commitment}
+    response = client._provider.make_request(types.RPCMethod("getMultipleAccounts"), [str(acc) for acc in accounts], opts)
+    if 'error' in response:
+        raise Exception("getMultipleAccounts failed: {}".format(response['error']))
+    return response['result']['value']
+
+
+def get_multiple_accounts(client: Client, accounts, commitment=Confirmed, workers=8):
+    """
+    Fetches accounts with getMultipleAccounts requests of up to 100 keys, None for missing ones.
+    Requests for more than 100 accounts are sent concurrently from up to workers threads.
+    """
+    accounts = list(accounts)
+    batches = [accounts[i:i + MULTIPLE_ACCOUNTS_LIMIT] for i in range(0, len(accounts), MULTIPLE_ACCOUNTS_LIMIT)]
+    if len(batches) <= 1 or workers == 1:
+        results = [_get_multiple_accounts(client, batch, commitment) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            results = list(executor.map(lambda batch: _get_multiple_accounts(client, batch, commitment), batches))
+    return [info for result in results for info in result]
+
+
+TAG_ACCOUNT = 10
+
+
+class NeonAccount(NamedTuple):
+    address: PublicKey
+    ether: bytes
+    trx_count: int
+    balance: int
+    code_account: Union[PublicKey, None]
+    lamports: int
+
+
+def _solana_address(address, loader_id):
+    """Solana addresses pass through; Ethereum ones (20 bytes or 40 hex digits) are derived locally."""
+    if isinstance(address, PublicKey):
+        return address
+    if isinstance(address, (bytes, bytearray)) and len(address) == 20:
+        return ether2program_address(address, loader_id)[0]
+    if isinstance(address, str) and len(address[2:] if address.startswith('0x') else address) == 40:
+        return ether2program_address(address, loader_id)[0]
+    return PublicKey(address)
+
+
+def get_neon_accounts(client: Client, addresses, loader_id=EVM_LOADER, commitment=Confirmed, workers=8):
+    """
+    Bulk counterpart of getTransactionCount/getNeonBalance: reads Solana or Ethereum addresses with
+    getMultipleAccounts and returns a NeonAccount for each of them, None if it isn't a Neon account.
+    """
+    solana_accounts = [_solana_address(address, loader_id) for address in addresses]
+    records = []
+    for (sol, info) in zip(solana_accounts, get_multiple_accounts(client, solana_accounts, commitment, workers)):
+        data = base64.b64decode(info['data'][0]) if info is not None else b''
+        if len(data) < ACCOUNT_INFO_LAYOUT.sizeof() or data[0] != TAG_ACCOUNT:
+            records.append(None)
+            continue
+        account = ACCOUNT_INFO_LAYOUT.parse(data)
+        code_account = PublicKey(account.code_account) if account.code_account != bytes(32) else None
+        records.append(NeonAccount(sol, account.ether, int.from_bytes(account.trx_count, 'little'),
+                                   int.from_bytes(account.balance, 'little'), code_account, info['lamports']))
+    return records
+
+
+def access_list_accounts(client: Client, trx, loader_id=EVM_LOADER):
+    """
+    Resolves the access list of an EIP-2930 transaction to NeonEVM accounts without emulation.
+    Ethereum accounts are derived locally and read with one request to discover their code accounts.
+    Returns writable AccountMeta for every existing account.
+    """
+    addresses = list(dict.fromkeys(address for (address, _) in trx.access_list or ()))
+    solana_accounts = [ether2program_address(address, loader_id)[0] for address in addresses]
+
+    metas = []
+    for (sol, info) in zip(solana_accounts, get_multiple_accounts(client, solana_accounts)):
+        if info is None:
+            continue
+        metas.append(AccountMeta(pubkey=sol, is_signer=False, is_writable=True))
+        data = base64.b64decode(info['data'][0])
+        if len(data) >= ACCOUNT_INFO_LAYOUT.sizeof():
+            code_account = AccountInfo.frombytes(data).code_account
+            if code_account != PublicKey(bytes(32)):
+                metas.append(AccountMeta(pubkey=code_account, is_signer=False, is_writable=True))
+    return metas
+
+
 def wallet_path():
     res = solana_cli().call("config get")
     substr = "Keypair Path: "
@@ -505,13 +1054,193 @@ def operator1_keypair_path():
 def operator2_keypair_path():
     return "/root/.config/solana/id2.json"
 
-def send_transaction(client, trx, acc):
-    result = client.send_transaction(trx, acc, opts=TxOpts(skip_confirmation=True, preflight_commitment="confirmed"))
-    confirm_transaction(client, result["result"])
+SLOT_DURATION = 0.4  # seconds
+
+
+def is_blockhash_expired(err):
+    return 'BlockhashNotFound' in str(err.result) or 'Blockhash not found' in str(err)
+
+
+class BlockhashCache:
+    """
+    Shares one recent blockhash between transactions instead of fetching it for every send.
+    It is refetched once it is ttl_slots old (estimated from SLOT_DURATION) or, with refresh=True,
+    by a background thread every half of the TTL, started by the first get() and stopped by close(). The lock only guards the cached state:
+    requests and waits for a new blockhash happen outside of it.
+    """
+    def __init__(self, client, ttl_slots=30, refresh=False):
+        self.client = client
+        self.ttl = ttl_slots * SLOT_DURATION
+        self._lock = threading.Lock()
+        self._blockhash = None
+        self._fetched_at = 0.0
+        self._signatures = set()  # signatures already stamped with the current blockhash
+        self._stopped = threading.Event()
+        self._refresh = refresh
+        self._refresher = None
+
+    def close(self):
+        """Stops the background refresh."""
+        self._stopped.set()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.ttl / 2):
+            try:
+                self._store(self._request())
+            except Exception as err:
+                print("BlockhashCache: refresh failed:", err)
+
+    def _request(self):
+        resp = self.client.get_recent_blockhash(Confirmed)
+        if not resp.get("result"):
+            raise RuntimeError("failed to get recent blockhash")
+        return resp["result"]["value"]["blockhash"]
+
+    def _store(self, blockhash):
+        with self._lock:
+            if blockhash != self._blockhash:
+                self._blockhash = blockhash
+                self._signatures = set()
+            self._fetched_at = time.monotonic()
+            return self._blockhash
+
+    def _is_fresh(self):
+        return self._blockhash is not None and time.monotonic() - self._fetched_at <= self.ttl
+
+    def _wait_for_new(self, stale):
+        """Returns a blockhash other than stale, waiting until the cluster produces one."""
+        for _ in range(100):
+            with self._lock:
+                if self._blockhash != stale and self._is_fresh():
+                    return self._blockhash
+            blockhash = self._request()
+            if blockhash != stale:
+                return self._store(blockhash)
+            time.sleep(SLOT_DURATION / 2)
+        raise RuntimeError("recent blockhash doesn't change: ", stale)
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refresher is None and not self._stopped.is_set():
+                self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                self._refresher.start()
+
+    def get(self):
+        if self._refresh and self._refresher is None:
+            self._start_refresh()
+        with self._lock:
+            if self._is_fresh():
+                return self._blockhash
+        return self._store(self._request())
+
+    def invalidate(self, blockhash):
+        """Replaces blockhash if it is still the cached one, e.g. after the cluster reported it expired."""
+        self._wait_for_new(blockhash)
+
+    def stamp(self, trx, *signers):
+        """
+        Sets the cached blockhash to trx and signs it. A transaction identical to one already stamped
+        with the same blockhash would be rejected as a duplicate, so it waits for the next blockhash.
+        """
+        blockhash = self.get()
+        while True:
+            trx.recent_blockhash = Blockhash(blockhash)
+            trx.sign(*signers)
+            with self._lock:
+                if blockhash != self._blockhash:
+                    blockhash = self._blockhash
+                    continue
+                if trx.signature() not in self._signatures:
+                    self._signatures.add(trx.signature())
+                    return blockhash
+            blockhash = self._wait_for_new(blockhash)
+
+    def send_transaction(self, trx, *signers, opts=TxOpts(), retries=3):
+        """Client.send_transaction with the cached blockhash; re-stamps and resends when it has expired."""
+        for attempt in range(retries + 1):
+            blockhash = self.stamp(trx, *signers)
+            try:
+                return self.client.send_raw_transaction(trx.serialize(), opts=opts)
+            except SendTransactionError as err:
+                if attempt == retries or not is_blockhash_expired(err):
+                    raise
+                self.invalidate(blockhash)
+            finally:
+                invalidate_written_accounts(self.client._provider.endpoint_uri, trx)
+
+
+_blockhash_caches = {}
+_blockhash_caches_lock = threading.Lock()
+
+
+def blockhash_cache(client):
+    """Returns the BlockhashCache shared by all the users of the client endpoint."""
+    endpoint = client._provider.endpoint_uri
+    with _blockhash_caches_lock:
+        if endpoint not in _blockhash_caches:
+            _blockhash_caches[endpoint] = BlockhashCache(client, refresh=True)
+        return _blockhash_caches[endpoint]
+
+
+def reset_caches():
+    """
+    Drops the blockhash, account and rent exemption caches shared per endpoint and stops their
+    refresh threads; the next call through them reads the cluster again.
+    """
+    with _blockhash_caches_lock:
+        blockhash_caches = list(_blockhash_caches.values())
+        _blockhash_caches.clear()
+    for cache in blockhash_caches:
+        cache.close()
+    with _signature_subscribers_lock:
+        subscribers = list(_signature_subscribers.values())
+        _signature_subscribers.clear()
+    for subscriber in subscribers:
+        subscriber.close()
+    with _shared_account_caches_lock:
+        _shared_account_caches.clear()
+    invalidate_account_caches()
+    with _rent_lock:
+        _rent_exemption.clear()
+        _rent_sysvar.clear()
+
+
+def send_transaction(client, trx, acc, confirm_mode=None):
+    result = blockhash_cache(client).send_transaction(trx, acc, opts=TxOpts(skip_confirmation=True,
+                                                                            preflight_commitment="confirmed"))
+    confirm_transaction(client, result["result"], mode=confirm_mode)
     result = client.get_confirmed_transaction(result["result"])
+    # Reads made before the confirmation may have cached the previous state
+    slot = result['result']['slot'] if result.get('result') else None
+    invalidate_written_accounts(client._provider.endpoint_uri, trx, slot)
     return result
 
 
+def send_transactions(client, transactions, signer, timeout=60):
+    """
+    Sends independent transactions without waiting for each of them, then confirms them all
+    with batched status requests; returns their signatures.
+    """
+    cache = blockhash_cache(client)
+    opts = TxOpts(skip_confirmation=True, preflight_commitment="confirmed")
+    signatures = [cache.send_transaction(trx, signer, opts=opts)["result"] for trx in transactions]
+    for _ in confirm_transactions(client, signatures, timeout=timeout):
+        pass
+    for trx in transactions:
+        invalidate_written_accounts(client._provider.endpoint_uri, trx)
+    return signatures
+
+
+def on_return_data(result):
+    """Returns the data of the OnReturn (0x06) inner instruction of a confirmed transaction, None if there is none."""
+    for inner in result['meta']['innerInstructions'] or []:
+        if inner['instructions']:
+            data = base58.b58decode(inner['instructions'][-1]['data'])
+            if data[0] == 6:
+                return data
+    return None
+
+
 def create_neon_evm_instr_05_single(evm_loader_program_id,
                                     caller_sol_acc,
                                     operator_sol_acc,
@@ -761,6 +1490,689 @@ def create_neon_evm_instr_14_combined_continue(evm_loader_program_id,
         ])
 
 
+def add_signed_instructions(trx, signed, keccak_keys=None):
+    """
+    Appends instructions carrying signed Ethereum transactions, each right after its KeccakSecp256k1 check,
+    which is where NeonEVM looks for it. NeonEVM compares that instruction with a single-check one,
+    so checks can't be merged into one KeccakSecp256k1 instruction.
+    signed is a list of (instruction, msg_len, data_start); check_instruction_index is taken from
+    the position each instruction gets in trx.
+    Returns the indexes of the signed instructions in trx.
+    """
+    if keccak_keys is None:
+        keccak_keys = [AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False)]
+
+    indexes = []
+    for (instruction, msg_len, data_start) in signed:
+        index = len(trx.instructions) + 1
+        trx.add(TransactionInstruction(program_id=keccakprog, keys=keccak_keys,
+                                       data=make_keccak_instruction_data(index, msg_len, data_start)))
+        indexes.append(index)
+        trx.add(instruction)
+    return indexes
+
+
+def write_holder_layout(holder_id, offset, data):
+    return (bytes.fromhex('12') +
+            holder_id.to_bytes(8, byteorder='little') +
+            offset.to_bytes(4, byteorder='little') +
+            len(data).to_bytes(8, byteorder='little') +
+            data)
+
+
+def transaction_size(trx, fee_payer):
+    """Size of trx serialized with all of its signatures, computed without signing it."""
+    stamped = Transaction(recent_blockhash=Blockhash(str(PublicKey(0))), fee_payer=fee_payer)
+    stamped.instructions = list(trx.instructions)
+    message = stamped.compile_message()
+    signatures = message.header.num_required_signatures
+    return len(shortvec.encode_length(signatures)) + signatures * 64 + len(message.serialize())
+
+
+def pack_instructions(instructions, fee_payer, make_transaction=None):
+    """Distributes instructions, in order, over as few transactions fitting into PACKET_DATA_SIZE as possible."""
+    make_transaction = make_transaction or TransactionWithComputeBudget
+    transactions = []
+    trx = None
+    for instr in instructions:
+        if trx is not None:
+            trx.add(instr)
+            if transaction_size(trx, fee_payer) <= PACKET_DATA_SIZE:
+                continue
+            trx.instructions.pop()
+            transactions.append(trx)
+        trx = make_transaction().add(instr)
+    if trx is not None:
+        transactions.append(trx)
+    return transactions
+
+
+class HolderUploader:
+    """
+    Writes a message to a holder account with WriteHolder (0x12) transactions.
+    Writes are sized to fill PACKET_DATA_SIZE for the actual account list and signers; writes smaller
+    than that are packed several per transaction.
+    Up to window transactions are in flight at once: their statuses are polled in batches and every
+    confirmed transaction makes room for the next one. Transactions that failed or weren't confirmed
+    within confirm_timeout are sent again, each at most retries times.
+    """
+    def __init__(self, client, signer, holder, holder_id, loader_id=EVM_LOADER, chunk_size=None,
+                 window=32, confirm_timeout=30, retries=3):
+        self.client = client
+        self.signer = signer
+        self.holder = holder
+        self.holder_id = holder_id
+        self.loader_id = loader_id
+        self.window = window
+        self.confirm_timeout = confirm_timeout
+        self.retries = retries
+
+        fee_payer = signer.public_key()
+        one_write = transaction_size(self.make_transaction([(0, b'')]), fee_payer)
+        # Every additional write costs its data and one more byte when the data length needs a 2-byte shortvec
+        self._write_cost = transaction_size(self.make_transaction([(0, b''), (0, b'')]), fee_payer) - one_write + 1
+        self._base_size = one_write + 1 - self._write_cost
+        self.max_chunk_size = PACKET_DATA_SIZE - one_write - 1
+        self.chunk_size = chunk_size or self.max_chunk_size
+
+    def chunks(self, message):
+        return [(offset, message[offset:offset + self.chunk_size]) for offset in range(0, len(message), self.chunk_size)]
+
+    def pack_writes(self, chunks):
+        """Groups (offset, data) writes into transactions, splitting the ones that don't fit in the remaining room."""
+        groups = []
+        (group, room) = ([], 0)
+        for (offset, part) in chunks:
+            while part:
+                if room <= self._write_cost:
+                    if group:
+                        groups.append(tuple(group))
+                    (group, room) = ([], PACKET_DATA_SIZE - self._base_size)
+                size = min(len(part), room - self._write_cost)
+                group.append((offset, part[:size]))
+                room -= self._write_cost + size
+                (offset, part) = (offset + size, part[size:])
+        if group:
+            groups.append(tuple(group))
+        return groups
+
+    def make_transaction(self, writes):
+        trx = TransactionWithComputeBudget()
+        for (offset, part) in writes:
+            trx.add(TransactionInstruction(program_id=self.loader_id,
+                data=write_holder_layout(self.holder_id, offset, part),
+                keys=[
+                    AccountMeta(pubkey=self.holder, is_signer=False, is_writable=True),
+                    AccountMeta(pubkey=self.signer.public_key(), is_signer=True, is_writable=False),
+                ]))
+        return trx
+
+    def _send(self, writes):
+        trx = self.make_transaction(writes)
+        return blockhash_cache(self.client).send_transaction(trx, self.signer, opts=TxOpts(
+            skip_confirmation=True, preflight_commitment="confirmed"))["result"]
+
+    def changed_chunks(self, message):
+        """
+        Reads the holder once and returns the chunks of message that differ from its contents,
+        so an interrupted upload is resumed instead of restarted. Holder data follows the tag byte.
+        """
+        data = getAccountData(self.client, self.holder, 1)[1:]
+        return [(offset, part) for (offset, part) in self.chunks(message) if data[offset:offset + len(part)] != part]
+
+    def upload(self, message, resume=True):
+        """
+        Writes message; returns the signatures of the confirmed write transactions.
+        With resume, only the chunks that differ from the current holder contents are written.
+        """
+        chunks = self.changed_chunks(message) if resume else self.chunks(message)
+        return self.upload_chunks(chunks)
+
+    def upload_chunks(self, chunks):
+        """Writes (offset, data) chunks; returns the signatures of the confirmed write transactions."""
+        queue = list(reversed(self.pack_writes(chunks)))
+        attempts = {}
+        in_flight = {}  # signature -> (writes, sent at)
+        confirmed = []
+        sleep_time = 0.05
+
+        def retry(writes, reason):
+            attempts[writes] = attempts.get(writes, 0) + 1
+            if attempts[writes] > self.retries:
+                raise RuntimeError("can't write holder chunk at offset {}: {}".format(writes[0][0], reason))
+            queue.append(writes)
+
+        while queue or in_flight:
+            while queue and len(in_flight) < self.window:
+                writes = queue.pop()
+                try:
+                    in_flight[self._send(writes)] = (writes, time.monotonic())
+                except SendTransactionError as err:
+                    retry(writes, err)
+
+            signatures = list(in_flight)
+            progress = False
+            for i in range(0, len(signatures), SIGNATURE_STATUSES_LIMIT):
+                batch = signatures[i:i + SIGNATURE_STATUSES_LIMIT]
+                resp = self.client.get_signature_statuses(batch)
+                statuses = resp['result']['value'] if resp.get('result') else [None] * len(batch)
+                for (sig, status) in zip(batch, statuses):
+                    (writes, sent_at) = in_flight[sig]
+                    if status is not None and status['err'] is not None:
+                        del in_flight[sig]
+                        retry(writes, status['err'])
+                    elif _is_confirmed(status, 'confirmed', 0):
+                        del in_flight[sig]
+                        confirmed.append(sig)
+                        progress = True
+                    elif time.monotonic() - sent_at > self.confirm_timeout:
+                        del in_flight[sig]
+                        retry(writes, "not confirmed in {} seconds".format(self.confirm_timeout))
+
+            sleep_time = 0.05 if progress else min(sleep_time * 1.5, 1.0)
+            if in_flight and not (queue and len(in_flight) < self.window):
+                time.sleep(sleep_time)
+        return confirmed
+
+
+_PROGRAM_ID_PATTERN = r'([1-9A-HJ-NP-Za-km-z]{32,44})'
+_INVOKE_LOG = re.compile(r'^Program {} invoke \[(\d+)\]$'.format(_PROGRAM_ID_PATTERN))
+_CONSUMED_LOG = re.compile(r'^Program {} consumed (\d+) of \d+ compute units$'.format(_PROGRAM_ID_PATTERN))
+_RESULT_LOG = re.compile(r'^Program {} (success$|failed: )'.format(_PROGRAM_ID_PATTERN))
+
+
+def consumed_compute_units(result, program_id=EVM_LOADER):
+    """
+    Compute units consumed by every top-level instruction of program_id in a confirmed transaction,
+    parsed from its 'Program <id> consumed <n> of <m> compute units' log lines.
+    Other lines, 'Program log: ...' and 'Program data: ...' printed by programs included, are ignored.
+    """
+    program_id = str(program_id)
+    units = []
+    depth = 0
+    for log in result['meta']['logMessages'] or []:
+        invoke = _INVOKE_LOG.match(log)
+        if invoke:
+            depth = int(invoke.group(2))
+            continue
+        consumed = _CONSUMED_LOG.match(log)
+        if consumed:
+            if depth == 1 and consumed.group(1) == program_id:
+                units.append(int(consumed.group(2)))
+            continue
+        if _RESULT_LOG.match(log):
+            depth -= 1
+    return units
+
+
+def is_compute_budget_exceeded(logs):
+    """Whether transaction logs (or a SendTransactionError) show that an instruction ran out of compute units."""
+    if isinstance(logs, SendTransactionError):
+        logs = logs.result.get('data', {}).get('logs') or []
+    return any('exceeded CUs meter' in log for log in logs or [])
+
+
+class StepCountController:
+    """
+    Chooses the step count of iterative (continue) instructions so that a transaction uses about
+    target of its compute budget. The compute units per step are measured from the logs of every
+    continue and remembered per key, usually (contract, selector); the step count is halved when
+    a transaction runs out of compute units.
+    """
+    def __init__(self, units=DEFAULT_UNITS, target=0.8, initial_steps=EVM_STEPS, min_steps=10, max_growth=2.0):
+        self.units = units
+        self.target = target
+        self.initial_steps = initial_steps
+        self.min_steps = min_steps
+        self.max_growth = max_growth
+        self._lock = threading.Lock()
+        self._steps = {}
+
+    @staticmethod
+    def key(contract, call_data):
+        return (str(contract), bytes(call_data[:4]))
+
+    def step_count(self, key):
+        with self._lock:
+            return self._steps.get(key, self.initial_steps)
+
+    def seed(self, key, steps):
+        """Sets the step count key starts from instead of initial_steps; ignored once key has one."""
+        with self._lock:
+            return self._steps.setdefault(key, steps)
+
+    def update(self, key, step_count, result, instructions=1, program_id=EVM_LOADER):
+        """
+        Adjusts the step count of key from a continue transaction that ran instructions
+        continues of program_id of step_count steps each. Returns the step count to use next.
+        """
+        if result['meta']['err'] is not None:
+            if not is_compute_budget_exceeded(result['meta']['logMessages']):
+                return self.step_count(key)
+            return self.exceeded(key, step_count)
+        if on_return_data(result) is not None:
+            # The last continue executes less than step_count steps, its cost per step is meaningless
+            return self.step_count(key)
+        consumed = sum(consumed_compute_units(result, program_id))
+        if consumed == 0:
+            return self.step_count(key)
+        units_per_step = consumed / (step_count * instructions)
+        budget = self.units * self.target / instructions
+        steps = int(min(budget / units_per_step, step_count * self.max_growth))
+        return self._set(key, steps)
+
+    def exceeded(self, key, step_count):
+        """Halves the step count of key after a continue of step_count steps ran out of compute units."""
+        return self._set(key, step_count // 2)
+
+    def _set(self, key, steps):
+        steps = max(steps, self.min_steps)
+        with self._lock:
+            self._steps[key] = steps
+        return steps
+
+
+step_count_controller = StepCountController()
+
+
+def failed_instruction_index(err):
+    """Index of the instruction that made a transaction fail its preflight simulation, None if unknown."""
+    instruction_error = (err.result.get('data') or {}).get('err')
+    if isinstance(instruction_error, dict) and 'InstructionError' in instruction_error:
+        return instruction_error['InstructionError'][0]
+    return None
+
+
+class ContinueDriver:
+    """
+    Runs an iterative Neon transaction to the end, packing as many continue instructions
+    (0x14 or 0x0E, built by make_instruction(step_count)) into each Solana transaction as fit into
+    target of the compute budget, measured from the previous transaction, and into PACKET_DATA_SIZE.
+    The step count of every continue is taken from controller under key and updated from each result.
+    A continue after the one that finishes the Neon transaction fails the preflight simulation;
+    the transaction is then resent with only the instructions before the failed one.
+    """
+    def __init__(self, client, signer, make_instruction, key, controller=None, units=DEFAULT_UNITS, target=0.8):
+        self.client = client
+        self.signer = signer
+        self.make_instruction = make_instruction
+        self.key = key
+        self.controller = controller if controller is not None else step_count_controller
+        self.units = units
+        self.target = target
+        self.transactions = 0
+
+    def make_transaction(self, count, step_count):
+        trx = TransactionWithComputeBudget(units=self.units)
+        for _ in range(count):
+            trx.add(self.make_instruction(step_count))
+        return trx
+
+    def max_instructions(self, step_count):
+        """How many continue instructions fit into PACKET_DATA_SIZE."""
+        one = transaction_size(self.make_transaction(1, step_count), self.signer.public_key())
+        each = transaction_size(self.make_transaction(2, step_count), self.signer.public_key()) - one
+        return 1 + (PACKET_DATA_SIZE - one) // each
+
+    def run(self, max_transactions=1000):
+        """Sends continues until one of them returns OnReturn (0x06); returns that confirmed transaction."""
+        count = 1
+        for _ in range(max_transactions):
+            step_count = self.controller.step_count(self.key)
+            trx = self.make_transaction(count, step_count)
+            first = len(trx.instructions) - count
+            try:
+                result = send_transaction(self.client, trx, self.signer)["result"]
+            except SendTransactionError as err:
+                index = failed_instruction_index(err)
+                if index is not None and index > first:
+                    count = index - first
+                elif not is_compute_budget_exceeded(err):
+                    raise
+                elif count > 1:
+                    count //= 2
+                else:
+                    self.controller.exceeded(self.key, step_count)
+                continue
+            self.transactions += 1
+            if on_return_data(result) is not None:
+                return result
+            program_id = trx.instructions[-1].program_id
+            consumed = consumed_compute_units(result, program_id)
+            next_step_count = self.controller.update(self.key, step_count, result, count, program_id)
+            if consumed:
+                units_per_step = max(consumed) / step_count
+                count = int(self.units * self.target // (units_per_step * next_step_count))
+            count = min(max(count, 1), self.max_instructions(next_step_count))
+        raise RuntimeError("Iterative transaction isn't finished after {} transactions".format(max_transactions))
+
+
+TAG_EMPTY = 0
+TAG_FINALIZED_STORAGE = 5
+TAG_STORAGE = 30
+STORAGE_ACCOUNT_SIZE = 128 * 1024
+
+STORAGE_LAYOUT = cStruct(
+    "tag" / Int8ul,
+    "caller" / Bytes(20),
+    "nonce" / Int64ul,
+    "gas_limit" / Bytes(32),
+    "gas_price" / Bytes(32),
+    "slot" / Int64ul,
+    "operator" / Bytes(32),
+    "accounts_len" / Int64ul,
+    "executor_data_size" / Int64ul,
+    "evm_data_size" / Int64ul,
+    "gas_used_and_paid" / Bytes(32),
+    "number_of_payments" / Int64ul,
+    "signature" / Bytes(65),
+)
+
+
+def storage_account_tag(info):
+    """Tag of an account returned by get_multiple_accounts, None for a missing account."""
+    if info is None:
+        return None
+    data = base64.b64decode(info['data'][0])
+    return data[0] if data else TAG_EMPTY
+
+
+def storage_header(info):
+    """Decoded storage::Data header of a storage account with a transaction in progress, None otherwise."""
+    if storage_account_tag(info) != TAG_STORAGE:
+        return None
+    return STORAGE_LAYOUT.parse(base64.b64decode(info['data'][0]))
+
+
+def create_delete_account_instruction(operator, account, seed, loader_id=EVM_LOADER):
+    """DeleteHolderOrStorageAccount (0x10): returns the lamports of an account created with seed to its creator."""
+    return TransactionInstruction(
+        program_id=loader_id,
+        data=bytearray.fromhex("10") + bytes(seed, 'utf8'),
+        keys=[
+            AccountMeta(pubkey=account, is_signer=False, is_writable=True),
+            AccountMeta(pubkey=operator, is_signer=True, is_writable=True),
+        ])
+
+
+class StoragePool:
+    """
+    Storage accounts of an operator, created ahead of time with the seeds '<prefix><index>'.
+    acquire() hands out an account that is empty or holds a finalized transaction and keeps it
+    for the caller until release(); accounts with a transaction in progress are skipped.
+    When every account is taken the pool grows by one; reclaim() deletes the idle accounts
+    beyond the size the pool was created with.
+    """
+    def __init__(self, client, operator, size=8, prefix='storage', account_size=STORAGE_ACCOUNT_SIZE,
+                 loader_id=EVM_LOADER):
+        self.client = client
+        self.operator = operator
+        self.base_size = size
+        self.size = size
+        self.prefix = prefix
+        self.account_size = account_size
+        self.loader_id = loader_id
+        self._addresses = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def seed(self, index):
+        return '{}{}'.format(self.prefix, index)
+
+    def address(self, index):
+        if index not in self._addresses:
+            self._addresses[index] = accountWithSeed(self.operator.public_key(), self.seed(index),
+                                                     PublicKey(self.loader_id))
+        return self._addresses[index]
+
+    def index(self, account):
+        for (index, address) in self._addresses.items():
+            if address == account:
+                return index
+        raise ValueError("{} is not an account of the storage pool '{}'".format(account, self.prefix))
+
+    def _account_infos(self, indexes):
+        return get_multiple_accounts(self.client, [self.address(index) for index in indexes])
+
+    def _create(self, indexes):
+        if not indexes:
+            return
+        lamports = get_minimum_balance_for_rent_exemption(self.client, self.account_size)
+        operator = self.operator.public_key()
+        instructions = [createAccountWithSeed(operator, operator, self.seed(index), lamports, self.account_size,
+                                              PublicKey(self.loader_id))
+                        for index in indexes]
+        send_transactions(self.client, pack_instructions(instructions, operator), self.operator)
+
+    def provision(self):
+        """Creates the missing accounts of the pool with one account check; returns how many were created."""
+        indexes = range(self.size)
+        missing = [index for (index, info) in zip(indexes, self._account_infos(indexes)) if info is None]
+        self._create(missing)
+        return len(missing)
+
+    def in_progress(self):
+        """(account, storage header) pairs for the accounts of the pool with a transaction in progress."""
+        indexes = range(self.size)
+        headers = [(index, storage_header(info)) for (index, info) in zip(indexes, self._account_infos(indexes))]
+        return [(self.address(index), header) for (index, header) in headers if header is not None]
+
+    def acquire(self):
+        """
+        Returns an idle storage account, creating one when there is none. The accounts are checked
+        outside of the lock, which only guards claiming one of them. The account at the index
+        the pool grows to is adopted when it already exists and is idle, e.g. left by an earlier run.
+        """
+        while True:
+            with self._lock:
+                candidates = [index for index in range(self.size) if index not in self._busy]
+            tags = [storage_account_tag(info) for info in self._account_infos(candidates)] if candidates else []
+            idle = [index for (index, tag) in zip(candidates, tags) if tag in (TAG_EMPTY, TAG_FINALIZED_STORAGE)]
+            missing = [index for (index, tag) in zip(candidates, tags) if tag is None]
+            with self._lock:
+                free = [index for index in idle + missing if index not in self._busy]
+                if free:
+                    index = free[0]
+                else:
+                    index = self.size
+                    self.size += 1
+                self._busy.add(index)
+            if not free:
+                tag = storage_account_tag(self._account_infos([index])[0])
+                if tag not in (None, TAG_EMPTY, TAG_FINALIZED_STORAGE):
+                    # A transaction is in progress in it: it stays in the pool, the next one is tried
+                    self.release(self.address(index))
+                    continue
+            else:
+                tag = None if index in missing else TAG_EMPTY
+            if tag is None:
+                try:
+                    self._create([index])
+                except Exception:
+                    self.release(self.address(index))
+                    raise
+            return self.address(index)
+
+    def release(self, account):
+        """Returns an account given out by acquire() to the pool; raises ValueError for other accounts."""
+        index = self.index(account)
+        with self._lock:
+            self._busy.discard(index)
+
+    def reclaim(self, keep=None):
+        """
+        Deletes the idle accounts beyond the first keep ones (the size the pool was created with
+        by default) with DeleteHolderOrStorageAccount (0x10); returns how many were deleted.
+        """
+        keep = self.base_size if keep is None else keep
+        with self._lock:
+            upper = max([self.size] + [index + 1 for index in self._addresses])
+            candidates = [index for index in range(keep, upper) if index not in self._busy]
+            tags = [storage_account_tag(info) for info in self._account_infos(candidates)] if candidates else []
+            idle = [index for (index, tag) in zip(candidates, tags) if tag in (TAG_EMPTY, TAG_FINALIZED_STORAGE)]
+            if len(idle) + tags.count(None) == upper - keep:
+                self.size = min(self.size, keep)
+            self._busy.update(idle)
+        try:
+            operator = self.operator.public_key()
+            instructions = [create_delete_account_instruction(operator, self.address(index), self.seed(index),
+                                                              self.loader_id)
+                            for index in idle]
+            send_transactions(self.client, pack_instructions(instructions, operator), self.operator)
+        finally:
+            with self._lock:
+                self._busy.difference_update(idle)
+        return len(idle)
+
+
+HOLDER_REGISTRY = os.environ.get("HOLDER_REGISTRY", os.path.join(tempfile.gettempdir(), "neon_holder_ids.sqlite"))
+
+
+def holder_seed(holder_id):
+    """Seed of the holder account with the given id, as derived by the operator and the proxy."""
+    holder_id_bytes = holder_id.to_bytes((holder_id.bit_length() + 7) // 8, 'big')
+    return keccak_256(b'holder' + holder_id_bytes).hexdigest()[:32]
+
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class HolderIdRegistry:
+    """
+    Holder ids in use, kept in an SQLite database shared by all the processes on the host.
+    allocate() takes the lowest free id of an operator inside an exclusive transaction, so that
+    threads and processes never get the same id. Ids held by processes that are gone are reused.
+    """
+    def __init__(self, path=HOLDER_REGISTRY, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        db = self._connect()
+        try:
+            db.execute("CREATE TABLE IF NOT EXISTS holder_ids "
+                       "(operator TEXT NOT NULL, id INTEGER NOT NULL, pid INTEGER NOT NULL, PRIMARY KEY (operator, id))")
+        finally:
+            db.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def allocate(self, operator):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            held = db.execute("SELECT id, pid FROM holder_ids WHERE operator = ?", (str(operator),)).fetchall()
+            stale = [holder_id for (holder_id, pid) in held if pid != os.getpid() and not _is_process_alive(pid)]
+            db.executemany("DELETE FROM holder_ids WHERE operator = ? AND id = ?",
+                           [(str(operator), holder_id) for holder_id in stale])
+            used = set(holder_id for (holder_id, _) in held) - set(stale)
+            holder_id = next(holder_id for holder_id in range(len(used) + 1) if holder_id not in used)
+            db.execute("INSERT INTO holder_ids VALUES (?, ?, ?)", (str(operator), holder_id, os.getpid()))
+            db.execute("COMMIT")
+            return holder_id
+        except Exception:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def release(self, operator, holder_id):
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM holder_ids WHERE operator = ? AND id = ?", (str(operator), holder_id))
+        finally:
+            db.close()
+
+
+class HolderPool:
+    """
+    Holder accounts of an operator for running deploys in parallel. acquire() returns a
+    (holder id, holder account) pair with an id allocated through the registry and creates the
+    account if needed; provision() creates the accounts for the first size ids ahead of time.
+    Accounts are created with account_size bytes; a holder too small for the message it is acquired
+    for is deleted and created again with the size of the message.
+    """
+    def __init__(self, client, operator, size=4, account_size=128 * 1024, loader_id=EVM_LOADER, registry=None):
+        self.client = client
+        self.operator = operator
+        self.size = size
+        self.account_size = account_size
+        self.loader_id = loader_id
+        self.registry = registry or HolderIdRegistry()
+        self._addresses = {}
+        self._held = set()
+        self._sizes = {}  # holder id -> size of its account, once checked
+        self._lock = threading.Lock()
+
+    def address(self, holder_id):
+        if holder_id not in self._addresses:
+            self._addresses[holder_id] = accountWithSeed(self.operator.public_key(), holder_seed(holder_id),
+                                                         PublicKey(self.loader_id))
+        return self._addresses[holder_id]
+
+    def _create(self, holder_ids, size=0):
+        """
+        Creates the accounts of holder_ids that don't exist yet with one account check, and recreates
+        the ones smaller than size; returns how many were created.
+        """
+        size = max(size, self.account_size)
+        holder_ids = [holder_id for holder_id in holder_ids if self._sizes.get(holder_id, 0) < size]
+        infos = get_multiple_accounts(self.client, [self.address(holder_id) for holder_id in holder_ids])
+        sizes = {holder_id: len(base64.b64decode(info['data'][0])) for (holder_id, info) in zip(holder_ids, infos)
+                 if info is not None}
+        small = [holder_id for holder_id in holder_ids if sizes.get(holder_id, size) < size]
+        missing = [holder_id for holder_id in holder_ids if holder_id not in sizes] + small
+        operator = self.operator.public_key()
+        if small:
+            instructions = [create_delete_account_instruction(operator, self.address(holder_id), holder_seed(holder_id),
+                                                              self.loader_id)
+                            for holder_id in small]
+            send_transactions(self.client, pack_instructions(instructions, operator), self.operator)
+        if missing:
+            lamports = get_minimum_balance_for_rent_exemption(self.client, size)
+            instructions = [createAccountWithSeed(operator, operator, holder_seed(holder_id), lamports,
+                                                  size, PublicKey(self.loader_id))
+                            for holder_id in missing]
+            send_transactions(self.client, pack_instructions(instructions, operator), self.operator)
+        with self._lock:
+            self._sizes.update(sizes)
+            self._sizes.update((holder_id, size) for holder_id in missing)
+        return len(missing)
+
+    def provision(self):
+        """Creates the missing accounts for the ids 0..size-1; returns how many were created."""
+        return self._create(range(self.size))
+
+    def acquire(self, message_size=0):
+        """Allocates a holder id whose account holds a message of message_size bytes after its tag."""
+        holder_id = self.registry.allocate(self.operator.public_key())
+        with self._lock:
+            self._held.add(holder_id)
+        try:
+            self._create([holder_id], message_size + 1)
+        except Exception:
+            self.release(holder_id)
+            raise
+        return (holder_id, self.address(holder_id))
+
+    def release(self, holder_id):
+        with self._lock:
+            self._held.discard(holder_id)
+        self.registry.release(self.operator.public_key(), holder_id)
+
+    def close(self):
+        """Releases all the ids acquired from this pool."""
+        for holder_id in list(self._held):
+            self.release(holder_id)
+
+
 def evm_step_cost():
     operator_expences = PAYMENT_TO_TREASURE + LAMPORTS_PER_SIGNATURE
     return math.floor(operator_expences / EVM_STEPS)
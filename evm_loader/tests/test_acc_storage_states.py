@@ -2,11 +2,11 @@ import unittest
 from base58 import b58decode
 from solana_utils import *
 from spl.token.instructions import get_associated_token_address
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from eth_utils import abi
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
@@ -50,10 +50,14 @@ class storage_states(unittest.TestCase):
         print('contract_eth', cls.reId_eth.hex())
         print('contract_code', cls.re_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+        cls.first_instruction_index = len(TransactionWithComputeBudget().instructions)
 
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
     def sol_instr_19_partial_call(self, storage_account, step_count, evm_instruction, writable_code, acc, caller,
                                   add_meta=[]):
@@ -126,17 +130,13 @@ class storage_states(unittest.TestCase):
     def call_begin(self, storage, steps, msg, instruction, writable_code, acc, caller, add_meta=[]):
         print("Begin")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 13)))
-        trx.add(self.sol_instr_19_partial_call(storage, steps, instruction, writable_code, acc, caller, add_meta))
+        add_signed_instructions(trx, [(self.sol_instr_19_partial_call(storage, steps, instruction, writable_code, acc, caller, add_meta), len(msg), 13)])
         return send_transaction(client, trx, acc)
 
     def call_begin_0D(self, storage, steps, msg, instruction, writable_code, acc, caller, add_meta=[]):
         print("Begin, combined mode")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 13)))
-        trx.add(self.sol_instr_13_partial_call_or_continue(storage, steps, instruction, writable_code, acc, caller, add_meta))
+        add_signed_instructions(trx, [(self.sol_instr_13_partial_call_or_continue(storage, steps, instruction, writable_code, acc, caller, add_meta), len(msg), 13)])
         return send_transaction(client, trx, acc)
 
     def call_continue(self, storage, steps, writable_code, acc, caller, add_meta=[]):
@@ -159,10 +159,6 @@ class storage_states(unittest.TestCase):
         assert (from_addr == caller_ether)
         return (from_addr, sign, msg, nonce)
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-            AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False), ])
-
     def create_storage_account(self, seed, acc):
         storage = PublicKey(
             sha256(bytes(acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
@@ -6,13 +6,12 @@ from eth_utils import abi
 from base58 import b58decode
 import random
 
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from solana_utils import *
 
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
-holder_id = 0
 
 class BlockHashesTest(unittest.TestCase):
     @classmethod
@@ -48,9 +47,13 @@ class BlockHashesTest(unittest.TestCase):
         print("contract id: ", cls.owner_contract, cls.eth_contract.hex())
         print("code id: ", cls.contract_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
     def send_transaction(self, data, no_sys_acc = False):
         trx = self.make_transactions(data, no_sys_acc)
@@ -73,19 +76,9 @@ class BlockHashesTest(unittest.TestCase):
         trx_data = self.caller_ether + sign + msg
 
         solana_trx = TransactionWithComputeBudget()
-        solana_trx.add(
-                self.sol_instr_keccak(make_keccak_instruction_data(len(solana_trx.instructions) + 1, len(msg), 5)) 
-            ).add( 
-                self.sol_instr_call(trx_data, no_sys_acc) 
-            )
-
+        add_signed_instructions(solana_trx, [(self.sol_instr_call(trx_data, no_sys_acc), len(msg), 5)])
         return solana_trx
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-                    AccountMeta(pubkey=keccakprog, is_signer=False, is_writable=False),
-                ])
-
     def sol_instr_call(self, trx_data, no_sys_acc):
         blockhash_sysvar_accountmeta = AccountMeta(pubkey="SysvarRecentB1ockHashes11111111111111111111", is_signer=False, is_writable=False)
         neon_evm_instr_05_single = create_neon_evm_instr_05_single(
@@ -4,7 +4,7 @@ import unittest
 from eth_utils import abi
 from spl.token.instructions import get_associated_token_address
 
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from solana_utils import *
 
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
@@ -36,10 +36,13 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         print("Caller:", cls.caller_ether.hex(), cls.caller_nonce, "->", cls.caller,
               "({})".format(bytes(PublicKey(cls.caller)).hex()))
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
 
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
     def deploy_contract(self):
         print("deploy contract: ")
@@ -53,7 +56,7 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         print("code id: ", code_sol_address)
         return (sol_address, eth_address, code_sol_address)
 
-    def make_transactions(self, contract_eth, owner_contract, contract_code, nonce, position):
+    def make_transactions(self, contract_eth, owner_contract, contract_code, nonce):
         if nonce is None:
             nonce = getTransactionCount(client, self.caller)
 
@@ -68,16 +71,10 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         }
         (_from_addr, sign, msg) = make_instruction_data_from_tx(tx, self.acc.secret_key())
         trx_data = self.caller_ether + sign + msg
-        keccak_instruction = make_keccak_instruction_data(position, len(msg), 5)
-        
-        keccak_tx = self.sol_instr_keccak(keccak_instruction)
-        call_tx = self.sol_instr_call(trx_data, owner_contract, contract_code)
-        return (keccak_tx, call_tx)
-
-    def sol_instr_keccak(self, keccak_instruction):
-        return  TransactionInstruction(program_id="KeccakSecp256k11111111111111111111111111111", data=keccak_instruction, keys=[
-                    AccountMeta(pubkey=self.caller, is_signer=False, is_writable=False),
-                ])
+        return (self.sol_instr_call(trx_data, owner_contract, contract_code), len(msg), 5)
+
+    def add_calls(self, trx, calls):
+        add_signed_instructions(trx, calls, keccak_keys=[AccountMeta(pubkey=self.caller, is_signer=False, is_writable=False)])
     
     def sol_instr_call(self, trx_data, owner_contract, contract_code):
         return TransactionInstruction(
@@ -112,11 +109,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
         trx = TransactionWithComputeBudget()
         init_nonce = getTransactionCount(client, self.caller)
-        (keccak_tx_1, call_tx_1) = self.make_transactions(eth_contract, owner_contract, contract_code, init_nonce, len(trx.instructions) + 1)
-        init_nonce += 1
-        (keccak_tx_2, call_tx_2) = self.make_transactions(eth_contract, owner_contract, contract_code, init_nonce, len(trx.instructions) + 3)
-
-        trx.add( keccak_tx_1 ).add( call_tx_1 ).add( keccak_tx_2 ).add( call_tx_2 )
+        self.add_calls(trx, [self.make_transactions(eth_contract, owner_contract, contract_code, init_nonce),
+                             self.make_transactions(eth_contract, owner_contract, contract_code, init_nonce + 1)])
 
         err = "Program failed to complete"
         with self.assertRaisesRegex(Exception,err):
@@ -136,8 +130,7 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         code_balance_pre = getBalance(contract_code)
 
         trx = TransactionWithComputeBudget()
-        (keccak_tx_1, call_tx_1) = self.make_transactions(eth_contract, owner_contract, contract_code, None, len(trx.instructions) + 1)
-        trx.add( keccak_tx_1 ).add( call_tx_1 )
+        self.add_calls(trx, [self.make_transactions(eth_contract, owner_contract, contract_code, None)])
 
         send_transaction(client, trx, self.acc)
 
@@ -6,10 +6,9 @@ from spl.token.constants import TOKEN_PROGRAM_ID, ASSOCIATED_TOKEN_PROGRAM_ID, A
 from spl.token.instructions import get_associated_token_address, initialize_account, InitializeAccountParams
 from sha3 import keccak_256
 from hashlib import sha256
-from random import randrange
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
@@ -17,7 +16,6 @@ ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
 contract_name = "helloWorld.binary"
 # "ERC20Wrapper.binary"
 
-holder_id = 0
 
 from construct import Bytes, Int8ul, Int64ul, Struct as cStruct
 from solana._layouts.system_instructions import SYSTEM_INSTRUCTIONS_LAYOUT, InstructionType as SystemInstructionType
@@ -27,13 +25,6 @@ CREATE_ACCOUNT_LAYOUT = cStruct(
     "nonce" / Int8ul
 )
 
-def write_holder_layout(nonce, offset, data):
-    return (bytes.fromhex('12') +
-            nonce.to_bytes(8, byteorder='little') +
-            offset.to_bytes(4, byteorder='little') +
-            len(data).to_bytes(8, byteorder='little') +
-            data)
-
 class DeployTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -61,22 +52,21 @@ class DeployTest(unittest.TestCase):
         print("Caller:", cls.caller_ether.hex(), cls.caller_nonce, "->", cls.caller,
               "({})".format(bytes(PublicKey(cls.caller)).hex()))
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
 
-    def create_holder_account_with_deploying_transaction(self):
-        holder_id_bytes = holder_id.to_bytes((holder_id.bit_length() + 7) // 8, 'big')
-        seed = keccak_256(b'holder'+holder_id_bytes).hexdigest()[:32]
-        # Create transaction holder account (if not exists)
-        holder = PublicKey(sha256(bytes(self.operator_acc.public_key())+bytes(seed, 'utf8')+bytes(PublicKey(evm_loader_id))).digest())
-        print("Holder", holder)
-        if getBalance(holder) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.operator_acc.public_key(), self.operator_acc.public_key(), seed, 10**9, 128*1024, PublicKey(evm_loader_id)))
-            result = send_transaction(client, trx, self.operator_acc)
-            print(result)
+        cls.storage_pool = StoragePool(client, cls.operator_acc, size=2, prefix='deploy_storage')
+        cls.storage_pool.provision()
+        cls.holder_pool = HolderPool(client, cls.operator_acc, size=2)
+        cls.holder_pool.provision()
+
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
+        cls.holder_pool.close()
 
+    def create_holder_account_with_deploying_transaction(self):
         # Get nonce for caller
         trx_count = getTransactionCount(client, self.caller)
 
@@ -106,26 +96,13 @@ class DeployTest(unittest.TestCase):
         msg = sign + len(msg).to_bytes(8, byteorder="little") + msg
         #print("msg", msg.hex())
 
+        (holder_id, holder) = self.holder_pool.acquire(len(msg))
+        self.addCleanup(self.holder_pool.release, holder_id)
+        print("Holder", holder)
+
         # Write transaction to transaction holder account
-        offset = 0
-        receipts = []
-        rest = msg
-        while len(rest):
-            (part, rest) = (rest[:950], rest[950:])
-            trx = TransactionWithComputeBudget()
-            trx.add(TransactionInstruction(program_id=evm_loader_id,
-                data=write_holder_layout(holder_id, offset, part),
-                keys=[
-                    AccountMeta(pubkey=holder, is_signer=False, is_writable=True),
-                    AccountMeta(pubkey=self.operator_acc.public_key(), is_signer=True, is_writable=False),
-                ]))
-            receipts.append(client.send_transaction(trx, self.operator_acc, opts=TxOpts(skip_confirmation=True,
-                                                                                        preflight_commitment="confirmed"))["result"])
-            offset += len(part)
+        receipts = HolderUploader(client, self.operator_acc, holder, holder_id).upload(msg)
         print("receipts", receipts)
-        for rcpt in receipts:
-            confirm_transaction(client, rcpt)
-            print("confirmed:", rcpt)
 
         base = self.operator_acc.public_key()
         seed = b58encode(ACCOUNT_SEED_VERSION+contract_eth).decode('utf8')
@@ -204,54 +181,60 @@ class DeployTest(unittest.TestCase):
         print('neon_evm_instr_20_continue:', neon_evm_instr_20_continue)
         return neon_evm_instr_20_continue
 
-    def create_storage_account(self, seed=str(randrange(1000000000))):
-        storage = PublicKey(sha256(bytes(self.operator_acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
+    def create_storage_account(self):
+        storage = self.storage_pool.acquire()
+        self.addCleanup(self.storage_pool.release, storage)
         print("Storage", storage)
-
-        minimum_balance = client.get_minimum_balance_for_rent_exemption(128*1024, commitment=Confirmed)["result"]
-        print("Minimum balance required for account {}".format(minimum_balance))
-
-        if getBalance(storage) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.operator_acc.public_key(), self.operator_acc.public_key(), seed, minimum_balance, 128*1024, PublicKey(evm_loader_id)))
-            send_transaction(client, trx, self.operator_acc)
-
         return storage
 
     def call_partial_signed_and_continues(self, holder, contract_sol, code_sol):
         storage = self.create_storage_account()
 
-        print("Begin")
-        trx = TransactionWithComputeBudget()
-        trx.add(self.sol_instr_22_partial_call(storage, 50, holder, contract_sol, code_sol))
-        print(trx.instructions[-1].keys)
-        result = send_transaction(client, trx, self.operator_acc)["result"]
+        key = step_count_controller.key(contract_sol, bytes(4))
 
         while (True):
-            print("Continue")
+            print("Begin")
+            step_count = step_count_controller.step_count(key)
             trx = TransactionWithComputeBudget()
-            trx.add(self.sol_instr_20_continue(storage, 50, contract_sol, code_sol))
+            trx.add(self.sol_instr_22_partial_call(storage, step_count, holder, contract_sol, code_sol))
             print(trx.instructions[-1].keys)
-            result = send_transaction(client, trx, self.operator_acc)["result"]
-
-            if (result['meta']['innerInstructions'] and result['meta']['innerInstructions'][0]['instructions']):
-                data = b58decode(result['meta']['innerInstructions'][0]['instructions'][-1]['data'])
-                if (data[0] == 6):
-                    # Check if storage balace were filled to rent exempt
-                    self.assertGreaterEqual(
-                        getBalance(storage),
-                        client.get_minimum_balance_for_rent_exemption(128*1024, commitment=Confirmed)["result"])
-                    return result
+            try:
+                result = send_transaction(client, trx, self.operator_acc)["result"]
+            except SendTransactionError as err:
+                if not is_compute_budget_exceeded(err):
+                    raise
+                step_count_controller.exceeded(key, step_count)
+                continue
+            step_count_controller.update(key, step_count, result)
+            break
+
+        print("Continue")
+        result = ContinueDriver(client, self.operator_acc, key=key, make_instruction=lambda step_count:
+                                self.sol_instr_20_continue(storage, step_count, contract_sol, code_sol)).run()
+        # Check if storage balace were filled to rent exempt
+        self.assertGreaterEqual(
+            getBalance(storage),
+            get_minimum_balance_for_rent_exemption(client, 128*1024))
+        return result
 
     def call_instr_14_several_times(self, holder, contract_sol, code_sol):
         storage = self.create_storage_account()
 
+        key = step_count_controller.key(contract_sol, bytes(4))
         while (True):
             print("Continue")
+            step_count = step_count_controller.step_count(key)
             trx = TransactionWithComputeBudget()
-            trx.add(self.sol_instr_14_partial_call_or_continue(storage, 50, holder, contract_sol, code_sol))
+            trx.add(self.sol_instr_14_partial_call_or_continue(storage, step_count, holder, contract_sol, code_sol))
             print(trx.instructions[-1].keys)
-            result = send_transaction(client, trx, self.operator_acc)["result"]
+            try:
+                result = send_transaction(client, trx, self.operator_acc)["result"]
+            except SendTransactionError as err:
+                if not is_compute_budget_exceeded(err):
+                    raise
+                step_count_controller.exceeded(key, step_count)
+                continue
+            step_count_controller.update(key, step_count, result)
             print('result:', result)
             if result['meta']['innerInstructions'] and result['meta']['innerInstructions'][-1]['instructions']:
                 data = b58decode(result['meta']['innerInstructions'][-1]['instructions'][-1]['data'])
@@ -259,7 +242,7 @@ class DeployTest(unittest.TestCase):
                     # Check if storage balace were filled to rent exempt
                     self.assertGreaterEqual(
                         getBalance(storage),
-                        client.get_minimum_balance_for_rent_exemption(128*1024, commitment=Confirmed)["result"])
+                        get_minimum_balance_for_rent_exemption(client, 128*1024))
                     return result
 
     def test_01_executeTrxFromAccountDataIterative(self):
@@ -5,12 +5,12 @@ from base58 import b58decode
 from solana_utils import *
 from spl.token.constants import TOKEN_PROGRAM_ID, ASSOCIATED_TOKEN_PROGRAM_ID
 from spl.token.instructions import get_associated_token_address
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from eth_utils import abi
 from decimal import Decimal
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 sysinstruct = "Sysvar1nstructions1111111111111111111111111"
@@ -50,12 +50,17 @@ class EthTokenTest(unittest.TestCase):
         print ('contract_eth', cls.reId_eth.hex())
         print ('contract_code', cls.re_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+        cls.first_instruction_index = len(TransactionWithComputeBudget().instructions)
 
         cls.storage = cls.create_storage_account(cls, 'EthTokenTest')
 
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
+
     def sol_instr_19_partial_call(self, storage_account, step_count, evm_instruction, additional_accounts = []):
         neon_evm_instr_19_partial_call = create_neon_evm_instr_19_partial_call(
             self.loader.loader_id,
@@ -89,16 +94,10 @@ class EthTokenTest(unittest.TestCase):
         print('neon_evm_instr_20_continue:', neon_evm_instr_20_continue)
         return neon_evm_instr_20_continue
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-                AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False), ])
-
     def call_begin(self, storage, steps, msg, instruction, additional_accounts = []):
         print("Begin")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 13)))
-        trx.add(self.sol_instr_19_partial_call(storage, steps, instruction, additional_accounts))
+        add_signed_instructions(trx, [(self.sol_instr_19_partial_call(storage, steps, instruction, additional_accounts), len(msg), 13)])
         return send_transaction(client, trx, self.acc)
 
     def call_continue(self, storage, steps, additional_accounts = []):
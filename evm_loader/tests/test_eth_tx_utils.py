@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import unittest
+from web3.auto import w3
+from eth_keys import keys as eth_keys
+
+import eth_tx_utils
+from eth_tx_utils import Trx, decode, pack, unpack, make_instruction_data_from_tx, make_instruction_data_from_txs, \
+    make_keccak_instruction_data, read_transactions, read_instruction_data
+
+private_key = bytes.fromhex('11223344556677889900aabbccddeeff11223344556677889900aabbccddeeff')
+
+
+def make_raw_trx(data, to=None, nonce=0):
+    tx = {'to': to, 'value': 0, 'gas': 999999999, 'gasPrice': 0, 'nonce': nonce, 'data': data, 'chainId': 111}
+    return w3.eth.account.sign_transaction(tx, private_key).rawTransaction
+
+
+class EthTxUtilsTest(unittest.TestCase):
+    def test_01_decode_returns_views(self):
+        raw = bytearray(pack([b'\x01' * 60, 5, None, [b'abc', ()]]))
+        (item, end) = decode(memoryview(raw))
+        self.assertEqual(end, len(raw))
+        self.assertIsInstance(item[0], memoryview)
+        self.assertEqual(item[0].obj, raw)
+        self.assertEqual(item[1:3], [5, None])
+        self.assertEqual(item[3][0].tobytes(), b'abc')
+        self.assertEqual(item[3][1], ())
+        self.assertEqual(unpack(memoryview(raw))[0], [b'\x01' * 60, 5, None, [b'abc', ()]])
+
+    def test_02_decode_truncated(self):
+        raw = pack([b'\x01' * 60])
+        with self.assertRaises(Exception):
+            decode(memoryview(raw[:-1]))
+
+    def test_03_pack(self):
+        self.assertEqual(pack('dog').hex(), '83646f67')
+        self.assertEqual(pack(['cat', 'dog']).hex(), 'c88363617483646f67')
+        self.assertEqual(pack([]).hex(), 'c0')
+        self.assertEqual(pack(None).hex(), '80')
+        self.assertEqual(pack(1024).hex(), '820400')
+        self.assertEqual(pack([[], [[]], [[], [[]]]]).hex(), 'c7c0c1c0c3c0c1c0')
+        self.assertEqual(pack(b'\x01' * 56), bytes.fromhex('b838') + b'\x01' * 56)
+        self.assertEqual(pack(memoryview(b'\x01' * 56)), pack(b'\x01' * 56))
+        self.assertEqual(pack([b'\x01' * 60] * 2), bytes.fromhex('f87c') + (bytes.fromhex('b83c') + b'\x01' * 60) * 2)
+
+    def test_04_trx_from_string(self):
+        raw = make_raw_trx(b'\x02' * 40000, to=bytes(20), nonce=7)
+        trx = Trx.fromString(raw)
+        self.assertEqual(trx.nonce, 7)
+        self.assertEqual(trx.toAddress, bytes(20))
+        self.assertEqual(trx.callData, b'\x02' * 40000)
+        self.assertEqual(trx.chainId(), 111)
+        self.assertEqual(str(trx), raw.hex().replace('0x', ''))
+
+    def test_05_trx_from_many(self):
+        raws = [make_raw_trx(bytes([nonce]) * 100, nonce=nonce) for nonce in range(1, 4)]
+        trxs = list(Trx.from_many(raws + [raws[0].hex()]))
+        self.assertEqual([trx.nonce for trx in trxs], [1, 2, 3, 1])
+        self.assertEqual(trxs[2].callData, b'\x03' * 100)
+
+    def test_06_trx_caches_payload_and_sender(self):
+        raw = make_raw_trx(b'\x04' * 100, nonce=5)
+        trx = Trx.fromString(raw)
+        msg = trx.get_msg()
+        self.assertIs(trx.get_msg(111), msg)
+        self.assertIs(trx.hash(), trx.hash())
+        sender = trx.sender()
+        self.assertIs(trx.public_key(), trx.public_key())
+        self.assertEqual(sender, w3.eth.account.from_key(private_key).address[2:].lower())
+
+        trx.nonce = 6
+        self.assertNotEqual(trx.get_msg(), msg)
+        self.assertNotEqual(trx.sender(), sender)
+        with self.assertRaises(AttributeError):
+            trx.unknown = 1
+
+    def test_07_make_instruction_data_from_txs(self):
+        txs = [{'to': None, 'value': 0, 'gas': 999999999, 'gasPrice': 0, 'nonce': nonce, 'data': bytes(nonce),
+                'chainId': 111} for nonce in range(1, 20)]
+        expected = [make_instruction_data_from_tx(tx, private_key) for tx in txs]
+        self.assertEqual(list(make_instruction_data_from_txs(txs, private_key, workers=2, chunk_size=3)), expected)
+        self.assertEqual(list(make_instruction_data_from_txs(txs, [private_key] * len(txs), workers=1)), expected)
+
+    def test_08_known_signer_matches_recovery(self):
+        tx = {'to': bytes(20), 'value': 0, 'gas': 999999999, 'gasPrice': 0, 'nonce': 1, 'data': b'', 'chainId': 111}
+        (from_addr, sign, msg) = make_instruction_data_from_tx(tx, private_key)
+        self.assertEqual(make_instruction_data_from_tx(tx, '0x' + private_key.hex()), (from_addr, sign, msg))
+        self.assertEqual(make_instruction_data_from_tx(tx, private_key.hex()), (from_addr, sign, msg))
+        self.assertEqual(make_instruction_data_from_tx(tx, eth_keys.PrivateKey(private_key)), (from_addr, sign, msg))
+
+        raw = w3.eth.account.sign_transaction(tx, private_key).rawTransaction
+        self.assertEqual(make_instruction_data_from_tx(raw.hex()), (from_addr, sign, msg))
+
+        eth_tx_utils.CHECK_SIGNER = True
+        try:
+            self.assertEqual(make_instruction_data_from_tx(tx, private_key), (from_addr, sign, msg))
+        finally:
+            eth_tx_utils.CHECK_SIGNER = False
+
+    def test_09_keccak_instruction_data(self):
+        single = make_keccak_instruction_data(1, 100, 5)
+        self.assertEqual(single.hex(), '01' + '1900' + '01' + '0500' + '01' + '5a00' + '6400' + '01')
+        with self.assertRaises(Exception):
+            make_keccak_instruction_data(256, 100, 5)
+
+    def test_10_access_list_trx(self):
+        access_list = [(bytes.fromhex('de0b295669a9fd93d5f28d9ec85e40f4cb697bae'), [bytes(31) + b'\x03', bytes(32)]),
+                       (bytes.fromhex('bb9bc244d798123fde783fcc1c72d3bb8c189413'), [])]
+        tx = {'type': 1, 'to': bytes(20), 'value': 0, 'gas': 999999999, 'gasPrice': 1, 'nonce': 2, 'data': b'\x05' * 70,
+              'chainId': 111, 'accessList': [{'address': w3.toChecksumAddress(address),
+                                              'storageKeys': ['0x' + key.hex() for key in keys]}
+                                             for (address, keys) in access_list]}
+        raw = w3.eth.account.sign_transaction(tx, private_key).rawTransaction
+        trx = Trx.fromString(raw)
+        self.assertEqual(trx.trxType, 1)
+        self.assertEqual(trx.chainId(), 111)
+        self.assertEqual(trx.access_list, access_list)
+        self.assertEqual(trx.callData, b'\x05' * 70)
+        self.assertEqual(str(trx), raw.hex().replace('0x', ''))
+        self.assertEqual(trx.sender(), w3.eth.account.from_key(private_key).address[2:].lower())
+        with self.assertRaises(Exception):
+            make_instruction_data_from_tx(raw.hex())
+
+    def test_11_read_replay_file(self):
+        raws = [make_raw_trx(bytes([nonce]) * 500, nonce=nonce) for nonce in range(1, 10)]
+        lines = []
+        for (i, raw) in enumerate(raws):
+            if i % 3 == 0:
+                lines.append(raw.hex())
+            elif i % 3 == 1:
+                lines.append(json.dumps(raw.hex()))
+            else:
+                lines.append(json.dumps({'rawTransaction': raw.hex(), 'slot': i}))
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('\n'.join(lines[:4]) + '\n\n' + '\n'.join(lines[4:]))
+        try:
+            self.assertEqual([trx.nonce for trx in read_transactions(f.name)], list(range(1, 10)))
+            expected = [make_instruction_data_from_tx(raw.hex()) for raw in raws]
+            self.assertEqual(list(read_instruction_data(f.name, workers=1)), expected)
+            self.assertEqual(list(read_instruction_data(f.name)), expected)
+            self.assertEqual(list(read_instruction_data(f.name, workers=2, chunk_bytes=2000)), expected)
+        finally:
+            os.remove(f.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
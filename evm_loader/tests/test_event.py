@@ -5,11 +5,11 @@ from base58 import b58decode
 from solana_utils import *
 from spl.token.constants import TOKEN_PROGRAM_ID, ASSOCIATED_TOKEN_PROGRAM_ID, ACCOUNT_LEN
 from spl.token.instructions import get_associated_token_address
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from eth_utils import abi
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 
@@ -46,9 +46,17 @@ class EventTest(unittest.TestCase):
         print ('contract_eth', cls.reId_eth.hex())
         print ('contract_code', cls.re_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+        cls.first_instruction_index = len(TransactionWithComputeBudget().instructions)
+
+        cls.storage_pool = StoragePool(client, cls.acc, size=2, prefix='event_storage')
+        cls.storage_pool.provision()
+
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
     def sol_instr_05(self, evm_instruction):
         neon_evm_instr_05_single = create_neon_evm_instr_05_single(
@@ -111,9 +119,7 @@ class EventTest(unittest.TestCase):
     def call_begin(self, storage, steps, msg, instruction):
         print("Begin")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 13)))
-        trx.add(self.sol_instr_19_partial_call(storage, steps, instruction))
+        add_signed_instructions(trx, [(self.sol_instr_19_partial_call(storage, steps, instruction), len(msg), 13)])
         return send_transaction(client, trx, self.acc)
 
     def call_continue(self, storage, steps):
@@ -136,35 +142,24 @@ class EventTest(unittest.TestCase):
         assert (from_addr == self.caller_ether)
         return (from_addr, sign, msg, nonce)
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-                AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False), ])
-
     def call_signed(self, input):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
 
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 5)))
-        trx.add(self.sol_instr_05(from_addr + sign + msg))
+        add_signed_instructions(trx, [(self.sol_instr_05(from_addr + sign + msg), len(msg), 5)])
         return send_transaction(client, trx, self.acc)["result"]
 
-    def create_storage_account(self, seed):
-        storage = PublicKey(sha256(bytes(self.acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
+    def create_storage_account(self):
+        storage = self.storage_pool.acquire()
+        self.addCleanup(self.storage_pool.release, storage)
         print("Storage", storage)
-
-        if getBalance(storage) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.acc.public_key(), self.acc.public_key(), seed, 10**9, 128*1024, PublicKey(evm_loader_id)))
-            send_transaction(client, trx, self.acc)
-
         return storage
 
     def call_partial_signed(self, input):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[:8].hex())
+        storage = self.create_storage_account()
         self.call_begin(storage, 0, msg, instruction)
 
         while (True):
@@ -312,11 +307,10 @@ class EventTest(unittest.TestCase):
         assert (from_addr2 == self.caller_ether)
 
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg1), 5)))
-        trx.add(self.sol_instr_05(from_addr1 + sign1 + msg1))
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 3, len(msg2), 5)))
-        trx.add(self.sol_instr_05(from_addr2 + sign2 + msg2))
+        indexes = add_signed_instructions(trx, [
+            (self.sol_instr_05(from_addr1 + sign1 + msg1), len(msg1), 5),
+            (self.sol_instr_05(from_addr2 + sign2 + msg2), len(msg2), 5),
+        ])
 
         result = send_transaction(client, trx, self.acc)["result"]
         print("test_events_of_different_instructions(self): result:")
@@ -329,8 +323,7 @@ class EventTest(unittest.TestCase):
         self.assertEqual(result['meta']['err'], None)
         self.assertEqual(len(result['meta']['innerInstructions']), 2) # two transaction-instructions contain events and return_value
 
-        self.assertEqual(result['meta']['innerInstructions'][0]['index'], self.first_instruction_index + 1)  # second instruction
-        self.assertEqual(result['meta']['innerInstructions'][1]['index'], self.first_instruction_index + 3)  # second instruction
+        self.assertEqual([inner['index'] for inner in result['meta']['innerInstructions']], indexes)
 
         # log sol_instr_05(from_addr1 + sign1 + msg1)
         # self.assertEqual(len(result['meta']['innerInstructions'][0]['instructions']), 3)
@@ -379,7 +372,7 @@ class EventTest(unittest.TestCase):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[:8].hex())
+        storage = self.create_storage_account()
 
         result = self.call_begin(storage, 10, msg, instruction)
         result = self.call_continue(storage, 10)
@@ -398,7 +391,7 @@ class EventTest(unittest.TestCase):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[:8].hex())
+        storage = self.create_storage_account()
 
         caller_balance_before_cancel = self.token.balance(self.caller_token)
         operator_balance_before_cancel = self.token.balance(get_associated_token_address(self.acc.public_key(), ETH_TOKEN_MINT_ID))
@@ -421,7 +414,7 @@ class EventTest(unittest.TestCase):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[-8:].hex())
+        storage = self.create_storage_account()
 
         result = self.call_begin(storage, 10, msg, instruction)
         result = self.call_continue(storage, 10)
@@ -440,7 +433,7 @@ class EventTest(unittest.TestCase):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[-8:].hex())
+        storage = self.create_storage_account()
 
         result = self.call_begin(storage, 10, msg, instruction)
         result = self.call_continue(storage, 10)
@@ -460,7 +453,7 @@ class EventTest(unittest.TestCase):
         (from_addr, sign, msg, nonce) = self.get_call_parameters(input)
         instruction = from_addr + sign + msg
 
-        storage = self.create_storage_account(sign[:8].hex())
+        storage = self.create_storage_account()
 
         nonce_before = getTransactionCount(client, self.caller)
 
@@ -3,7 +3,7 @@ from random import randrange
 from base58 import b58decode
 from sha3 import keccak_256
 from solana_utils import *
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx, Trx
+from eth_tx_utils import make_instruction_data_from_tx, Trx
 from spl.token.instructions import get_associated_token_address
 from eth_keys import keys
 from eth_utils import abi
@@ -12,50 +12,18 @@ from web3 import Web3
 
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-http_client = Client(solana_url)
+http_client = get_client(solana_url)
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 # CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
 evm_loader_id = os.environ.get("EVM_LOADER")
 # evm_loader_id = "7NXfEKTMhPdkviCjWipXxUtkEMDRzPJMQnz39aRMCwb1"
-holder_id = 0;
 
 
 def get_recent_account_balance(code_account_address):
     return http_client.get_balance(code_account_address, commitment='processed')['result']['value']
 
 
-def write_holder_layout(nonce, offset, data):
-    return (bytes.fromhex('12') +
-            nonce.to_bytes(8, byteorder='little') +
-            offset.to_bytes(4, byteorder='little') +
-            len(data).to_bytes(8, byteorder='little') +
-            data)
-
-
-def create_holder_account(operator_acc):
-    holder_id_bytes = holder_id.to_bytes((holder_id.bit_length() + 7) // 8, 'big')
-    seed = keccak_256(b'holder' + holder_id_bytes).hexdigest()[:32]
-    account_address = accountWithSeed(operator_acc.public_key(), seed, PublicKey(evm_loader_id))
-    if get_recent_account_balance(account_address) == 0:
-        minimum_balance = client.get_minimum_balance_for_rent_exemption(128*1024, commitment=Confirmed)["result"]
-        trx = TransactionWithComputeBudget()
-        trx.add(createAccountWithSeed(operator_acc.public_key(), operator_acc.public_key(), seed, minimum_balance, 128*1024, PublicKey(evm_loader_id)))
-        send_transaction(client, trx, operator_acc)
-    return account_address
-
-
-def create_storage_account(operator_acc, seed):
-    storage = PublicKey(sha256(bytes(operator_acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
-    print("Storage", storage)
-    minimum_balance = client.get_minimum_balance_for_rent_exemption(128*1024, commitment=Confirmed)["result"]
-    if get_recent_account_balance(storage) == 0:
-        trx = TransactionWithComputeBudget()
-        trx.add(createAccountWithSeed(operator_acc.public_key(), operator_acc.public_key(), seed, minimum_balance, 128*1024, PublicKey(evm_loader_id)))
-        send_transaction(client, trx, operator_acc)
-    return storage
-
-
 class EventTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -111,16 +79,22 @@ class EventTest(unittest.TestCase):
         cls.reId_create_receiver_seed = b58encode(ACCOUNT_SEED_VERSION+bytes.fromhex(cls.reId_create_receiver_eth.hex())).decode('utf8')
         cls.reId_create_receiver_code_account = accountWithSeed(cls.acc.public_key(), cls.reId_create_receiver_seed, PublicKey(evm_loader_id))
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+        cls.first_instruction_index = len(TransactionWithComputeBudget().instructions)
 
-        cls.holder = create_holder_account(cls.acc)
-        cls.storage = create_storage_account(cls.acc, '123435456776')
+        cls.holder_pool = HolderPool(client, cls.acc)
+        (cls.holder_id, cls.holder) = cls.holder_pool.acquire()
+        cls.storage_pool = StoragePool(client, cls.acc, size=1, prefix='nested_call_storage')
+        cls.storage = cls.storage_pool.acquire()
+        print("Storage", cls.storage)
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-            AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False), ])
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
+        cls.holder_pool.close()
+        cls.storage_pool.release(cls.storage)
 
     def sol_instr_22_partial_call_from_account(self, holder_account, storage_account, step_count, contract, code):
         return TransactionInstruction(
@@ -290,24 +264,7 @@ class EventTest(unittest.TestCase):
 
     def write_transaction_to_holder_account(self, holder, signature, message):
         message = signature + len(message).to_bytes(8, byteorder="little") + message
-
-        offset = 0
-        receipts = []
-        rest = message
-        while len(rest):
-            (part, rest) = (rest[:950], rest[950:])
-            trx = TransactionWithComputeBudget()
-            trx.add(TransactionInstruction(program_id=evm_loader_id,
-                data=write_holder_layout(holder_id, offset, part),
-                keys=[
-                    AccountMeta(pubkey=holder, is_signer=False, is_writable=True),
-                    AccountMeta(pubkey=self.acc.public_key(), is_signer=True, is_writable=False),
-                ]))
-            receipts.append(http_client.send_transaction(trx, self.acc, opts=TxOpts(skip_confirmation=True, preflight_commitment="confirmed"))["result"])
-            offset += len(part)
-
-        for rcpt in receipts:
-            confirm_transaction(http_client, rcpt)
+        HolderUploader(http_client, self.acc, holder, self.holder_id).upload(message)
 
     def call_partial_signed(self, input, contract_eth, contract, code):
         tx = {'to': contract_eth, 'value': 0, 'gas': 999_999_999, 'gasPrice': 0,
@@ -318,14 +275,23 @@ class EventTest(unittest.TestCase):
         instruction = from_addr + sign + msg
 
         trx = TransactionWithComputeBudget()
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(len(trx.instructions) + 1, len(msg), 13)))
-        trx.add(self.sol_instr_19_partial_call(self.storage, 0, instruction, contract, code))
+        add_signed_instructions(trx, [(self.sol_instr_19_partial_call(self.storage, 0, instruction, contract, code), len(msg), 13)])
         send_transaction(http_client, trx, self.acc)
 
+        key = step_count_controller.key(contract, input)
+        step_count_controller.seed(key, 400)
         while True:
             print("Continue")
-            trx = TransactionWithComputeBudget().add(self.sol_instr_20_continue(self.storage, 400, contract, code))
-            result = send_transaction(http_client, trx, self.acc)["result"]
+            step_count = step_count_controller.step_count(key)
+            trx = TransactionWithComputeBudget().add(self.sol_instr_20_continue(self.storage, step_count, contract, code))
+            try:
+                result = send_transaction(http_client, trx, self.acc)["result"]
+            except SendTransactionError as err:
+                if not is_compute_budget_exceeded(err):
+                    raise
+                step_count_controller.exceeded(key, step_count)
+                continue
+            step_count_controller.update(key, step_count, result)
 
             if result['meta']['innerInstructions'] and result['meta']['innerInstructions'][-1]['instructions']:
                 data = b58decode(result['meta']['innerInstructions'][-1]['instructions'][-1]['data'])
@@ -342,14 +308,12 @@ class EventTest(unittest.TestCase):
         self.write_transaction_to_holder_account(self.holder, sign, msg)
 
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
         trx.add(self.sol_instr_22_partial_call_from_account(self.holder, self.storage, 0, contract, code))
         send_transaction(http_client, trx, self.acc)
 
         while (True):
             print("Continue")
             trx = TransactionWithComputeBudget()
-            self.first_instruction_index = len(trx.instructions)
             trx.add(self.sol_instr_20_continue(self.storage, 100, contract, code))
             result = send_transaction(http_client, trx, self.acc)["result"]
 
@@ -368,7 +332,6 @@ class EventTest(unittest.TestCase):
         self.write_transaction_to_holder_account(self.holder, sign, msg)
 
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
         trx.add(self.sol_instr_14_combined_call_continue_from_account(self.holder, self.storage, 200, contract, code))
 
         while (True):
@@ -383,7 +346,6 @@ class EventTest(unittest.TestCase):
     def create_code_account_if_zero_balance(self, seed, code_account_address):
         if get_recent_account_balance(code_account_address) == 0:
             trx = TransactionWithComputeBudget()
-            self.first_instruction_index = len(trx.instructions)
             trx.add(
                 createAccountWithSeed(self.acc.public_key(),
                                       self.acc.public_key(),
@@ -396,7 +358,6 @@ class EventTest(unittest.TestCase):
     def create_code_owner_account_if_zero_balance(self, code_owner_account_address, code_owner_account_eth_address, code_account_address):
         if get_recent_account_balance(code_owner_account_address) == 0:
             trx = TransactionWithComputeBudget()
-            self.first_instruction_index = len(trx.instructions)
             trx.add(
                 self.loader.createEtherAccountTrx(code_owner_account_eth_address, code_account_address)[0]
             )
@@ -5,7 +5,7 @@ import web3
 from solana_utils import *
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 evm_loader_id = os.environ.get("EVM_LOADER")
 
 
@@ -21,12 +21,12 @@ class ResizeTest(unittest.TestCase):
 
     def sol_instr_17_resize(self, address, size) -> Transaction:
         solana_address = PublicKey(self.loader.ether2program(address)[0])
-        account_data: bytes = getAccountData(client, solana_address, ACCOUNT_INFO_LAYOUT.sizeof())
+        account_data: bytes = getAccountData(account_cache(client), solana_address, ACCOUNT_INFO_LAYOUT.sizeof())
         account: AccountInfo = AccountInfo.frombytes(account_data)
 
         seed = b58encode(ACCOUNT_SEED_VERSION + os.urandom(20)).decode('utf8')
         code_account_new = accountWithSeed(self.acc.public_key(), seed, PublicKey(evm_loader_id))
-        minimum_balance = client.get_minimum_balance_for_rent_exemption(size)["result"]
+        minimum_balance = get_minimum_balance_for_rent_exemption(client, size)
 
         create_with_seed = createAccountWithSeed(self.acc.public_key(), self.acc.public_key(), seed, minimum_balance, size, PublicKey(evm_loader_id))
         resize = TransactionInstruction(
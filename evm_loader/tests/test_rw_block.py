@@ -6,11 +6,11 @@ from base58 import b58decode
 from solana_utils import *
 from spl.token.constants import TOKEN_PROGRAM_ID, ASSOCIATED_TOKEN_PROGRAM_ID, ACCOUNT_LEN
 from spl.token.instructions import get_associated_token_address
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 from eth_utils import abi
 
 solana_url = os.environ.get("SOLANA_URL", "http://localhost:8899")
-client = Client(solana_url)
+client = get_client(solana_url)
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
@@ -27,8 +27,8 @@ def emulate(caller, contract, data, value):
 def create_account_with_seed(client, funding, base, seed, storage_size):
     account = accountWithSeed(base.public_key(), seed, PublicKey(evm_loader_id))
 
-    if client.get_balance(account, commitment=Confirmed)['result']['value'] == 0:
-        minimum_balance = client.get_minimum_balance_for_rent_exemption(storage_size, commitment=Confirmed)["result"]
+    if account_cache(client).get_balance(account)["result"]["value"] == 0:
+        minimum_balance = get_minimum_balance_for_rent_exemption(client, storage_size)
         print("Minimum balance required for account {}".format(minimum_balance))
 
         trx = TransactionWithComputeBudget()
@@ -79,9 +79,13 @@ class RW_Locking_Test(unittest.TestCase):
         print ('contract_eth', cls.reId_eth.hex())
         print ('contract_code', cls.re_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+        cls.first_instruction_index = len(TransactionWithComputeBudget().instructions)
+
+        cls.storage_pool = StoragePool(client, cls.acc1, size=2, prefix='rw_block_storage')
+        cls.storage_pool.provision()
 
 
         wallet2 = RandomAccount()
@@ -114,6 +118,9 @@ class RW_Locking_Test(unittest.TestCase):
         print("Caller2:", cls.caller2_ether.hex(), cls.caller2_nonce, "->", cls.caller2,
               "({})".format(bytes(PublicKey(cls.caller2)).hex()))
 
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
     def sol_instr_19_partial_call(self, storage_account, step_count, evm_instruction, writable_code, acc, caller, add_meta=[]):
         neon_evm_instr_19_partial_call = create_neon_evm_instr_19_partial_call(
@@ -166,15 +173,12 @@ class RW_Locking_Test(unittest.TestCase):
     def call_begin(self, storage, steps, msg, instruction,  writable_code, acc, caller, add_meta=[]):
         print("Begin")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
-        trx.add(self.sol_instr_keccak(make_keccak_instruction_data(self.first_instruction_index + 1, len(msg), 13)))
-        trx.add(self.sol_instr_19_partial_call(storage, steps, instruction, writable_code, acc, caller, add_meta))
+        add_signed_instructions(trx, [(self.sol_instr_19_partial_call(storage, steps, instruction, writable_code, acc, caller, add_meta), len(msg), 13)])
         return send_transaction(client, trx, acc)
 
     def call_continue(self, storage, steps, writable_code, acc, caller, add_meta=[]):
         print("Continue")
         trx = TransactionWithComputeBudget()
-        self.first_instruction_index = len(trx.instructions)
         trx.add(self.sol_instr_20_continue(storage, steps, writable_code, acc, caller, add_meta))
         return send_transaction(client, trx, acc)
 
@@ -186,19 +190,10 @@ class RW_Locking_Test(unittest.TestCase):
         assert (from_addr == caller_ether)
         return (from_addr, sign, msg, nonce)
 
-    def sol_instr_keccak(self, keccak_instruction):
-        return TransactionInstruction(program_id=keccakprog, data=keccak_instruction, keys=[
-                AccountMeta(pubkey=PublicKey(keccakprog), is_signer=False, is_writable=False), ])
-
-    def create_storage_account(self, seed, acc):
-        storage = PublicKey(sha256(bytes(acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
+    def create_storage_account(self):
+        storage = self.storage_pool.acquire()
+        self.addCleanup(self.storage_pool.release, storage)
         print("Storage", storage)
-
-        if getBalance(storage) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(acc.public_key(), acc.public_key(), seed, 10**9, 128*1024, PublicKey(evm_loader_id)))
-            send_transaction(client, trx, acc)
-
         return storage
 
     def check_continue_result(self, result):
@@ -219,8 +214,8 @@ class RW_Locking_Test(unittest.TestCase):
         instruction1 = from_addr1 + sign1 + msg1
         instruction2 = from_addr2 + sign2 + msg2
 
-        storage1 = self.create_storage_account(sign1[:8].hex(), self.acc1)
-        storage2 = self.create_storage_account(sign2[1:9].hex(), self.acc1)
+        storage1 = self.create_storage_account()
+        storage2 = self.create_storage_account()
 
         result = self.call_begin(storage1, 10, msg1, instruction1, False, self.acc1, self.caller1)
         result = self.call_begin(storage2, 10, msg2, instruction2, False, self.acc1, self.caller2)
@@ -266,8 +261,8 @@ class RW_Locking_Test(unittest.TestCase):
         instruction1 = from_addr1 + sign1 + msg1
         instruction2 = from_addr2 + sign2 + msg2
 
-        storage1 = self.create_storage_account(sign1[:8].hex(), self.acc1)
-        storage2 = self.create_storage_account(sign2[1:9].hex(), self.acc1)
+        storage1 = self.create_storage_account()
+        storage2 = self.create_storage_account()
 
         result = self.call_begin(storage1, 10, msg1, instruction1, True, self.acc1, self.caller1)
 
@@ -343,7 +338,7 @@ class RW_Locking_Test(unittest.TestCase):
 
         (from_addr, sign, msg, _) = self.get_call_parameters(func_name, self.acc1, self.caller1, self.caller1_ether)
         instruction = from_addr + sign + msg
-        storage = self.create_storage_account(sign[:8].hex(), self.acc1)
+        storage = self.create_storage_account()
 
         result = self.call_begin(storage, 10, msg, instruction, True, self.acc1, self.caller1, meta)
         result = self.call_continue(storage, 450, True, self.acc1, self.caller1, meta)
@@ -369,7 +364,7 @@ class RW_Locking_Test(unittest.TestCase):
 
         (from_addr1, sign1,  msg1, _) = self.get_call_parameters(input1, self.acc1, self.caller1, self.caller1_ether)
         instruction1 = from_addr1 + sign1 + msg1
-        storage1 = self.create_storage_account(sign1[:8].hex(), self.acc1)
+        storage1 = self.create_storage_account()
 
         # start first transaction
         self.call_begin(storage1, 10, msg1, instruction1, True, self.acc1, self.caller1)
@@ -411,7 +406,7 @@ class RW_Locking_Test(unittest.TestCase):
             send_transaction(client, TransactionWithComputeBudget().add(resize_instr), self.acc1)
 
         # get info about resizing account
-        info = getAccountData(client, self.reId, ACCOUNT_INFO_LAYOUT.sizeof())
+        info = getAccountData(account_cache(client), self.reId, ACCOUNT_INFO_LAYOUT.sizeof())
         info_data = AccountInfo.frombytes(info)
 
         # resizing must not be completed due to locking contract account.
@@ -425,7 +420,7 @@ class RW_Locking_Test(unittest.TestCase):
 
         # try next attempt to resize storage account and check it
         send_transaction(client, TransactionWithComputeBudget().add(resize_instr), self.acc1)
-        info = getAccountData(client, self.reId, ACCOUNT_INFO_LAYOUT.sizeof())
+        info = getAccountData(account_cache(client), self.reId, ACCOUNT_INFO_LAYOUT.sizeof())
         info_data = AccountInfo.frombytes(info)
 
         # resizing must be completed => code_account must be updated
@@ -0,0 +1,995 @@
+import asyncio
+import http.server
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import web
+
+import solana_async_utils
+from solana_utils import *
+
+
+class FakeStatusClient:
+    """Reports a signature as confirmed after it was polled confirm_after[sig] times."""
+    def __init__(self, confirm_after):
+        self.confirm_after = dict(confirm_after)
+        self.requests = []
+
+    def get_signature_statuses(self, signatures):
+        self.requests.append(list(signatures))
+        statuses = []
+        for sig in signatures:
+            self.confirm_after[sig] -= 1
+            if self.confirm_after[sig] > 0:
+                statuses.append(None)
+            else:
+                statuses.append({'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None})
+        return {'result': {'context': {'slot': 1}, 'value': statuses}}
+
+
+class FakeClient:
+    """A client of endpoint that reports every signature as confirmed."""
+    def __init__(self, endpoint='http://fake-rpc:8899'):
+        self._provider = SimpleNamespace(endpoint_uri=endpoint)
+
+    def get_signature_statuses(self, signatures):
+        return {'result': {'context': {'slot': 1}, 'value': [
+            {'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None} for _ in signatures]}}
+
+
+class FakeBlockhashClient(FakeClient):
+    """Returns blockhash number N on the N-th fetch; rejects transactions stamped with an expired one."""
+    def __init__(self, expired=(), endpoint='http://fake-rpc:8899'):
+        super().__init__(endpoint)
+        self.fetches = 0
+        self.expired = set(expired)
+        self.sent = []
+
+    def get_recent_blockhash(self, commitment=None):
+        self.fetches += 1
+        blockhash = str(PublicKey(self.fetches))
+        return {'result': {'context': {'slot': self.fetches}, 'value': {'blockhash': blockhash}}}
+
+    def send_raw_transaction(self, txn, opts=None):
+        trx = Transaction.deserialize(txn)
+        if str(trx.recent_blockhash) in self.expired:
+            raise SendTransactionError({'message': 'Transaction simulation failed: Blockhash not found',
+                                        'data': {'err': 'BlockhashNotFound'}})
+        self.sent.append(trx)
+        return {'result': b58encode(trx.signature()).decode()}
+
+
+class FakeRentClient(FakeClient):
+    """Default cluster rent: 3480 lamports per byte-year, exempt after 2 years."""
+    def __init__(self, endpoint):
+        super().__init__(endpoint)
+        self.requests = []
+
+    def get_minimum_balance_for_rent_exemption(self, size, commitment=None):
+        self.requests.append(size)
+        return {'result': (ACCOUNT_STORAGE_OVERHEAD + size) * 3480 * 2}
+
+    def get_account_info(self, account, commitment=None):
+        self.requests.append(str(account))
+        data = RENT_LAYOUT.build(dict(lamports_per_byte_year=3480, exemption_threshold=2.0, burn_percent=50))
+        return {'result': {'value': {'data': [base64.b64encode(data).decode(), 'base64']}}}
+
+
+class FakeAccountsProvider:
+    """Serves getMultipleAccounts from a dict of pubkey -> account data."""
+    def __init__(self, accounts):
+        self.endpoint_uri = 'http://accounts-rpc:8899'
+        self.accounts = accounts
+        self.requests = []
+
+    def make_request(self, method, keys, opts):
+        self.requests.append(keys)
+        values = [{'data': [base64.b64encode(self.accounts[key]).decode(), 'base64'], 'lamports': len(self.accounts[key])}
+                  if key in self.accounts else None for key in keys]
+        return {'result': {'context': {'slot': 1}, 'value': values}}
+
+
+class FakeSlotClient(FakeBlockhashClient):
+    """Serves get_account_info at the current slot; the slot is advanced by the test."""
+    def __init__(self, endpoint='http://fake-rpc:8899'):
+        super().__init__(endpoint=endpoint)
+        self.slot = 100
+        self.requests = []
+
+    def get_account_info(self, account, commitment=None):
+        self.requests.append(str(account))
+        value = {'data': [base64.b64encode(bytes(8)).decode(), 'base64'], 'lamports': self.slot}
+        return {'result': {'context': {'slot': self.slot}, 'value': value}}
+
+
+class FakeRpcHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every JSON-RPC request with the client port it came from."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        answer = lambda request: {'jsonrpc': '2.0', 'id': request['id'], 'result': self.client_address[1]}
+        response = json.dumps([answer(r) for r in body] if isinstance(body, list) else answer(body)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeHolderClient(FakeBlockhashClient):
+    """
+    Applies WriteHolder instructions to an in-memory holder. Writes at the offsets in fail_once fail
+    the first time, the ones in lose_once are never confirmed the first time.
+    """
+    def __init__(self, size, fail_once=(), lose_once=()):
+        super().__init__()
+        self.holder = bytearray(size)
+        self.fail_once = set(fail_once)
+        self.lose_once = set(lose_once)
+        self.statuses = {}
+        self.max_in_flight = 0
+
+    def send_raw_transaction(self, txn, opts=None):
+        result = super().send_raw_transaction(txn, opts)
+        status = {'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None}
+        for instr in self.sent[-1].instructions:
+            if instr.data[0] != 0x12:
+                continue
+            offset = int.from_bytes(instr.data[9:13], 'little')
+            if offset in self.fail_once:
+                self.fail_once.remove(offset)
+                status = {'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': {'InstructionError': [2, 'Custom']}}
+                break
+            if offset in self.lose_once:
+                self.lose_once.remove(offset)
+                status = None
+                break
+        else:
+            for instr in self.sent[-1].instructions:
+                if instr.data[0] == 0x12:
+                    offset = int.from_bytes(instr.data[9:13], 'little')
+                    self.holder[1 + offset:1 + offset + len(instr.data) - 21] = instr.data[21:]
+        self.statuses[result['result']] = status
+        return result
+
+    def get_account_info(self, account, commitment=None):
+        value = {'data': [base64.b64encode(bytes(self.holder)).decode(), 'base64'], 'lamports': 10**9}
+        return {'result': {'context': {'slot': 1}, 'value': value}}
+
+    def get_signature_statuses(self, signatures):
+        self.max_in_flight = max(self.max_in_flight, len(signatures))
+        return {'result': {'context': {'slot': 1}, 'value': [self.statuses[sig] for sig in signatures]}}
+
+
+def make_continue_result(consumed, err=None, on_return=False):
+    loader = str(EVM_LOADER)
+    logs = ['Program ComputeBudget111111111111111111111111111111 invoke [1]',
+            'Program ComputeBudget111111111111111111111111111111 success',
+            'Program {} invoke [1]'.format(loader),
+            'Program 11111111111111111111111111111111 invoke [2]',
+            'Program 11111111111111111111111111111111 consumed 150 of 1000 compute units',
+            'Program 11111111111111111111111111111111 success',
+            'Program {} consumed {} of 500000 compute units'.format(loader, consumed),
+            'Program {} {}'.format(loader, 'failed: exceeded CUs meter at BPF instruction' if err else 'success')]
+    inner = [{'index': 2, 'instructions': [{'data': base58.b58encode(b'\x06\x11').decode()}]}] if on_return else []
+    return {'meta': {'err': err, 'logMessages': logs, 'innerInstructions': inner}}
+
+
+class FakeIterativeClient(FakeBlockhashClient):
+    """
+    Executes continue instructions of an iterative transaction of total_steps steps, each step costing
+    units_per_step compute units. Continues after the last one fail the simulation like on chain.
+    """
+    def __init__(self, total_steps, units_per_step):
+        super().__init__()
+        self.remaining = total_steps
+        self.units_per_step = units_per_step
+        self.results = {}
+        self.instructions_per_transaction = []
+
+    def send_raw_transaction(self, txn, opts=None):
+        trx = Transaction.deserialize(txn)
+        assert len(txn) <= PACKET_DATA_SIZE
+        (remaining, logs, inner) = (self.remaining, [], [])
+        continues = [(index, instr) for (index, instr) in enumerate(trx.instructions) if instr.data[0] == 0x14]
+        for (index, instr) in continues:
+            if remaining == 0:
+                raise SendTransactionError({'message': 'Transaction simulation failed: Error processing Instruction {}: '
+                                                       'custom program error: 0x4'.format(index),
+                                            'data': {'err': {'InstructionError': [index, {'Custom': 4}]}}})
+            steps = min(remaining, int.from_bytes(instr.data[-8:], 'little'))
+            remaining -= steps
+            logs += ['Program {} invoke [1]'.format(instr.program_id),
+                     'Program {} consumed {} of 500000 compute units'.format(instr.program_id, steps * self.units_per_step),
+                     'Program {} success'.format(instr.program_id)]
+            if remaining == 0:
+                inner.append({'index': index, 'instructions': [{'data': base58.b58encode(b'\x06\x11').decode()}]})
+        self.remaining = remaining
+        self.instructions_per_transaction.append(len(continues))
+        result = super().send_raw_transaction(txn, opts)
+        self.results[result['result']] = {'slot': 1, 'meta': {'err': None, 'logMessages': logs, 'innerInstructions': inner}}
+        return result
+
+    def get_confirmed_transaction(self, signature, commitment=None):
+        return {'result': self.results[signature]}
+
+
+class FakeStorageClient(FakeBlockhashClient):
+    """
+    Creates empty accounts of the requested space (at least the tag) with CreateAccountWithSeed
+    and deletes them with DeleteHolderOrStorageAccount (0x10).
+    """
+    def __init__(self):
+        super().__init__()
+        self._provider = FakeAccountsProvider({})
+
+    def send_raw_transaction(self, txn, opts=None):
+        result = super().send_raw_transaction(txn, opts)
+        accounts = self._provider.accounts
+        for instr in self.sent[-1].instructions:
+            if str(instr.program_id) == system and instr.data[0] == SystemInstructionType.CREATE_ACCOUNT_WITH_SEED:
+                assert str(instr.keys[1].pubkey) not in accounts
+                space = SYSTEM_INSTRUCTIONS_LAYOUT.parse(instr.data).args.space
+                accounts[str(instr.keys[1].pubkey)] = bytes([TAG_EMPTY]) + bytes(max(space - 1, 0))
+            elif instr.data[0] == 0x10:
+                assert accounts[str(instr.keys[0].pubkey)][0] in (TAG_EMPTY, TAG_FINALIZED_STORAGE)
+                del accounts[str(instr.keys[0].pubkey)]
+        return result
+
+    def get_minimum_balance_for_rent_exemption(self, size, commitment=None):
+        return {'result': (ACCOUNT_STORAGE_OVERHEAD + size) * 6960}
+
+
+class SolanaUtilsTest(unittest.TestCase):
+    def setUp(self):
+        reset_caches()
+
+    def tearDown(self):
+        reset_caches()
+
+    def test_01_confirm_transactions(self):
+        signatures = ['sig{}'.format(i) for i in range(300)]
+        client = FakeStatusClient({sig: 1 + i % 3 for (i, sig) in enumerate(signatures)})
+        confirmed = list(confirm_transactions(client, signatures, timeout=10))
+        self.assertEqual(sorted(confirmed), sorted(signatures))
+        self.assertEqual(confirmed[:100], signatures[0::3])
+        self.assertTrue(all(len(request) <= SIGNATURE_STATUSES_LIMIT for request in client.requests))
+        self.assertEqual(len(client.requests), 2 + 1 + 1)
+
+    def test_02_confirm_transactions_timeout(self):
+        client = FakeStatusClient({'sig': 1000})
+        with self.assertRaises(RuntimeError):
+            list(confirm_transactions(client, ['sig'], timeout=0.2))
+
+    def test_03_async_client(self):
+        polls = {}
+
+        async def handle(request):
+            body = await request.json()
+            if body['method'] == 'getBalance':
+                result = {'context': {'slot': 1}, 'value': 42}
+            else:
+                statuses = []
+                for sig in body['params'][0]:
+                    polls[sig] = polls.get(sig, 0) + 1
+                    statuses.append({'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None}
+                                    if polls[sig] > 1 else None)
+                result = {'context': {'slot': 1}, 'value': statuses}
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': result})
+
+        async def run():
+            app = web.Application()
+            app.router.add_post('/', handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            try:
+                async with solana_async_utils.AsyncClient('http://127.0.0.1:{}/'.format(port)) as client:
+                    balance = await solana_async_utils.getBalance(client, PublicKey(1))
+                    confirmed = [sig async for sig in solana_async_utils.confirm_transactions(client, ['a', 'b'])]
+                    return (balance, confirmed)
+            finally:
+                await runner.cleanup()
+
+        (balance, confirmed) = asyncio.run(run())
+        self.assertEqual(balance, 42)
+        self.assertEqual(confirmed, ['a', 'b'])
+
+    def test_04_async_send_and_call_iterative(self):
+        acc = Account(1)
+        confirmed = {'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None}
+        on_return = [{'index': 0, 'instructions': [{'data': base58.b58encode(b'\x06\x11').decode()}]}]
+        sent = []
+        results = {}
+        calls = {'getSignatureStatuses': 0, 'signatureSubscribe': 0}
+
+        async def handle_http(request):
+            body = await request.json()
+            (method, params) = (body['method'], body['params'])
+            if method == 'getRecentBlockhash':
+                result = {'context': {'slot': 1}, 'value': {'blockhash': str(PublicKey(1))}}
+            elif method == 'sendTransaction':
+                trx = Transaction.deserialize(base64.b64decode(params[0]))
+                sent.append(trx)
+                result = b58encode(trx.signature()).decode()
+                # The third continue (0x14) finishes the iterative transaction
+                continues = sum(1 for t in sent if t.instructions[-1].data[0] == 0x14)
+                inner = on_return if trx.instructions[-1].data[0] == 0x14 and continues == 3 else []
+                results[result] = {'slot': 1, 'meta': {'err': None, 'logMessages': [], 'innerInstructions': inner}}
+            elif method == 'getSignatureStatuses':
+                calls[method] += 1
+                result = {'context': {'slot': 1}, 'value': [confirmed for _ in params[0]]}
+            else:
+                result = results[params[0]]
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': result})
+
+        async def handle_ws(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for msg in ws:
+                body = msg.json()
+                calls['signatureSubscribe'] += 1
+                await ws.send_json({'jsonrpc': '2.0', 'id': body['id'], 'result': body['id'] + 100})
+                await ws.send_json({'jsonrpc': '2.0', 'method': 'signatureNotification',
+                                    'params': {'subscription': body['id'] + 100,
+                                               'result': {'context': {'slot': 1}, 'value': {'err': None}}}})
+            return ws
+
+        tags = iter(range(256))
+        make_trx = lambda code: Transaction().add(TransactionInstruction(
+            keys=[AccountMeta(pubkey=acc.public_key(), is_signer=True, is_writable=True)],
+            program_id=PublicKey(2), data=bytes([code, next(tags)])))
+        loader = SimpleNamespace(createEtherAccountTrx=lambda ether: (make_trx(0x18), PublicKey(9)),
+                                 acc=SimpleNamespace(get_acc=lambda: acc))
+
+        async def run():
+            app = web.Application()
+            app.router.add_post('/', handle_http)
+            app.router.add_get('/ws', handle_ws)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            try:
+                async with solana_async_utils.AsyncClient('http://127.0.0.1:{}/'.format(port)) as client, \
+                        solana_async_utils.SignatureSubscriber(client, 'ws://127.0.0.1:{}/ws'.format(port)) as sub:
+                    polled = await solana_async_utils.send_transaction(client, make_trx(0x05), acc)
+                    polls = calls['getSignatureStatuses']
+                    self.assertGreaterEqual(polls, 1)
+                    notified = await solana_async_utils.send_transaction(client, make_trx(0x05), acc, subscriber=sub)
+                    self.assertEqual(calls['signatureSubscribe'], 1)
+                    # Only the status check right after the subscription polls
+                    self.assertEqual(calls['getSignatureStatuses'], polls + 1)
+                    sol = await solana_async_utils.createEtherAccount(client, loader, bytes(20))
+                    receipt = await solana_async_utils.call_iterative(client, acc, make_trx(0x13),
+                                                                      lambda: make_trx(0x14))
+                    return (polled, notified, sol, receipt)
+            finally:
+                await runner.cleanup()
+
+        (polled, notified, sol, receipt) = asyncio.run(run())
+        self.assertEqual(polled['result']['meta']['err'], None)
+        self.assertEqual(notified['result']['meta']['err'], None)
+        self.assertEqual(sol, PublicKey(9))
+        self.assertEqual([trx.instructions[-1].data[0] for trx in sent], [0x05, 0x05, 0x18, 0x13, 0x14, 0x14, 0x14])
+        self.assertIsNotNone(on_return_data(receipt['result']))
+        self.assertTrue(all(trx.verify_signatures() for trx in sent))
+
+    def test_05_signature_subscriber(self):
+        confirmed_statuses = {'early'}
+
+        async def handle_http(request):
+            body = await request.json()
+            statuses = [{'confirmationStatus': 'confirmed', 'confirmations': 1, 'err': None}
+                        if sig in confirmed_statuses else None for sig in body['params'][0]]
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'],
+                                      'result': {'context': {'slot': 1}, 'value': statuses}})
+
+        async def handle_ws(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for msg in ws:
+                body = msg.json()
+                (sig, _) = body['params']
+                if sig == 'drop':
+                    # The polling fallback finds it once the connection is gone
+                    confirmed_statuses.add(sig)
+                    await ws.close()
+                    break
+                if sig == 'refused':
+                    # Only the polling fallback can find it, and only after the subscription error
+                    asyncio.get_running_loop().call_later(0.3, confirmed_statuses.add, sig)
+                    await ws.send_json({'jsonrpc': '2.0', 'id': body['id'],
+                                        'error': {'code': -32602, 'message': 'Invalid params'}})
+                    continue
+                await ws.send_json({'jsonrpc': '2.0', 'id': body['id'], 'result': body['id'] + 100})
+                if sig != 'early':
+                    await ws.send_json({'jsonrpc': '2.0', 'method': 'signatureNotification',
+                                        'params': {'subscription': body['id'] + 100,
+                                                   'result': {'context': {'slot': 1}, 'value': {'err': None}}}})
+            return ws
+
+        async def run():
+            app = web.Application()
+            app.router.add_post('/', handle_http)
+            app.router.add_get('/ws', handle_ws)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            try:
+                async with solana_async_utils.AsyncClient('http://127.0.0.1:{}/'.format(port)) as client, \
+                        solana_async_utils.SignatureSubscriber(client, 'ws://127.0.0.1:{}/ws'.format(port)) as sub:
+                    first = sorted([sig async for sig in sub.confirm_transactions(['a', 'early', 'b'], timeout=5)])
+                    await sub.confirm_transaction('refused', timeout=2)
+                    await sub.confirm_transaction('drop', timeout=5)
+                    second = [sig async for sig in sub.confirm_transactions(['c'], timeout=5)]
+                    return (first, second)
+            finally:
+                await runner.cleanup()
+
+        (first, second) = asyncio.run(run())
+        self.assertEqual(first, ['a', 'b', 'early'])
+        self.assertEqual(second, ['c'])
+
+    def test_06_default_ws_url(self):
+        self.assertEqual(solana_async_utils.default_ws_url('http://localhost:8899'), 'ws://localhost:8900')
+        self.assertEqual(solana_async_utils.default_ws_url('https://api.devnet.solana.com'),
+                         'wss://api.devnet.solana.com')
+
+    def test_07_blockhash_cache(self):
+        acc = Account(1)
+        make_trx = lambda tag: Transaction().add(TransactionInstruction(
+            keys=[AccountMeta(pubkey=acc.public_key(), is_signer=True, is_writable=True)],
+            program_id=PublicKey(2), data=bytes([tag])))
+
+        client = FakeBlockhashClient(expired=[str(PublicKey(2))])
+        cache = BlockhashCache(client)
+        cache.send_transaction(make_trx(1), acc)
+        cache.send_transaction(make_trx(2), acc)
+        self.assertEqual(client.fetches, 1)
+
+        # An identical transaction needs a new blockhash, the second one is expired and gets replaced
+        cache.send_transaction(make_trx(1), acc)
+        self.assertEqual(client.fetches, 3)
+        self.assertEqual([str(trx.recent_blockhash) for trx in client.sent],
+                         [str(PublicKey(1)), str(PublicKey(1)), str(PublicKey(3))])
+        self.assertTrue(all(trx.verify_signatures() for trx in client.sent))
+
+        cache._fetched_at -= cache.ttl + 1
+        cache.send_transaction(make_trx(3), acc)
+        self.assertEqual(client.fetches, 4)
+
+        with self.assertRaises(SendTransactionError):
+            BlockhashCache(FakeBlockhashClient(expired=[str(PublicKey(i)) for i in range(1, 10)])) \
+                .send_transaction(make_trx(1), acc, retries=2)
+
+    def test_08_blockhash_cache_concurrency(self):
+        acc = Account(1)
+        make_trx = lambda tag: Transaction().add(TransactionInstruction(
+            keys=[AccountMeta(pubkey=acc.public_key(), is_signer=True, is_writable=True)],
+            program_id=PublicKey(2), data=bytes([tag])))
+
+        # The cluster keeps returning the same blockhash: a duplicate waits, other senders don't
+        client = FakeBlockhashClient()
+        client.get_recent_blockhash = lambda commitment=None: {
+            'result': {'context': {'slot': 1}, 'value': {'blockhash': str(PublicKey(1))}}}
+        cache = BlockhashCache(client)
+        cache.stamp(make_trx(1), acc)
+        stamped = []
+        waiting = threading.Thread(target=lambda: stamped.append(cache.stamp(make_trx(1), acc)))
+        waiting.start()
+        time.sleep(0.1)
+        started = time.monotonic()
+        cache.stamp(make_trx(2), acc)
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertTrue(waiting.is_alive())
+        client.get_recent_blockhash = lambda commitment=None: {
+            'result': {'context': {'slot': 2}, 'value': {'blockhash': str(PublicKey(2))}}}
+        waiting.join()
+        self.assertEqual(stamped, [str(PublicKey(2))])
+
+        # The refresh starts with the first get() and is stopped by close() or reset_caches()
+        client = FakeBlockhashClient()
+        cache = BlockhashCache(client, ttl_slots=0.25, refresh=True)
+        time.sleep(0.1)
+        self.assertEqual(client.fetches, 0)
+        cache.get()
+        time.sleep(0.35)
+        cache.close()
+        self.assertGreaterEqual(client.fetches, 2)
+        self.assertEqual(cache.get(), str(PublicKey(client.fetches)))
+
+        cache = blockhash_cache(FakeBlockhashClient())
+        self.assertIsNone(cache._refresher)
+        cache.get()
+        self.assertTrue(cache._refresher.is_alive())
+        reset_caches()
+        cache._refresher.join(cache.ttl)
+        self.assertFalse(cache._refresher.is_alive())
+
+    def test_09_rent_exemption_cache(self):
+        client = FakeRentClient('http://rent-rpc:8899')
+        self.assertEqual(get_minimum_balance_for_rent_exemption(client, 0), 890880)
+        self.assertEqual(get_minimum_balance_for_rent_exemption(client, 0), 890880)
+        self.assertEqual(get_minimum_balance_for_rent_exemption(client, 128*1024), 913152000)
+        self.assertEqual(client.requests, [0, 128*1024])
+
+        local = FakeRentClient('http://local-rent-rpc:8899')
+        for size in (0, 165, 128*1024):
+            self.assertEqual(get_minimum_balance_for_rent_exemption(local, size, local=True),
+                             get_minimum_balance_for_rent_exemption(client, size))
+        self.assertEqual(local.requests, [str(SYSVAR_RENT_PUBKEY)])
+
+    def test_10_get_neon_accounts(self):
+        ethers = [bytes([i]) * 20 for i in range(1, 251)]
+        accounts = {}
+        for (i, ether) in enumerate(ethers):
+            if i % 5 == 4:
+                continue
+            code_account = bytes(PublicKey(i)) if i % 2 else bytes(32)
+            accounts[str(ether2program_address(ether)[0])] = ACCOUNT_INFO_LAYOUT.build(dict(
+                type=TAG_ACCOUNT, ether=ether, nonce=255, trx_count=i.to_bytes(8, 'little'),
+                balance=(i * 10**18).to_bytes(32, 'little'), code_account=code_account, is_rw_blocked=0, ro_blocked_cnt=0))
+        accounts[str(PublicKey(7))] = bytes(200)
+
+        client = Client('http://accounts-rpc:8899')
+        client._provider = FakeAccountsProvider(accounts)
+        addresses = ethers[:100] + ['0x' + ether.hex() for ether in ethers[100:200]] + \
+            [ether2program_address(ether)[0] for ether in ethers[200:]] + [str(PublicKey(7))]
+        records = get_neon_accounts(client, addresses, workers=3)
+
+        self.assertEqual(sorted(len(keys) for keys in client._provider.requests), [51, 100, 100])
+        self.assertEqual(len(records), 251)
+        self.assertIsNone(records[4])
+        self.assertIsNone(records[250])
+        self.assertEqual(records[1].trx_count, 1)
+        self.assertEqual(records[1].code_account, PublicKey(1))
+        self.assertIsNone(records[2].code_account)
+        self.assertEqual(records[123].ether, ethers[123])
+        self.assertEqual(records[123].balance, 123 * 10**18)
+        self.assertEqual(records[211].address, ether2program_address(ethers[211])[0])
+        self.assertEqual(records[211].lamports, ACCOUNT_INFO_LAYOUT.sizeof())
+
+    def test_11_account_cache(self):
+        client = FakeSlotClient()
+        cache = AccountCache(client, max_slot_lag=5, max_size=2)
+        (a, b, c) = (PublicKey(1), PublicKey(2), PublicKey(3))
+        self.assertEqual(getAccountData(cache, a, 8), bytes(8))
+        self.assertEqual(cache.get_balance(a)['result']['value'], 100)
+        self.assertEqual(client.requests, [str(a)])
+
+        # Entries older than max_slot_lag are read again
+        client.slot = 110
+        cache.observe_slot(110)
+        self.assertEqual(cache.get_balance(a)['result']['value'], 110)
+        self.assertEqual(client.requests, [str(a)] * 2)
+
+        # LRU eviction: a was used more recently than b
+        cache.get_account_info(b)
+        cache.get_account_info(a)
+        cache.get_account_info(c)
+        cache.get_account_info(a)
+        cache.get_account_info(b)
+        self.assertEqual(client.requests, [str(a)] * 2 + [str(b), str(c), str(b)])
+
+        trx = Transaction().add(TransactionInstruction(
+            keys=[AccountMeta(pubkey=a, is_signer=False, is_writable=False),
+                  AccountMeta(pubkey=b, is_signer=False, is_writable=True)], program_id=PublicKey(4), data=b''))
+        cache.invalidate_transaction(trx)
+        cache.get_account_info(a)
+        cache.get_account_info(b)
+        self.assertEqual(client.requests[-1:], [str(b)])
+
+        # Readers share one cache per endpoint; the send helpers invalidate what they write
+        self.assertIs(account_cache(client), account_cache(client))
+        self.assertIs(account_cache(cache), cache)
+        acc = Account(1)
+        writing = Transaction().add(TransactionInstruction(
+            keys=[AccountMeta(pubkey=acc.public_key(), is_signer=True, is_writable=True),
+                  AccountMeta(pubkey=a, is_signer=False, is_writable=True)], program_id=PublicKey(4), data=b''))
+        cache.get_account_info(a)
+        requests = len(client.requests)
+        BlockhashCache(client).send_transaction(writing, acc)
+        cache.get_account_info(a)
+        cache.get_account_info(a)
+        invalidate_account_caches()
+        cache.get_account_info(a)
+        self.assertEqual(client.requests[requests:], [str(a), str(a)])
+
+        # Entries are per commitment
+        cache.get_account_info(a, commitment='processed')
+        cache.get_account_info(a, commitment='processed')
+        cache.get_account_info(a)
+        self.assertEqual(client.requests[requests:], [str(a)] * 3)
+
+        # A response read across an invalidation of its account isn't cached
+        read = client.get_account_info
+
+        def invalidated_read(account, commitment=None):
+            response = read(account, commitment)
+            cache.invalidate(account)
+            return response
+        cache.invalidate(c)
+        requests = len(client.requests)
+        client.get_account_info = invalidated_read
+        cache.get_account_info(c)
+        client.get_account_info = read
+        cache.get_account_info(c)
+        cache.get_account_info(c)
+        self.assertEqual(client.requests[requests:], [str(c), str(c)])
+
+        # CLI commands drop their fee payer and the accounts they name, read-only ones nothing
+        requests = len(client.requests)
+        invalidate_cli_accounts('balance --address {}'.format(a), '')
+        invalidate_cli_accounts('transfer {} 1'.format(b), 'Signature: 1111', writes=(), payer=Account(3))
+        cache.get_account_info(a)
+        cache.get_account_info(b)
+        self.assertEqual(client.requests[requests:], [str(b)])
+        invalidate_cli_accounts('cancel-trx {}'.format(c), '')
+        cache.get_account_info(a)
+        self.assertEqual(client.requests[requests:], [str(b), str(a)])
+
+    def test_12_pooled_client(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeRpcHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            endpoint = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            shared = get_client(endpoint, pool_size=2)
+            self.assertIs(get_client(endpoint), shared)
+            ports = {shared._provider.make_request(types.RPCMethod("getSlot"))['result'] for _ in range(5)}
+            self.assertEqual(len(ports), 1)
+
+            responses = shared._provider.make_batch_request([("getSlot",), ("getBalance", "key")])
+            self.assertEqual([response['result'] for response in responses], list(ports) * 2)
+            self.assertEqual(latency_stats()[endpoint].count, 6)
+            self.assertEqual(latency_stats()[endpoint].errors, 0)
+
+            # Transactions sent by any user of the client invalidate the accounts they write
+            reader = FakeSlotClient(endpoint)
+            cache = AccountCache(reader)
+            acc = Account(1)
+            trx = Transaction(recent_blockhash=Blockhash(str(PublicKey(1)))).add(TransactionInstruction(
+                keys=[AccountMeta(pubkey=acc.public_key(), is_signer=True, is_writable=True),
+                      AccountMeta(pubkey=PublicKey(3), is_signer=False, is_writable=True),
+                      AccountMeta(pubkey=PublicKey(5), is_signer=False, is_writable=False)],
+                program_id=PublicKey(4), data=b''))
+            trx.sign(acc)
+            for key in (PublicKey(3), PublicKey(5)):
+                cache.get_account_info(key)
+            shared.send_raw_transaction(trx.serialize())
+            for key in (PublicKey(3), PublicKey(5)):
+                cache.get_account_info(key)
+            self.assertEqual(reader.requests, [str(PublicKey(3)), str(PublicKey(5)), str(PublicKey(3))])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_13_holder_uploader(self):
+        message = os.urandom(10000)
+        client = FakeHolderClient(len(message) + 1)
+        uploader = HolderUploader(client, Account(1), PublicKey(5), 0, loader_id=PublicKey(6), window=4,
+                                  confirm_timeout=0.3)
+        chunk = uploader.max_chunk_size
+        client.fail_once.add(chunk * 3)
+        client.lose_once.add(chunk * 7)
+        confirmed = uploader.upload(message)
+        self.assertEqual(bytes(client.holder[1:]), message)
+        transactions = (len(message) + chunk - 1) // chunk
+        self.assertEqual(len(confirmed), transactions)
+        self.assertEqual(len(client.sent), transactions + 2)
+        self.assertEqual(client.max_in_flight, 4)
+
+        # A new fake cluster on the same endpoint: drop the caches bound to the first client
+        reset_caches()
+        failing = FakeHolderClient(2000, fail_once=[0])
+        with self.assertRaises(RuntimeError):
+            HolderUploader(failing, Account(1), PublicKey(5), 0, loader_id=PublicKey(6), retries=0).upload(b'\1' * 100)
+
+    def test_14_holder_packet_size(self):
+        client = FakeHolderClient(20001)
+        uploader = HolderUploader(client, Account(1), PublicKey(5), 0, loader_id=PublicKey(6))
+        uploader.upload(os.urandom(5000))
+        sizes = [len(trx.serialize()) for trx in client.sent]
+        self.assertEqual(max(sizes), PACKET_DATA_SIZE)
+        self.assertEqual(len(sizes), (5000 + uploader.max_chunk_size - 1) // uploader.max_chunk_size)
+
+        # Small scattered writes share transactions
+        client.sent = []
+        writes = [(offset, os.urandom(100)) for offset in range(10000, 20000, 500)]
+        uploader.upload_chunks(writes)
+        self.assertTrue(all(len(trx.serialize()) <= PACKET_DATA_SIZE for trx in client.sent))
+        self.assertLessEqual(len(client.sent), 3)
+        for (offset, part) in writes:
+            self.assertEqual(bytes(client.holder[1 + offset:1 + offset + 100]), part)
+
+    def test_15_holder_resume(self):
+        message = os.urandom(10000)
+        client = FakeHolderClient(len(message) + 1)
+        uploader = HolderUploader(client, Account(1), PublicKey(5), 0, loader_id=PublicKey(6))
+        chunk = uploader.max_chunk_size
+        # An interrupted upload: only the first three chunks were written
+        client.holder[1:1 + 3 * chunk] = message[:3 * chunk]
+        uploader.upload(message)
+        self.assertEqual(bytes(client.holder[1:]), message)
+        self.assertEqual(len(client.sent), (len(message) + chunk - 1) // chunk - 3)
+
+        # Retrying a complete upload writes nothing, an upload of another message overwrites the changed chunk only
+        client.sent = []
+        self.assertEqual(uploader.upload(message), [])
+        changed = message[:5 * chunk + 10] + b'changed' + message[5 * chunk + 17:]
+        uploader.upload(changed)
+        self.assertEqual(len(client.sent), 1)
+        self.assertEqual(bytes(client.holder[1:]), changed)
+
+    def test_16_step_count_controller(self):
+        self.assertEqual(consumed_compute_units(make_continue_result(12345)), [12345])
+        # Lines printed by programs don't move the depth or add consumed units
+        hostile = make_continue_result(12345)
+        loader = str(EVM_LOADER)
+        hostile['meta']['logMessages'][6:6] = [
+            'Program log: invoke [1]',
+            'Program log: Program {} invoke [1]'.format(loader),
+            'Program log: Program {} consumed 99999 of 500000 compute units'.format(loader),
+            'Program log: success',
+            'Program {} consumed by a hostile log line'.format(loader)]
+        self.assertEqual(consumed_compute_units(hostile), [12345])
+
+        controller = StepCountController(units=500000, target=0.8, initial_steps=500)
+        key = controller.key(PublicKey(1), bytes.fromhex('a9059cbb') + bytes(64))
+        self.assertEqual(controller.step_count(key), 500)
+        # 100 units per step: limited by the growth factor, then by the budget
+        self.assertEqual(controller.update(key, 500, make_continue_result(50000)), 1000)
+        self.assertEqual(controller.update(key, 1000, make_continue_result(100000)), 2000)
+        self.assertEqual(controller.update(key, 2000, make_continue_result(200000)), 4000)
+        self.assertEqual(controller.update(key, 4000, make_continue_result(400000)), 4000)
+        self.assertEqual(controller.update(key, 4000, make_continue_result(1000, on_return=True)), 4000)
+        self.assertEqual(controller.update(key, 4000, make_continue_result(500000, err={'InstructionError': []})), 2000)
+        self.assertEqual(controller.step_count(key), 2000)
+        self.assertEqual(controller.step_count(controller.key(PublicKey(1), bytes(4))), 500)
+        # A seed only replaces initial_steps
+        self.assertEqual(controller.seed(controller.key(PublicKey(2), bytes(4)), 400), 400)
+        self.assertEqual(controller.step_count(controller.key(PublicKey(2), bytes(4))), 400)
+        self.assertEqual(controller.seed(key, 400), 2000)
+
+    def test_17_continue_driver(self):
+        acc = Account(1)
+        client = FakeIterativeClient(total_steps=10000, units_per_step=200)
+        make_instruction = lambda step_count: create_neon_evm_instr_20_continue(
+            PublicKey(6), PublicKey(7), acc.public_key(), PublicKey(8), PublicKey(9), PublicKey(10),
+            bytes(4), PublicKey(11), step_count)
+        controller = StepCountController(units=500000, initial_steps=100)
+        key = controller.key(PublicKey(10), bytes(4))
+        driver = ContinueDriver(client, acc, make_instruction, key, controller, units=500000)
+        result = driver.run()
+        self.assertIsNotNone(on_return_data(result))
+        self.assertEqual(client.remaining, 0)
+        # 100 steps cost 20000 units: the step count doubles to 200, and 10 continues of 200 steps
+        # fit into 80% of the budget; the controller keeps the step count for the next transaction
+        self.assertEqual(client.instructions_per_transaction, [1, 10, 10, 10, 10, 10])
+        self.assertEqual(controller.step_count(key), 200)
+        self.assertEqual(driver.transactions, 6)
+
+    def test_18_storage_pool(self):
+        client = FakeStorageClient()
+        operator = Account(1)
+        pool = StoragePool(client, operator, size=40, account_size=STORAGE_LAYOUT.sizeof(), loader_id=PublicKey(6))
+        self.assertEqual(pool.provision(), 40)
+        self.assertEqual(pool.provision(), 0)
+        # 40 creates are packed into a few transactions
+        self.assertLess(len(client.sent), 10)
+        self.assertTrue(all(len(trx.serialize()) <= PACKET_DATA_SIZE for trx in client.sent))
+
+        accounts = client._provider.accounts
+        first = pool.acquire()
+        self.assertEqual(first, pool.address(0))
+        self.assertNotEqual(pool.acquire(), first)
+        # Accounts with a transaction in progress are skipped, finalized ones are reused
+        in_progress = STORAGE_LAYOUT.build(dict(tag=TAG_STORAGE, caller=bytes(20), nonce=3, gas_limit=bytes(32),
+                                           gas_price=bytes(32), slot=77, operator=bytes(operator.public_key()),
+                                           accounts_len=5, executor_data_size=0, evm_data_size=0,
+                                           gas_used_and_paid=bytes(32), number_of_payments=1, signature=bytes(65)))
+        accounts[str(pool.address(2))] = in_progress
+        accounts[str(first)] = bytes([TAG_FINALIZED_STORAGE])
+        self.assertEqual(pool.acquire(), pool.address(3))
+        pool.release(first)
+        self.assertEqual(pool.acquire(), first)
+        [(account, header)] = pool.in_progress()
+        self.assertEqual(account, pool.address(2))
+        self.assertEqual((header.nonce, header.slot), (3, 77))
+
+        # The pool grows when all accounts are taken and shrinks back on reclaim
+        sent = len(client.sent)
+        for _ in range(36):
+            pool.acquire()
+        self.assertEqual(len(client.sent), sent)
+        self.assertEqual(pool.acquire(), pool.address(40))
+        self.assertEqual(pool.size, 41)
+        pool.release(pool.address(40))
+        self.assertEqual(pool.reclaim(), 1)
+        self.assertEqual(pool.size, 40)
+        self.assertEqual(len(accounts), 40)
+
+        # Existing accounts the pool grows over are adopted when idle and skipped when in progress
+        accounts[str(pool.address(40))] = in_progress
+        accounts[str(pool.address(41))] = bytes([TAG_FINALIZED_STORAGE])
+        sent = len(client.sent)
+        self.assertEqual(pool.acquire(), pool.address(41))
+        self.assertEqual((pool.size, len(client.sent)), (42, sent))
+        pool.release(pool.address(41))
+        del accounts[str(pool.address(40))]
+        self.assertEqual(pool.reclaim(keep=40), 1)
+        self.assertEqual(pool.size, 40)
+        self.assertEqual(len(accounts), 40)
+        for index in range(30, 40):
+            pool.release(pool.address(index))
+        self.assertEqual(pool.reclaim(keep=30), 10)
+        self.assertEqual(pool.size, 30)
+        self.assertEqual(len(accounts), 30)
+        with self.assertRaisesRegex(ValueError, 'not an account of the storage pool'):
+            pool.release(PublicKey(1))
+
+    def test_19_holder_id_registry(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = HolderIdRegistry(os.path.join(directory, 'holders.sqlite'))
+            operator = PublicKey(1)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                ids = list(executor.map(lambda _: registry.allocate(operator), range(40)))
+            self.assertEqual(sorted(ids), list(range(40)))
+            self.assertEqual(registry.allocate(PublicKey(2)), 0)
+
+            registry.release(operator, 7)
+            self.assertEqual(registry.allocate(operator), 7)
+
+            # Another process allocates the next id and keeps it until it exits
+            script = 'import sys; from solana_utils import *; print(HolderIdRegistry(sys.argv[1]).allocate(PublicKey(1)))'
+            output = subprocess.check_output([sys.executable, '-c', script, registry.path], cwd=os.path.dirname(__file__) or '.')
+            self.assertEqual(int(output.split()[-1]), 40)
+            self.assertEqual(registry.allocate(operator), 40)
+
+    def test_20_holder_pool(self):
+        client = FakeStorageClient()
+        with tempfile.TemporaryDirectory() as directory:
+            registry = HolderIdRegistry(os.path.join(directory, 'holders.sqlite'))
+            pool = HolderPool(client, Account(1), size=4, account_size=1024, loader_id=PublicKey(6), registry=registry)
+            self.assertEqual(pool.provision(), 4)
+            self.assertEqual(len(client.sent), 1)
+            self.assertEqual(pool.address(2), accountWithSeed(Account(1).public_key(), holder_seed(2), PublicKey(6)))
+
+            sent = len(client.sent)
+            self.assertEqual([pool.acquire(1000) for _ in range(4)], [(i, pool.address(i)) for i in range(4)])
+            self.assertEqual(len(client.sent), sent)
+            self.assertEqual(pool.acquire(), (4, pool.address(4)))
+            self.assertEqual(len(client._provider.accounts), 5)
+            pool.release(1)
+            self.assertEqual(pool.acquire(), (1, pool.address(1)))
+
+            # A holder too small for the message is recreated with its size, once
+            accounts = client._provider.accounts
+            pool.release(1)
+            sent = len(client.sent)
+            self.assertEqual(pool.acquire(4000), (1, pool.address(1)))
+            self.assertEqual(len(accounts[str(pool.address(1))]), 4001)
+            self.assertEqual(len(client.sent), sent + 2)
+            pool.release(1)
+            self.assertEqual(pool.acquire(1000), (1, pool.address(1)))
+            self.assertEqual(len(client.sent), sent + 2)
+            self.assertEqual(len(accounts[str(pool.address(0))]), 1024)
+            pool.close()
+            self.assertEqual(registry.allocate(Account(1).public_key()), 0)
+
+    def test_21_collateral_pool_selector(self):
+        selector = CollateralPoolSelector(count=3)
+        self.assertEqual(selector.pools[2], (2, bytes([2, 0, 0, 0]), create_collateral_pool_address(2)))
+        pools = [selector.acquire() for _ in range(3)]
+        self.assertEqual([pool.index for pool in pools], [0, 1, 2])
+        # All pools are in flight: shared round-robin
+        self.assertEqual([selector.acquire().index for _ in range(4)], [0, 1, 2, 0])
+        selector.release(pools[2])
+        selector.release(pools[1])
+        selector.release(selector.pools[1])
+        selector.release(selector.pools[2])
+        # The least recently used idle pool goes first
+        self.assertEqual([selector.acquire().index for _ in range(3)], [1, 2, 1])
+        self.assertIs(collateral_pool_selector(), collateral_pool_selector())
+
+    def test_22_provision_collateral_pools(self):
+        client = FakeStorageClient()
+        wallet = Account(1)
+        self.assertEqual(provision_collateral_pools(client, wallet, count=250), list(range(250)))
+        self.assertTrue(all(len(trx.serialize()) <= PACKET_DATA_SIZE for trx in client.sent))
+        self.assertLess(len(client.sent), 50)
+        # One account check per 100 pools
+        self.assertEqual(len(client._provider.requests), 3)
+        self.assertIn(str(create_collateral_pool_address(249, wallet.public_key())), client._provider.accounts)
+
+        del client._provider.accounts[str(create_collateral_pool_address(7, wallet.public_key()))]
+        sent = len(client.sent)
+        self.assertEqual(missing_collateral_pools(client, wallet.public_key(), 250), [7])
+        self.assertEqual(provision_collateral_pools(client, wallet, count=250), [7])
+        self.assertEqual(len(client.sent), sent + 1)
+        self.assertEqual(provision_collateral_pools(client, wallet, count=250), [])
+
+    def test_23_add_signed_instructions(self):
+        trx = TransactionWithComputeBudget()
+        first = len(trx.instructions)
+        signed = [(TransactionInstruction(program_id=PublicKey(6), data=bytes([5]) + bytes(100), keys=[]), 50, 5)
+                  for _ in range(2)]
+        self.assertEqual(add_signed_instructions(trx, signed), [first + 1, first + 3])
+        # Every check is a single-signature instruction right before the instruction it verifies
+        self.assertEqual(trx.instructions[first].data, make_keccak_instruction_data(first + 1, 50, 5))
+        self.assertEqual(trx.instructions[first + 2].data, make_keccak_instruction_data(first + 3, 50, 5))
+        self.assertEqual([str(instr.program_id) for instr in trx.instructions[first:]],
+                         [keccakprog, str(PublicKey(6)), keccakprog, str(PublicKey(6))])
+
+    def test_24_confirm_transaction_websocket(self):
+        subscribed = []
+
+        async def handle_http(request):
+            # Nothing is confirmed before its subscription
+            body = await request.json()
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'],
+                                      'result': {'context': {'slot': 1}, 'value': [None] * len(body['params'][0])}})
+
+        async def handle_ws(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for msg in ws:
+                body = msg.json()
+                subscribed.append(body['params'][0])
+                await ws.send_json({'jsonrpc': '2.0', 'id': body['id'], 'result': body['id'] + 100})
+                await ws.send_json({'jsonrpc': '2.0', 'method': 'signatureNotification',
+                                    'params': {'subscription': body['id'] + 100,
+                                               'result': {'context': {'slot': 1}, 'value': {'err': None}}}})
+            return ws
+
+        async def start():
+            app = web.Application()
+            app.router.add_post('/', handle_http)
+            app.router.add_get('/ws', handle_ws)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            return runner
+
+        loop = asyncio.new_event_loop()
+        server = threading.Thread(target=loop.run_forever, daemon=True)
+        server.start()
+        runner = asyncio.run_coroutine_threadsafe(start(), loop).result()
+        try:
+            port = runner.addresses[0][1]
+            ws_url = 'ws://127.0.0.1:{}/ws'.format(port)
+            client = FakeClient(endpoint='http://127.0.0.1:{}/'.format(port))
+            subscriber = signature_subscriber(client, ws_url=ws_url)
+            self.assertIs(signature_subscriber(client), subscriber)
+            confirm_transaction(client, 'sig1', mode='websocket')
+            self.assertEqual(sorted(subscriber.confirm_transactions(['sig2', 'sig3'], timeout=5)), ['sig2', 'sig3'])
+            self.assertEqual(subscribed, ['sig1', 'sig2', 'sig3'])
+
+            # Polled without touching the subscriber
+            confirm_transaction(client, 'sig4')
+            self.assertEqual(len(subscribed), 3)
+        finally:
+            reset_caches()
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            server.join()
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
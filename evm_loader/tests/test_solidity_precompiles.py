@@ -7,13 +7,12 @@ from eth_utils import abi
 from base58 import b58decode
 import re
 
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx, JsonEncoder
+from eth_tx_utils import make_instruction_data_from_tx, JsonEncoder
 from solana_utils import *
 
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 evm_loader_id = os.environ.get("EVM_LOADER")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
-holder_id = 0
 
 class PrecompilesTests(unittest.TestCase):
     @classmethod
@@ -49,13 +48,22 @@ class PrecompilesTests(unittest.TestCase):
         print("contract id: ", cls.owner_contract, cls.eth_contract)
         print("code id: ", cls.contract_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
 
         with open(CONTRACTS_DIR+"test_solidity_precompiles.json") as json_data:
             cls.test_data = json.load(json_data)
 
+        cls.holder_pool = HolderPool(client, cls.acc)
+        cls.storage_pool = StoragePool(client, cls.acc, size=1, prefix='precompiles_storage')
+        cls.storage_pool.provision()
+
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
+        cls.holder_pool.close()
+
     def send_transaction(self, data):
         if len(data) > 512:
             result = self.call_with_holder_account(data)
@@ -140,20 +148,9 @@ class PrecompilesTests(unittest.TestCase):
         trx = TransactionWithComputeBudget()
         (_from_addr, sign, msg) = make_instruction_data_from_tx(eth_tx, self.acc.secret_key())
         trx_data = self.caller_ether + sign + msg
-        keccak_instruction = make_keccak_instruction_data(len(trx.instructions) + 1, len(msg), 5)
-        
-        solana_trx = trx.add(
-                self.sol_instr_keccak(keccak_instruction) 
-            ).add( 
-                self.sol_instr_call(trx_data) 
-            )
-
-        return solana_trx
-
-    def sol_instr_keccak(self, keccak_instruction):
-        return  TransactionInstruction(program_id="KeccakSecp256k11111111111111111111111111111", data=keccak_instruction, keys=[
-                    AccountMeta(pubkey=self.caller, is_signer=False, is_writable=False),
-                ])
+        add_signed_instructions(trx, [(self.sol_instr_call(trx_data), len(msg), 5)],
+                                keccak_keys=[AccountMeta(pubkey=self.caller, is_signer=False, is_writable=False)])
+        return trx
 
     def sol_instr_call(self, trx_data):
         neon_evm_instr_05_single = create_neon_evm_instr_05_single(
@@ -200,36 +197,9 @@ class PrecompilesTests(unittest.TestCase):
         print('neon_evm_instr_20_continue:', neon_evm_instr_20_continue)
         return neon_evm_instr_20_continue
 
-    def create_account_with_seed(self, seed):
-        storage = accountWithSeed(self.acc.public_key(), seed, PublicKey(evm_loader_id))
-
-        if getBalance(storage) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.acc.public_key(), self.acc.public_key(), seed, 10**9, 128*1024, PublicKey(evm_loader_id)))
-            client.send_transaction(trx, self.acc, opts=TxOpts(skip_confirmation=False, preflight_commitment="confirmed"))
-
-        return storage
-
-    def write_transaction_to_holder_account(self, holder, signature, message):
+    def write_transaction_to_holder_account(self, holder_id, holder, signature, message):
         message = signature + len(message).to_bytes(8, byteorder="little") + message
-
-        offset = 0
-        receipts = []
-        rest = message
-        while len(rest):
-            (part, rest) = (rest[:950], rest[950:])
-            trx = TransactionWithComputeBudget()
-            trx.add(TransactionInstruction(program_id=evm_loader_id,
-                data=(bytes.fromhex('12') + holder_id.to_bytes(8, byteorder="little") + offset.to_bytes(4, byteorder="little") + len(part).to_bytes(8, byteorder="little") + part),
-                keys=[
-                    AccountMeta(pubkey=holder, is_signer=False, is_writable=True),
-                    AccountMeta(pubkey=self.acc.public_key(), is_signer=True, is_writable=False),
-                ]))
-            receipts.append(client.send_transaction(trx, self.acc, opts=TxOpts(skip_confirmation=True, preflight_commitment="confirmed"))["result"])
-            offset += len(part)
-
-        for rcpt in receipts:
-            confirm_transaction(client, rcpt)
+        HolderUploader(client, self.acc, holder, holder_id).upload(message)
 
 
     def call_with_holder_account(self, input):
@@ -239,30 +209,33 @@ class PrecompilesTests(unittest.TestCase):
         (from_addr, sign, msg) = make_instruction_data_from_tx(tx, self.acc.secret_key())
         assert (from_addr == self.caller_ether)
 
-        holder_id_bytes = holder_id.to_bytes((holder_id.bit_length() + 7) // 8, 'big')
-        holder_seed = keccak_256(b'holder'+holder_id_bytes).hexdigest()[:32]
-        holder = self.create_account_with_seed(holder_seed)
-        storage = self.create_account_with_seed(sign[:8].hex())
-
-        self.write_transaction_to_holder_account(holder, sign, msg)
-
-        trx = TransactionWithComputeBudget()
-        trx.add(self.sol_instr_22_partial_call_from_account(holder, storage, 0))
-        send_transaction(client, trx, self.acc)
+        (holder_id, holder) = self.holder_pool.acquire(len(sign) + 8 + len(msg))
+        storage = None
+        try:
+            storage = self.storage_pool.acquire()
+            self.write_transaction_to_holder_account(holder_id, holder, sign, msg)
 
-        while (True):
-            print("Continue")
             trx = TransactionWithComputeBudget()
-            trx.add(self.sol_instr_20_continue(storage, 400))
-            result = send_transaction(client, trx, self.acc)
-
-            self.get_measurements(result)
-            result = result["result"]
-
-            if (result['meta']['innerInstructions'] and result['meta']['innerInstructions'][0]['instructions']):
-                data = b58decode(result['meta']['innerInstructions'][0]['instructions'][-1]['data'])
-                if (data[0] == 6):
-                    return result
+            trx.add(self.sol_instr_22_partial_call_from_account(holder, storage, 0))
+            send_transaction(client, trx, self.acc)
+
+            while (True):
+                print("Continue")
+                trx = TransactionWithComputeBudget()
+                trx.add(self.sol_instr_20_continue(storage, 400))
+                result = send_transaction(client, trx, self.acc)
+
+                self.get_measurements(result)
+                result = result["result"]
+
+                if (result['meta']['innerInstructions'] and result['meta']['innerInstructions'][0]['instructions']):
+                    data = b58decode(result['meta']['innerInstructions'][0]['instructions'][-1]['data'])
+                    if (data[0] == 6):
+                        return result
+        finally:
+            self.holder_pool.release(holder_id)
+            if storage is not None:
+                self.storage_pool.release(storage)
 
     def make_ecrecover(self, data):
         return abi.function_signature_to_4byte_selector('test_01_ecrecover(bytes32, uint8, bytes32, bytes32)')\
@@ -4,7 +4,7 @@ import solana
 from base58 import b58decode
 from enum import IntEnum
 from solana_utils import *
-from eth_tx_utils import make_keccak_instruction_data, make_instruction_data_from_tx
+from eth_tx_utils import make_instruction_data_from_tx
 
 CONTRACTS_DIR = os.environ.get("CONTRACTS_DIR", "evm_loader/tests")
 ETH_TOKEN_MINT_ID: PublicKey = PublicKey(os.environ.get("ETH_TOKEN_MINT"))
@@ -56,9 +56,12 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         print("contract id: ", cls.owner_contract, cls.eth_contract)
         print("code id: ", cls.contract_code)
 
-        collateral_pool_index = 2
-        cls.collateral_pool_address = create_collateral_pool_address(collateral_pool_index)
-        cls.collateral_pool_index_buf = collateral_pool_index.to_bytes(4, 'little')
+        cls.collateral_pool = collateral_pool_selector().acquire()
+        cls.collateral_pool_address = cls.collateral_pool.address
+        cls.collateral_pool_index_buf = cls.collateral_pool.index_buf
+
+        cls.storage_pool = StoragePool(client, cls.acc, size=2, prefix='transaction_storage')
+        cls.storage_pool.provision()
 
         wallet_2 = RandomAccount()
         cls.acc_2 = wallet_2.get_acc()
@@ -72,17 +75,14 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
         cls.caller_ether_2 = eth_keys.PrivateKey(cls.acc_2.secret_key()).public_key.to_canonical_address()
         (cls.caller_2, cls.caller_nonce_2) = cls.loader.ether2program(cls.caller_ether_2)
 
-    def create_storage_account(self, seed):
-        storage = PublicKey(
-            sha256(bytes(self.acc.public_key()) + bytes(seed, 'utf8') + bytes(PublicKey(evm_loader_id))).digest())
-        print("Storage", storage)
-
-        if getBalance(storage) == 0:
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.acc.public_key(), self.acc.public_key(), seed, 10 ** 9, 128 * 1024,
-                                          PublicKey(evm_loader_id)))
-            send_transaction(client, trx, self.acc)
+    @classmethod
+    def tearDownClass(cls):
+        collateral_pool_selector().release(cls.collateral_pool)
 
+    def create_storage_account(self):
+        storage = self.storage_pool.acquire()
+        self.addCleanup(self.storage_pool.release, storage)
+        print("Storage", storage)
         return storage
 
     def get_tx(self, nonce):
@@ -96,19 +96,13 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
             'chainId': 111
         }
 
-    def get_keccak_instruction_and_trx_data(self, data_start, secret_key, caller, caller_ether, trx_cnt=None):
+    def get_trx_data(self, secret_key, caller, caller_ether, trx_cnt=None):
         if trx_cnt is None:
             trx_cnt = getTransactionCount(client, caller)
         tx = self.get_tx(trx_cnt)
         (from_addr, sign, msg) = make_instruction_data_from_tx(tx, secret_key)
-        keccak_instruction_data = make_keccak_instruction_data(3, len(msg), data_start)
         trx_data = caller_ether + sign + msg
-
-        keccak_instruction = TransactionInstruction(program_id="KeccakSecp256k11111111111111111111111111111",
-                                                    data=keccak_instruction_data,
-                                                    keys=[AccountMeta(pubkey=caller, is_signer=False, is_writable=False)]
-                                                    )
-        return keccak_instruction, trx_data, sign
+        return trx_data, sign, len(msg)
 
     def get_account_metas_for_instr_05(self, caller):
         return [
@@ -221,18 +215,18 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
             self.assertEqual(collateral_pool_balance_change, NEON_PAYMENT_TO_TREASURE)
 
     def test_01_success_tx_send(self):
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(5, self.acc.secret_key(), self.caller, self.caller_ether)
-        trx = TransactionWithComputeBudget() \
-            .add(keccak_instruction) \
-            .add(self.neon_emv_instr_05(trx_data, self.caller))
+        (trx_data, sign, msg_len) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        trx = TransactionWithComputeBudget()
+        add_signed_instructions(trx, [(self.neon_emv_instr_05(trx_data, self.caller), msg_len, 5)],
+                                keccak_keys=[AccountMeta(pubkey=self.caller, is_signer=False, is_writable=False)])
 
         response = send_transaction(client, trx, self.acc)
         print('response:', response)
 
     def test_02_success_tx_send_iteratively_in_3_solana_transactions_sequentially(self):
         step_count = 100
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc.secret_key(), self.caller, self.caller_ether)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        storage = self.create_storage_account()
         neon_emv_instr_0d = self.neon_emv_instr_0D(step_count, trx_data, storage, self.caller)
 
         trx = TransactionWithComputeBudget() \
@@ -259,8 +253,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
     def test_03_failure_tx_send_iteratively_in_4_solana_transactions_sequentially(self):
         step_count = 100
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc.secret_key(), self.caller, self.caller_ether)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        storage = self.create_storage_account()
         neon_emv_instr_0d = self.neon_emv_instr_0D(step_count, trx_data, storage, self.caller)
 
         trx = TransactionWithComputeBudget() \
@@ -285,8 +279,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
     def test_04_success_tx_send_iteratively_by_2_instructions_in_one_transaction(self):
         step_count = 150
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc.secret_key(), self.caller, self.caller_ether)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        storage = self.create_storage_account()
         neon_emv_instr_0d = self.neon_emv_instr_0D(step_count, trx_data, storage, self.caller)
 
         trx = TransactionWithComputeBudget() \
@@ -309,8 +303,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
     def test_05_failure_tx_send_iteratively_by_4_instructions_in_one_transaction(self):
         step_count = 200
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc.secret_key(), self.caller, self.caller_ether)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        storage = self.create_storage_account()
         neon_emv_instr_0d = self.neon_emv_instr_0D(step_count, trx_data, storage, self.caller)
 
         trx = TransactionWithComputeBudget() \
@@ -330,8 +324,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
     def test_06_failure_tx_send_iteratively_transaction_too_large(self):
         step_count = 100
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc.secret_key(), self.caller, self.caller_ether)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc.secret_key(), self.caller, self.caller_ether)
+        storage = self.create_storage_account()
         neon_emv_instr_0d = self.neon_emv_instr_0D(step_count, trx_data, storage, self.caller)
 
         trx = TransactionWithComputeBudget() \
@@ -351,8 +345,8 @@ class EvmLoaderTestsNewAccount(unittest.TestCase):
 
     def test_07_combined_continue_gets_before_the_creation_of_accounts(self):
         evm_steps = 100
-        (keccak_instruction, trx_data, sign) = self.get_keccak_instruction_and_trx_data(13, self.acc_2.secret_key(), self.caller_2, self.caller_ether_2, 0)
-        storage = self.create_storage_account(sign[:8].hex())
+        (trx_data, sign, _) = self.get_trx_data(self.acc_2.secret_key(), self.caller_2, self.caller_ether_2, 0)
+        storage = self.create_storage_account()
         neon_emv_instr_0d_2 = self.neon_emv_instr_0D(evm_steps, trx_data, storage, self.caller_2)
         print('neon_emv_instr_0d_2: ', neon_emv_instr_0d_2)
 
@@ -5,7 +5,6 @@
 # 3. Checks no one other can write to a holder account.
 
 import unittest
-from sha3 import keccak_256
 from solana.publickey import PublicKey
 from solana.account import Account as solana_Account
 from solana.rpc.api import SendTransactionError
@@ -16,9 +15,7 @@ test_data = b'Chancellor on brink of second bailout for banks'
 evm_loader_id = os.environ.get('EVM_LOADER')
 solana_url = os.environ.get('SOLANA_URL', 'http://localhost:8899')
 path_to_solana = 'solana'
-client = Client(solana_url)
-
-holder_id = 0;
+client = get_client(solana_url)
 
 def write_holder_layout(nonce, offset, data):
     return (bytes.fromhex('12') +
@@ -63,19 +60,13 @@ class Test_Write(unittest.TestCase):
         print('Initializing attacker...')
         values = bytes([1] * 32)
         self.attacker = solana_Account(values)
-        solana_cli().call('transfer' + ' --allow-unfunded-recipient ' + str(self.attacker.public_key()) + ' 1')
+        solana_cli().call('transfer' + ' --allow-unfunded-recipient ' + str(self.attacker.public_key()) + ' 1', writes=())
         print('Attacker:', self.attacker.public_key())
         print('Balance of attacker:', getBalance(self.attacker.public_key()))
 
     def create_account(self):
-        holder_id_bytes = holder_id.to_bytes((holder_id.bit_length() + 7) // 8, 'big')
-        seed = keccak_256(b'holder' + holder_id_bytes).hexdigest()[:32]
-        self.account_address = accountWithSeed(self.signer.public_key(), seed, PublicKey(evm_loader_id))
-        if getBalance(self.account_address) == 0:
-            print('Creating account...')
-            trx = TransactionWithComputeBudget()
-            trx.add(createAccountWithSeed(self.signer.public_key(), self.signer.public_key(), seed, 10**9, 128*1024, PublicKey(evm_loader_id)))
-            client.send_transaction(trx, self.signer, opts=TxOpts(skip_confirmation=False, preflight_commitment='confirmed'))
+        self.holder_pool = HolderPool(client, self.signer, size=1, loader_id=evm_loader_id)
+        (self.holder_id, self.account_address) = self.holder_pool.acquire(len(test_data))
         print('Account to write:', self.account_address)
         print('Balance of account:', getBalance(self.account_address))
 
@@ -91,7 +82,7 @@ class Test_Write(unittest.TestCase):
 
     def test_instruction_write_is_ok(self):
         print()
-        id = self.write_to_account(self.signer, self.signer, holder_id, test_data)
+        id = self.write_to_account(self.signer, self.signer, self.holder_id, test_data)
         print('id:', id)
         self.assertGreater(id, 0)
 
@@ -99,7 +90,7 @@ class Test_Write(unittest.TestCase):
         print()
         try:
             print('!!!! Expecting error "invalid program argument"')
-            wrong_holder_id = 1000
+            wrong_holder_id = self.holder_id + 1
             self.write_to_account(self.signer, self.signer, wrong_holder_id, test_data)
             self.assertTrue(False)
         except SendTransactionError as err:
@@ -114,7 +105,7 @@ class Test_Write(unittest.TestCase):
         print()
         try:
             print('!!!! Expecting error "expected authorized operator"')
-            self.write_to_account(self.attacker, self.attacker, holder_id, test_data)
+            self.write_to_account(self.attacker, self.attacker, self.holder_id, test_data)
             self.assertTrue(False)
         except SendTransactionError as err:
             self.assertEqual(str(err), 'Transaction simulation failed: Error processing Instruction 2: custom program error: 0x3')
@@ -126,7 +117,7 @@ class Test_Write(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
-        pass
+        cls.holder_pool.close()
 
 if __name__ == '__main__':
     unittest.main()